@@ -0,0 +1,35 @@
+"""keyset pagination indexes
+
+List endpoints page on (created_at, id) within one owner, so each page is a
+range scan on one of these indexes instead of a sort of the owner's rows.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 05:31:12.417305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_ai_interactions_project_id_created_at_id', 'ai_interactions', ['project_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_ai_interactions_user_id_created_at_id', 'ai_interactions', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_projects_user_id_created_at_id', 'projects', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_projects_user_id_created_at_id', table_name='projects')
+    op.drop_index('ix_ai_interactions_user_id_created_at_id', table_name='ai_interactions')
+    op.drop_index('ix_ai_interactions_project_id_created_at_id', table_name='ai_interactions')
@@ -0,0 +1,68 @@
+"""interaction full-text search
+
+SQLite gets an external content FTS5 table over ai_interactions, kept in sync
+by triggers and rebuilt from the existing rows. PostgreSQL gets a generated
+tsvector column with a GIN index, which fills itself for existing rows.
+
+Batch migrations recreate a table on SQLite, which drops its triggers: a later
+migration that alters ai_interactions in batch mode has to create them again.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:12:40.581932
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE ai_interactions_fts USING fts5("
+            "prompt, response, content='ai_interactions', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER ai_interactions_fts_insert AFTER INSERT ON ai_interactions BEGIN "
+            "INSERT INTO ai_interactions_fts(rowid, prompt, response) VALUES (new.id, new.prompt, new.response); END"
+        )
+        op.execute(
+            "CREATE TRIGGER ai_interactions_fts_delete AFTER DELETE ON ai_interactions BEGIN "
+            "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response); END"
+        )
+        op.execute(
+            "CREATE TRIGGER ai_interactions_fts_update AFTER UPDATE OF prompt, response ON ai_interactions BEGIN "
+            "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response); "
+            "INSERT INTO ai_interactions_fts(rowid, prompt, response) VALUES (new.id, new.prompt, new.response); END"
+        )
+        op.execute("INSERT INTO ai_interactions_fts(ai_interactions_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE ai_interactions ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', prompt || ' ' || response)) STORED"
+        )
+        op.create_index('ix_ai_interactions_search_vector', 'ai_interactions', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_insert")
+        op.execute("DROP TABLE IF EXISTS ai_interactions_fts")
+    elif dialect == 'postgresql':
+        op.drop_index('ix_ai_interactions_search_vector', table_name='ai_interactions', postgresql_using='gin')
+        op.drop_column('ai_interactions', 'search_vector')
@@ -0,0 +1,234 @@
+"""compressed, deduplicated interaction bodies
+
+Prompts and responses move out of ai_interactions into interaction_blobs,
+keyed by the sha256 of the text, so a body repeated by many interactions is
+stored once. On SQLite the blobs are zstd compressed by the app; PostgreSQL
+keeps them as text for full-text search and compresses them itself (TOAST).
+Existing rows are converted in batches of BATCH_SIZE.
+
+The search objects of 0004 read the old columns and are replaced: on SQLite
+the FTS5 index reads the bodies through a view that decompresses them with
+interaction_body(), a function the app registers on every connection; on
+PostgreSQL a trigger sets search_vector from the blobs.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:03:11.402615
+
+"""
+import hashlib
+import zstandard
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# The body encoding of app.models.interaction_blob, as of this revision
+MIN_COMPRESSED_SIZE = 64
+
+
+def compress_body(text: str) -> bytes:
+    data = text.encode()
+    if len(data) >= MIN_COMPRESSED_SIZE:
+        compressed = zstandard.compress(data, 3)
+        if len(compressed) < len(data):
+            return b's' + compressed
+    return b'r' + data
+
+
+def decompress_body(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    return (zstandard.decompress(value[1:]) if value[:1] == b's' else value[1:]).decode()
+
+
+SQLITE_SEARCH_DDL = (
+    "CREATE VIEW ai_interaction_bodies AS "
+    "SELECT i.id, interaction_body(p.body) AS prompt, interaction_body(r.body) AS response FROM ai_interactions i "
+    "JOIN interaction_blobs p ON p.hash = i.prompt_hash JOIN interaction_blobs r ON r.hash = i.response_hash",
+    "CREATE VIRTUAL TABLE ai_interactions_fts USING fts5("
+    "prompt, response, content='ai_interaction_bodies', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER ai_interactions_fts_insert AFTER INSERT ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) SELECT id, prompt, response FROM ai_interaction_bodies WHERE id = new.id; END",
+    "CREATE TRIGGER ai_interactions_fts_delete AFTER DELETE ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.prompt_hash), "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.response_hash)); END",
+    "CREATE TRIGGER ai_interactions_fts_update AFTER UPDATE OF prompt_hash, response_hash ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.prompt_hash), "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.response_hash)); "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) SELECT id, prompt, response FROM ai_interaction_bodies WHERE id = new.id; END",
+)
+POSTGRESQL_SEARCH_DDL = (
+    "ALTER TABLE ai_interactions ADD COLUMN search_vector tsvector",
+    "CREATE FUNCTION ai_interactions_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+    "NEW.search_vector := to_tsvector('english', "
+    "(SELECT body FROM interaction_blobs WHERE hash = NEW.prompt_hash) || ' ' || (SELECT body FROM interaction_blobs WHERE hash = NEW.response_hash)); "
+    "RETURN NEW; END $$",
+    "CREATE TRIGGER ai_interactions_search_vector BEFORE INSERT OR UPDATE OF prompt_hash, response_hash ON ai_interactions "
+    "FOR EACH ROW EXECUTE FUNCTION ai_interactions_search_vector()",
+)
+
+# The search objects of 0004, restored by the downgrade
+SQLITE_0004_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE ai_interactions_fts USING fts5("
+    "prompt, response, content='ai_interactions', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER ai_interactions_fts_insert AFTER INSERT ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) VALUES (new.id, new.prompt, new.response); END",
+    "CREATE TRIGGER ai_interactions_fts_delete AFTER DELETE ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response); END",
+    "CREATE TRIGGER ai_interactions_fts_update AFTER UPDATE OF prompt, response ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response); "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) VALUES (new.id, new.prompt, new.response); END",
+)
+
+
+def drop_sqlite_search() -> None:
+    op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS ai_interactions_fts_insert")
+    op.execute("DROP TABLE IF EXISTS ai_interactions_fts")
+
+
+def convert_rows(bind, dialect: str) -> None:
+    blobs = sa.table('interaction_blobs', sa.column('hash'), sa.column('size'), sa.column('body'))
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    insert_blobs = insert(blobs).on_conflict_do_nothing(index_elements=['hash'])
+    set_hashes = sa.text("UPDATE ai_interactions SET prompt_hash = :prompt_hash, response_hash = :response_hash WHERE id = :id")
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text("SELECT id, prompt, response FROM ai_interactions WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        blob_rows, hashes = {}, []
+        for id, prompt, response in rows:
+            prompt_hash, response_hash = hashlib.sha256(prompt.encode()).digest(), hashlib.sha256(response.encode()).digest()
+            for digest, text in ((prompt_hash, prompt), (response_hash, response)):
+                if digest not in blob_rows:
+                    body = text if dialect == 'postgresql' else compress_body(text)
+                    blob_rows[digest] = {'hash': digest, 'size': len(text.encode()), 'body': body}
+            hashes.append({'id': id, 'prompt_hash': prompt_hash, 'response_hash': response_hash})
+        bind.execute(insert_blobs, list(blob_rows.values()))
+        bind.execute(set_hashes, hashes)
+        last_id = rows[-1].id
+
+
+def restore_rows(bind, dialect: str) -> None:
+    set_bodies = sa.text("UPDATE ai_interactions SET prompt = :prompt, response = :response WHERE id = :id")
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT i.id, p.body AS prompt, r.body AS response FROM ai_interactions i "
+                "JOIN interaction_blobs p ON p.hash = i.prompt_hash JOIN interaction_blobs r ON r.hash = i.response_hash "
+                "WHERE i.id > :last_id ORDER BY i.id LIMIT :limit"
+            ),
+            {'last_id': last_id, 'limit': BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        if dialect == 'postgresql':
+            bodies = [{'id': id, 'prompt': prompt, 'response': response} for id, prompt, response in rows]
+        else:
+            bodies = [{'id': id, 'prompt': decompress_body(prompt), 'response': decompress_body(response)} for id, prompt, response in rows]
+        bind.execute(set_bodies, bodies)
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'sqlite':
+        drop_sqlite_search()
+        # The app registers it on its own connections, the view needs it for the rebuild below
+        bind.connection.driver_connection.create_function('interaction_body', 1, decompress_body, deterministic=True)
+    elif dialect == 'postgresql':
+        # Generated from the columns about to be dropped
+        op.drop_index('ix_ai_interactions_search_vector', table_name='ai_interactions', postgresql_using='gin')
+        op.drop_column('ai_interactions', 'search_vector')
+
+    op.create_table(
+        'interaction_blobs',
+        sa.Column('hash', sa.LargeBinary(length=32), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('body', sa.Text() if dialect == 'postgresql' else sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('hash'),
+    )
+    op.add_column('ai_interactions', sa.Column('prompt_hash', sa.LargeBinary(length=32), nullable=True))
+    op.add_column('ai_interactions', sa.Column('response_hash', sa.LargeBinary(length=32), nullable=True))
+    convert_rows(bind, dialect)
+    with op.batch_alter_table('ai_interactions') as batch_op:
+        batch_op.alter_column('prompt_hash', existing_type=sa.LargeBinary(length=32), nullable=False)
+        batch_op.alter_column('response_hash', existing_type=sa.LargeBinary(length=32), nullable=False)
+        batch_op.create_foreign_key('fk_ai_interactions_prompt_hash_interaction_blobs', 'interaction_blobs', ['prompt_hash'], ['hash'])
+        batch_op.create_foreign_key('fk_ai_interactions_response_hash_interaction_blobs', 'interaction_blobs', ['response_hash'], ['hash'])
+        batch_op.drop_column('prompt')
+        batch_op.drop_column('response')
+
+    if dialect == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO ai_interactions_fts(ai_interactions_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        for statement in POSTGRESQL_SEARCH_DDL:
+            op.execute(statement)
+        op.execute(
+            "UPDATE ai_interactions i SET search_vector = to_tsvector('english', p.body || ' ' || r.body) "
+            "FROM interaction_blobs p, interaction_blobs r WHERE p.hash = i.prompt_hash AND r.hash = i.response_hash"
+        )
+        op.create_index('ix_ai_interactions_search_vector', 'ai_interactions', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'sqlite':
+        drop_sqlite_search()
+        op.execute("DROP VIEW IF EXISTS ai_interaction_bodies")
+    elif dialect == 'postgresql':
+        op.drop_index('ix_ai_interactions_search_vector', table_name='ai_interactions', postgresql_using='gin')
+        op.execute("DROP TRIGGER IF EXISTS ai_interactions_search_vector ON ai_interactions")
+        op.execute("DROP FUNCTION IF EXISTS ai_interactions_search_vector()")
+        op.drop_column('ai_interactions', 'search_vector')
+
+    op.add_column('ai_interactions', sa.Column('prompt', sa.String(), nullable=True))
+    op.add_column('ai_interactions', sa.Column('response', sa.String(), nullable=True))
+    restore_rows(bind, dialect)
+    with op.batch_alter_table('ai_interactions') as batch_op:
+        batch_op.alter_column('prompt', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('response', existing_type=sa.String(), nullable=False)
+        batch_op.drop_constraint('fk_ai_interactions_response_hash_interaction_blobs', type_='foreignkey')
+        batch_op.drop_constraint('fk_ai_interactions_prompt_hash_interaction_blobs', type_='foreignkey')
+        batch_op.drop_column('response_hash')
+        batch_op.drop_column('prompt_hash')
+    op.drop_table('interaction_blobs')
+
+    if dialect == 'sqlite':
+        for statement in SQLITE_0004_SEARCH_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO ai_interactions_fts(ai_interactions_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE ai_interactions ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', prompt || ' ' || response)) STORED"
+        )
+        op.create_index('ix_ai_interactions_search_vector', 'ai_interactions', ['search_vector'], unique=False, postgresql_using='gin')
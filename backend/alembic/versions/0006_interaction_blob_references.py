@@ -0,0 +1,35 @@
+"""interaction blob reference indexes
+
+Blobs no interaction refers to any more are deleted when an interaction is
+deleted or its body replaced. These indexes make the check for other
+references a lookup, and let PostgreSQL check the foreign keys of a deleted
+blob without scanning ai_interactions.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 21:12:40.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_ai_interactions_prompt_hash', 'ai_interactions', ['prompt_hash'], unique=False)
+    op.create_index('ix_ai_interactions_response_hash', 'ai_interactions', ['response_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ai_interactions_response_hash', table_name='ai_interactions')
+    op.drop_index('ix_ai_interactions_prompt_hash', table_name='ai_interactions')
@@ -0,0 +1,61 @@
+import datetime
+import hashlib
+from dataclasses import dataclass
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+
+@dataclass(frozen=True)
+class Validators:
+    """ETag and Last-Modified of a list response, derived from a version of its rows.
+
+    The version is whatever cheap aggregate changes with the rows (counts,
+    the newest id and timestamp), so a revalidation costs one query and
+    neither loads nor serializes the rows. The ETag is weak because the same
+    rows are sent compressed or not.
+
+    Deleting a row leaves the newest timestamp alone: clients that only send
+    If-Modified-Since see the deletion with the next change. Browsers send
+    If-None-Match too, which takes precedence. HTTP dates have whole seconds,
+    so rows changed in the current second get no Last-Modified: another
+    change in the same second would carry the same date.
+    """
+
+    etag: str
+    last_modified: datetime.datetime | None = None
+
+    @classmethod
+    def of(cls, *version, last_modified: datetime.datetime | None = None, now: datetime.datetime | None = None) -> "Validators":
+        digest = hashlib.sha256(repr(version).encode()).hexdigest()[:32]
+        # Stored timestamps are naive UTC
+        if last_modified is not None:
+            last_modified = last_modified.replace(microsecond=0, tzinfo=datetime.timezone.utc)
+            now = now or datetime.datetime.now(datetime.timezone.utc)
+            if last_modified >= now.replace(microsecond=0):
+                last_modified = None
+        return cls(f'W/"{digest}"', last_modified)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        # Per-user data: browsers may keep it but have to revalidate every time
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def _matches(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            return self.last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    def not_modified(self, request: Request) -> Response | None:
+        """A 304 response when the request's validators still match, otherwise None."""
+        return Response(status_code=304, headers=self.headers) if self._matches(request) else None
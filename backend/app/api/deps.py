@@ -0,0 +1,84 @@
+import inspect
+from contextlib import asynccontextmanager
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from app.core.config import settings
+from app.db.database import get_db, get_async_db, SessionLocal, AsyncSessionLocal
+from app.models.user import User
+from app.services.ai_service import AIService
+from app.services.auth_service import AuthService, AsyncAuthService, oauth2_scheme
+from app.services.user_service import UserService, AsyncUserService
+from app.services.project_service import ProjectService, AsyncProjectService
+from app.services.ai_interaction_service import AIInteractionService, AsyncAIInteractionService
+from app.services.conversation_service import ConversationService, AsyncConversationService
+from app.services.profiler import profiled_thread
+
+
+class ThreadpoolService:
+    """Exposes a sync service with the awaitable interface of its async counterpart.
+
+    Every method call is run in the Starlette threadpool, which is what the
+    endpoints did when they were plain ``def`` functions. Used when
+    ``settings.USE_ASYNC_DB`` is disabled. Generator methods become async
+    iterators, each step of which runs in the threadpool.
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+        if not callable(attr):
+            return attr
+        if inspect.isgeneratorfunction(attr):
+            def iterate(*args, **kwargs):
+                return iterate_in_threadpool(attr(*args, **kwargs))
+
+            return iterate
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(profiled_thread(attr), *args, **kwargs)
+
+        return call
+
+
+def service_provider(async_service, sync_service):
+    if settings.USE_ASYNC_DB:
+        def provide(db: AsyncSession = Depends(get_async_db)):
+            return async_service(db)
+    else:
+        def provide(db: Session = Depends(get_db)):
+            return ThreadpoolService(sync_service(db))
+    return provide
+
+
+@asynccontextmanager
+async def open_service(async_service, sync_service):
+    # For work that outlives the request, e.g. a streaming response body, which
+    # runs after the request scoped sessions have been closed
+    if settings.USE_ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield async_service(db)
+    else:
+        db = SessionLocal()
+        try:
+            yield ThreadpoolService(sync_service(db))
+        finally:
+            db.close()
+
+
+get_user_service = service_provider(AsyncUserService, UserService)
+get_project_service = service_provider(AsyncProjectService, ProjectService)
+get_ai_interaction_service = service_provider(AsyncAIInteractionService, AIInteractionService)
+get_auth_service = service_provider(AsyncAuthService, AuthService)
+get_conversation_service = service_provider(AsyncConversationService, ConversationService)
+
+
+async def get_authenticated_user(token: str = Depends(oauth2_scheme), auth_service=Depends(get_auth_service)) -> User:
+    return await auth_service.get_current_user(token)
+
+
+def get_ai_service(current_user: User = Depends(get_authenticated_user)) -> AIService:
+    return AIService(current_user)
@@ -1,7 +1,14 @@
+import json
+from typing import AsyncIterator
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.services.ai_service import AIService
-from app.services.auth_service import AuthService
+from fastapi.responses import StreamingResponse
+from app.services.ai_service import AIService, PendingTurn
+from app.services.conversation_service import ConversationService, AsyncConversationService
+from app.services.interaction_writer import interaction_writer
+from app.services.upstream_limiter import UpstreamBusy
+from app.api.deps import get_ai_service, get_authenticated_user, get_conversation_service, get_project_service, open_service
 from app.models.user import User
+from app.schemas.ai_interaction import AIInteractionCreate
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -9,11 +16,74 @@ router = APIRouter()
 class APIKeyUpdate(BaseModel):
     api_key: str
 
+class CodeGenerationRequest(BaseModel):
+    project_id: int
+    prompt: str
+    # Skip the completion cache and ask the model for a new answer
+    fresh: bool = False
+
+class RequirementsTurn(BaseModel):
+    project_id: int
+    message: str
+
+class RequirementsTurnResponse(BaseModel):
+    response: str
+
+class RequirementsStreamRequest(RequirementsTurn):
+    fresh: bool = False
+
+def _sse(data: dict, event: str | None = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+async def _save_turn(turn: PendingTurn, reply: str) -> None:
+    # The request's session is closed by the time the stream is done
+    async with open_service(AsyncConversationService, ConversationService) as conversation_service:
+        await turn.save(conversation_service, reply)
+
+async def _stream_interaction(tokens: AsyncIterator[str], user_id: int, project_id: int, prompt: str, turn: PendingTurn | None = None) -> AsyncIterator[str]:
+    # Forward every token as its own event and save the full text once the upstream stream is done
+    chunks = []
+    try:
+        async for token in tokens:
+            chunks.append(token)
+            yield _sse({"token": token})
+    except UpstreamBusy as e:
+        # Refused before reaching OpenAI, the client may retry after the given seconds
+        yield _sse({"detail": e.detail, "retry_after": int(e.headers["Retry-After"])}, event="error")
+        return
+    except Exception as e:
+        print(f"Error streaming completion: {str(e)}")
+        yield _sse({"detail": "An error occurred while generating the response."}, event="error")
+        return
+
+    response = "".join(chunks).strip()
+    if turn is not None:
+        try:
+            await _save_turn(turn, response)
+        except Exception as e:
+            print(f"Error saving conversation turn: {str(e)}")
+            yield _sse({"detail": "An error occurred while saving the conversation."}, event="error")
+            return
+    # Saved in a batch with the other streams finishing about now; the id is
+    # None if the database is too slow, the interaction is still saved later
+    try:
+        interaction_id = await interaction_writer.save(user_id, project_id, AIInteractionCreate(prompt=prompt, response=response))
+    except Exception as e:
+        print(f"Error saving AI interaction: {str(e)}")
+        yield _sse({"detail": "An error occurred while saving the interaction."}, event="error")
+        return
+    yield _sse({"interaction_id": interaction_id}, event="done")
+
+def _event_stream(body: AsyncIterator[str]) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx style proxies from holding back the events
+    return StreamingResponse(body, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.post("/set-api-key")
 async def set_api_key(
     api_key_update: APIKeyUpdate,
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_service: AIService = Depends()
+    current_user: User = Depends(get_authenticated_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     success = await ai_service.set_api_key(api_key_update.api_key)
     if success:
@@ -22,12 +92,49 @@ async def set_api_key(
 
 @router.post("/remove-api-key")
 async def remove_api_key(
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_service: AIService = Depends()
+    current_user: User = Depends(get_authenticated_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     success = await ai_service.remove_api_key()
     if success:
         return {"message": "API key removed successfully"}
     raise HTTPException(status_code=400, detail="Failed to remove API key")
 
+@router.post("/generate-code/stream")
+async def stream_generate_code(
+    request: CodeGenerationRequest,
+    current_user: User = Depends(get_authenticated_user),
+    ai_service: AIService = Depends(get_ai_service),
+    project_service=Depends(get_project_service)
+):
+    await project_service.check_project_owner(current_user.id, request.project_id)
+    tokens = await ai_service.stream_code(request.prompt, fresh=request.fresh, project_id=request.project_id)
+    return _event_stream(_stream_interaction(tokens, current_user.id, request.project_id, request.prompt))
+
+@router.post("/refine-requirements", response_model=RequirementsTurnResponse)
+async def refine_requirements(
+    turn: RequirementsTurn,
+    current_user: User = Depends(get_authenticated_user),
+    ai_service: AIService = Depends(get_ai_service),
+    project_service=Depends(get_project_service),
+    conversation_service=Depends(get_conversation_service)
+):
+    await project_service.check_project_owner(current_user.id, turn.project_id)
+    response = await ai_service.continue_requirements(conversation_service, turn.project_id, turn.message)
+    return {"response": response}
+
+@router.post("/refine-requirements/stream")
+async def stream_refine_requirements(
+    request: RequirementsStreamRequest,
+    current_user: User = Depends(get_authenticated_user),
+    ai_service: AIService = Depends(get_ai_service),
+    project_service=Depends(get_project_service),
+    conversation_service=Depends(get_conversation_service)
+):
+    # Like /refine-requirements, the context is the stored conversation
+    await project_service.check_project_owner(current_user.id, request.project_id)
+    turn = await ai_service.requirements_turn(conversation_service, request.project_id, request.message)
+    tokens = await ai_service.stream_requirements(turn, fresh=request.fresh)
+    return _event_stream(_stream_interaction(tokens, current_user.id, request.project_id, request.message, turn))
+
 # ... (other AI-related endpoints)
\ No newline at end of file
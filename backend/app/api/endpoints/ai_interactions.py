@@ -1,45 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.services.ai_interaction_service import AIInteractionService
-from app.services.auth_service import AuthService
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.api.deps import get_authenticated_user, get_ai_interaction_service, get_project_service
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_response
 from app.schemas.ai_interaction import AIInteractionCreate, AIInteraction
 from app.models.user import User
 
 router = APIRouter()
 
 @router.post("/", response_model=AIInteraction)
-def create_ai_interaction(
+async def create_ai_interaction(
     interaction: AIInteractionCreate,
     project_id: int,
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_interaction_service: AIInteractionService = Depends()
+    current_user: User = Depends(get_authenticated_user),
+    ai_interaction_service=Depends(get_ai_interaction_service),
+    project_service=Depends(get_project_service)
 ):
-    return ai_interaction_service.create_ai_interaction(current_user.id, project_id, interaction)
+    await project_service.check_project_owner(current_user.id, project_id, "add interactions to")
+    return await ai_interaction_service.create_ai_interaction(current_user.id, project_id, interaction)
 
 @router.get("/{interaction_id}", response_model=AIInteraction)
-def read_ai_interaction(
+async def read_ai_interaction(
     interaction_id: int,
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_interaction_service: AIInteractionService = Depends()
+    current_user: User = Depends(get_authenticated_user),
+    ai_interaction_service=Depends(get_ai_interaction_service)
 ):
-    interaction = ai_interaction_service.get_ai_interaction(interaction_id)
+    interaction = await ai_interaction_service.get_ai_interaction(interaction_id)
     if interaction.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this AI Interaction")
     return interaction
 
 @router.get("/project/{project_id}", response_model=list[AIInteraction])
-def read_project_interactions(
+async def read_project_interactions(
     project_id: int,
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_interaction_service: AIInteractionService = Depends()
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: User = Depends(get_authenticated_user),
+    ai_interaction_service=Depends(get_ai_interaction_service),
+    project_service=Depends(get_project_service)
 ):
-    interactions = ai_interaction_service.get_project_interactions(project_id)
-    if not interactions or interactions[0].user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access these AI Interactions")
-    return interactions
+    # Checked on the project, not the page: a page past the last row is empty, not forbidden
+    await project_service.check_project_owner(current_user.id, project_id, "view interactions for")
+    return page_response(await ai_interaction_service.get_project_interaction_rows(project_id, limit, cursor), limit)
 
 @router.get("/user/me", response_model=list[AIInteraction])
-def read_user_interactions(
-    current_user: User = Depends(AuthService.get_current_user),
-    ai_interaction_service: AIInteractionService = Depends()
+async def read_user_interactions(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: User = Depends(get_authenticated_user),
+    ai_interaction_service=Depends(get_ai_interaction_service)
 ):
-    return ai_interaction_service.get_user_interactions(current_user.id)
\ No newline at end of file
+    return page_response(await ai_interaction_service.get_user_interaction_rows(current_user.id, limit, cursor), limit)
\ No newline at end of file
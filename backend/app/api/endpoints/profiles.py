@@ -0,0 +1,53 @@
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from app.core.config import settings
+from app.services.profiler import profiler
+
+router = APIRouter()
+
+
+def require_profiling_token(x_profiling_token: str = Header(...)):
+    token = settings.PROFILING_TOKEN
+    if token is None or not hmac.compare_digest(x_profiling_token.encode(), token.get_secret_value().encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profiling token")
+
+
+class ProfilingArm(BaseModel):
+    requests: int = Field(ge=0, le=1000)
+    path_prefix: str | None = None
+
+
+@router.get("/", dependencies=[Depends(require_profiling_token)])
+async def list_profiles():
+    return [profile.summary() for profile in reversed(profiler.reports.values())]
+
+
+@router.post("/arm", dependencies=[Depends(require_profiling_token)])
+async def arm_profiler(arm: ProfilingArm):
+    # Profiles the next requests without them having to send the token
+    profiler.arm(arm.requests, arm.path_prefix)
+    return {"armed_requests": profiler.armed_requests, "path_prefix": profiler.armed_path_prefix}
+
+
+def _get_profile(profile_id: str):
+    profile = profiler.reports.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def read_profile(profile_id: str, top: int = 20):
+    profile = _get_profile(profile_id)
+    return {
+        **profile.summary(),
+        "top_stacks": [{"stack": stack, "samples": count} for stack, count in profile.stacks.most_common(top)],
+    }
+
+
+@router.get("/{profile_id}/collapsed", response_class=PlainTextResponse, dependencies=[Depends(require_profiling_token)])
+async def read_profile_collapsed(profile_id: str):
+    # Feed to flamegraph.pl or load into speedscope
+    return PlainTextResponse(_get_profile(profile_id).collapsed())
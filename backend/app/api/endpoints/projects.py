@@ -1,55 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.services.project_service import ProjectService
-from app.services.auth_service import AuthService
+from fastapi import APIRouter, Depends, Query, Request, Response
+from app.api.conditional import Validators
+from app.api.deps import get_ai_interaction_service, get_authenticated_user, get_project_service
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_score_cursor, page_response, set_next_cursor
 from app.schemas.project import ProjectCreate, ProjectUpdate, Project
-from app.schemas.ai_interaction import AIInteractionCreate, AIInteraction
+from app.schemas.ai_interaction import AIInteractionCreate, AIInteractionBatchCreate, AIInteraction, AIInteractionSearchResult
 from app.models.user import User
 from app.api.auth import get_current_user
 
 router = APIRouter()
 
 @router.post("/", response_model=Project)
-def create_project(project: ProjectCreate, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    return project_service.create_project(current_user.id, project)
+async def create_project(project: ProjectCreate, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    return await project_service.create_project(current_user.id, project)
 
 @router.get("/", response_model=list[Project])
-def read_user_projects(current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    return project_service.get_user_projects(current_user.id)
+async def read_user_projects(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: User = Depends(get_authenticated_user),
+    project_service=Depends(get_project_service)
+):
+    # A poll that finds nothing new is answered from one aggregate query, no rows loaded
+    version = await project_service.get_user_projects_version(current_user.id)
+    validators = Validators.of(*version, limit, cursor, last_modified=version[-1])
+    # Row dicts straight to orjson; response_model still documents the shape
+    return validators.not_modified(request) or page_response(await project_service.get_user_project_rows(current_user.id, limit, cursor), limit, validators.headers)
 
 @router.get("/{project_id}", response_model=Project)
-def read_project(project_id: int, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    project = project_service.get_project(project_id)
-    if project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this project")
-    return project
+async def read_project(project_id: int, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    return await project_service.get_user_project(current_user.id, project_id)
 
 @router.put("/{project_id}", response_model=Project)
-def update_project(project_id: int, project: ProjectUpdate, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    db_project = project_service.get_project(project_id)
-    if db_project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to modify this project")
-    return project_service.update_project(project_id, project)
+async def update_project(project_id: int, project: ProjectUpdate, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    return await project_service.update_user_project(current_user.id, project_id, project)
 
 @router.delete("/{project_id}")
-def delete_project(project_id: int, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    db_project = project_service.get_project(project_id)
-    if db_project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this project")
-    return project_service.delete_project(project_id)
+async def delete_project(project_id: int, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    return await project_service.delete_user_project(current_user.id, project_id)
 
 @router.post("/{project_id}/interactions", response_model=AIInteraction)
-def create_ai_interaction(project_id: int, interaction: AIInteractionCreate, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    db_project = project_service.get_project(project_id)
-    if db_project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to add interactions to this project")
-    return project_service.create_ai_interaction(current_user.id, project_id, interaction)
+async def create_ai_interaction(project_id: int, interaction: AIInteractionCreate, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    await project_service.check_project_owner(current_user.id, project_id, "add interactions to")
+    return await project_service.create_ai_interaction(current_user.id, project_id, interaction)
+
+@router.post("/{project_id}/interactions:batch", response_model=list[AIInteraction])
+async def create_ai_interactions(project_id: int, batch: AIInteractionBatchCreate, current_user: User = Depends(get_authenticated_user), project_service=Depends(get_project_service)):
+    await project_service.check_project_owner(current_user.id, project_id, "add interactions to")
+    return await project_service.create_ai_interactions(current_user.id, project_id, batch.interactions)
 
 @router.get("/{project_id}/interactions", response_model=list[AIInteraction])
-def read_project_interactions(project_id: int, current_user: User = Depends(AuthService.get_current_user), project_service: ProjectService = Depends()):
-    db_project = project_service.get_project(project_id)
-    if db_project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to view interactions for this project")
-    return project_service.get_project_interactions(project_id)
+async def read_project_interactions(
+    project_id: int,
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: User = Depends(get_authenticated_user),
+    project_service=Depends(get_project_service)
+):
+    # Also checks that the user owns the project
+    version = await project_service.get_project_interactions_version(current_user.id, project_id)
+    validators = Validators.of(*version, limit, cursor, last_modified=version[-1])
+    return validators.not_modified(request) or page_response(await project_service.get_project_interaction_rows(project_id, limit, cursor), limit, validators.headers)
+
+@router.get("/{project_id}/interactions/search", response_model=list[AIInteractionSearchResult])
+async def search_project_interactions(
+    project_id: int,
+    response: Response,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: User = Depends(get_authenticated_user),
+    project_service=Depends(get_project_service),
+    ai_interaction_service=Depends(get_ai_interaction_service)
+):
+    await project_service.check_project_owner(current_user.id, project_id, "view interactions for")
+    results = await ai_interaction_service.search_interactions(current_user.id, q, project_id, limit, cursor)
+    return set_next_cursor(response, results, limit, lambda result: encode_score_cursor(result.score, result.id))
 
 @router.get("/", response_model=list[Project])
 def get_projects(current_user: dict = Depends(get_current_user)):
@@ -1,38 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.services.user_service import UserService
-from app.services.auth_service import AuthService
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from app.api.deps import get_ai_interaction_service, get_authenticated_user, get_user_service
+from app.api.export import ExportFormat, export_response
+from app.core.compression import negotiate_encoding
+from app.core.config import settings
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_score_cursor, set_next_cursor
+from app.schemas.ai_interaction import AIInteractionSearchResult
 from app.schemas.user import UserCreate, UserUpdate, UserProfileCreate, UserProfileUpdate, User, UserProfile, UserWithProfile
 from app.models.user import User as UserModel
 
 router = APIRouter()
 
 @router.post("/", response_model=User)
-def create_user(user: UserCreate, user_service: UserService = Depends()):
-    db_user = user_service.get_user_by_email(user.email)
+async def create_user(user: UserCreate, user_service=Depends(get_user_service)):
+    db_user = await user_service.get_user_by_email(user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return user_service.create_user(user)
+    return await user_service.create_user(user)
 
 @router.get("/me", response_model=UserWithProfile)
-def read_users_me(current_user: UserModel = Depends(AuthService.get_current_user)):
+async def read_users_me(current_user: UserModel = Depends(get_authenticated_user)):
     return current_user
 
 @router.put("/me", response_model=User)
-def update_user_me(user: UserUpdate, current_user: UserModel = Depends(AuthService.get_current_user), user_service: UserService = Depends()):
-    return user_service.update_user(current_user.id, user)
+async def update_user_me(user: UserUpdate, current_user: UserModel = Depends(get_authenticated_user), user_service=Depends(get_user_service)):
+    return await user_service.update_user(current_user.id, user)
 
 @router.delete("/me")
-def delete_user_me(current_user: UserModel = Depends(AuthService.get_current_user), user_service: UserService = Depends()):
-    return user_service.delete_user(current_user.id)
+async def delete_user_me(current_user: UserModel = Depends(get_authenticated_user), user_service=Depends(get_user_service)):
+    return await user_service.delete_user(current_user.id)
 
 @router.post("/me/profile", response_model=UserProfile)
-def create_user_profile(profile: UserProfileCreate, current_user: UserModel = Depends(AuthService.get_current_user), user_service: UserService = Depends()):
-    return user_service.create_user_profile(current_user.id, profile)
+async def create_user_profile(profile: UserProfileCreate, current_user: UserModel = Depends(get_authenticated_user), user_service=Depends(get_user_service)):
+    return await user_service.create_user_profile(current_user.id, profile)
 
 @router.get("/me/profile", response_model=UserProfile)
-def read_user_profile(current_user: UserModel = Depends(AuthService.get_current_user), user_service: UserService = Depends()):
-    return user_service.get_user_profile(current_user.id)
+async def read_user_profile(current_user: UserModel = Depends(get_authenticated_user), user_service=Depends(get_user_service)):
+    return await user_service.get_user_profile(current_user.id)
 
 @router.put("/me/profile", response_model=UserProfile)
-def update_user_profile(profile: UserProfileUpdate, current_user: UserModel = Depends(AuthService.get_current_user), user_service: UserService = Depends()):
-    return user_service.update_user_profile(current_user.id, profile)
\ No newline at end of file
+async def update_user_profile(profile: UserProfileUpdate, current_user: UserModel = Depends(get_authenticated_user), user_service=Depends(get_user_service)):
+    return await user_service.update_user_profile(current_user.id, profile)
+
+@router.get("/me/interactions/search", response_model=list[AIInteractionSearchResult])
+async def search_user_interactions(
+    response: Response,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: UserModel = Depends(get_authenticated_user),
+    ai_interaction_service=Depends(get_ai_interaction_service)
+):
+    results = await ai_interaction_service.search_interactions(current_user.id, q, None, limit, cursor)
+    return set_next_cursor(response, results, limit, lambda result: encode_score_cursor(result.score, result.id))
+
+@router.get("/me/interactions/export")
+async def export_user_interactions(request: Request, format: ExportFormat = "ndjson", current_user: UserModel = Depends(get_authenticated_user)):
+    # Compressed here as it streams, CompressionMiddleware leaves streamed bodies alone
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", "")) if settings.COMPRESSION_ENABLED else None
+    return export_response(current_user.id, format, encoding)
@@ -0,0 +1,62 @@
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Literal
+import orjson
+from fastapi.responses import StreamingResponse
+from app.api.deps import open_service
+from app.core.compression import compress_stream
+from app.core.config import settings
+from app.schemas.ai_interaction import AIInteraction as AIInteractionSchema
+from app.services.ai_interaction_service import AIInteractionService, AsyncAIInteractionService
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def ndjson_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+async def csv_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    fields = list(AIInteractionSchema.model_fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for rows in batches:
+        for row in rows:
+            # Timestamps as in the JSON responses
+            writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row.values()])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+ENCODERS = {"ndjson": ndjson_chunks, "csv": csv_chunks}
+
+
+def export_response(user_id: int, format: ExportFormat, encoding: str | None = None) -> StreamingResponse:
+    """Streams all of a user's interactions, oldest first, as NDJSON or CSV.
+
+    The body reads one batch of rows at a time from a server-side cursor and
+    encodes (and, with ``encoding``, compresses) it before fetching the next,
+    so memory use stays flat from a hundred interactions to millions.
+    """
+
+    async def body() -> AsyncIterator[bytes]:
+        # The request's session is closed by the time the body is sent
+        async with open_service(AsyncAIInteractionService, AIInteractionService) as service:
+            async for chunk in ENCODERS[format](service.stream_user_interaction_rows(user_id, settings.EXPORT_BATCH_SIZE)):
+                yield chunk
+
+    headers = {"Content-Disposition": f'attachment; filename="interactions.{format}"', "Cache-Control": "no-store"}
+    chunks = body()
+    if encoding is not None:
+        chunks = compress_stream(chunks, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format], headers=headers)
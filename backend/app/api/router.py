@@ -1,8 +1,12 @@
 from fastapi import APIRouter
-from app.api.endpoints import users, ai, projects
+from app.api.endpoints import users, ai, ai_interactions, projects, profiles
+from app.core.config import settings
 
 api_router = APIRouter()
 
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(ai.router, prefix="/ai", tags=["ai"])
-api_router.include_router(projects.router, prefix="/projects", tags=["projects"])
\ No newline at end of file
+api_router.include_router(projects.router, prefix="/projects", tags=["projects"])
+api_router.include_router(ai_interactions.router, prefix="/ai-interactions", tags=["ai-interactions"])
+if settings.PROFILING_TOKEN:
+    api_router.include_router(profiles.router, prefix="/admin/profiles", tags=["admin"])
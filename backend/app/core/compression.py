@@ -0,0 +1,114 @@
+import gzip
+import zlib
+from typing import AsyncIterator
+import brotli
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/css", "text/csv", "application/javascript", "application/xml", "image/svg+xml")
+# Larger bodies are compressed off the event loop
+THREADPOOL_SIZE = 256 * 1024
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """The preferred of brotli and gzip in an Accept-Encoding header, brotli on a tie."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+    default = weights.get("*", 0.0)
+    candidates = [(weights.get(coding, default), coding) for coding in ("br", "gzip")]
+    weight, coding = max(candidates, key=lambda candidate: candidate[0])
+    return coding if weight > 0 else None
+
+
+async def compress_stream(chunks: AsyncIterator[bytes], encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> AsyncIterator[bytes]:
+    """Compresses a streamed body on the fly, for the responses CompressionMiddleware passes through.
+
+    Output is yielded as the compressor produces it, so only its window is
+    held in memory however long the stream runs.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=brotli_quality)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        # wbits 31: a gzip header and trailer around the deflate data
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    async for chunk in chunks:
+        if len(chunk) >= THREADPOOL_SIZE:
+            compressed = await run_in_threadpool(compress, chunk)
+        else:
+            compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+class CompressionMiddleware:
+    """Compresses response bodies of at least ``minimum_size`` bytes with
+    brotli or gzip, as negotiated with the client's Accept-Encoding.
+
+    Only bodies sent in a single message are compressed, which covers the
+    JSON responses. Streamed responses, such as the server-sent events of the
+    AI endpoints, pass through untouched so no token is held back.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            start = {**start, "headers": headers.raw}
+            if message.get("more_body", False) or "content-encoding" in headers or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                if len(body) >= THREADPOOL_SIZE:
+                    body = await run_in_threadpool(self._compress, encoding, body)
+                else:
+                    body = self._compress(encoding, body)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
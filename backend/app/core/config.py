@@ -7,9 +7,97 @@ class Settings(BaseSettings):
     PROJECT_VERSION: str = "1.0.0"
     ALLOWED_ORIGINS: list[str] = ["http://localhost:3000"]  # Update this with your frontend URL
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///:memory:")
+    # Serve the API through the AsyncSession services; set to false to fall back
+    # to the sync sessions (each service call then runs in the threadpool)
+    USE_ASYNC_DB: bool = True
     SECRET_KEY: SecretStr = SecretStr(os.getenv("SECRET_KEY", "fallback_secret_key_for_development"))
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Existing hashes with another cost factor are upgraded when their user logs in
+    BCRYPT_ROUNDS: int = 12
+    # bcrypt runs in its own pool, sized apart from the request threadpool; past
+    # PASSWORD_HASH_MAX_PENDING queued hashes requests get a 503. Lambda has no
+    # support for process pools, so a thread pool is used there
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    PASSWORD_HASH_USE_PROCESSES: bool = os.getenv("AWS_LAMBDA_FUNCTION_NAME") is None
+    # Verified tokens are mapped to a user snapshot so authentication skips the database;
+    # share invalidations between workers through a database (e.g. the app's own)
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 300
+    USER_CACHE_INVALIDATION_DATABASE_URL: str | None = None
+    USER_CACHE_POLL_SECONDS: float = 2.0
+    # Firebase ID tokens are verified against these certificates, which are refreshed in the background
+    FIREBASE_CERTS_URL: str = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+    FIREBASE_TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    # Leave unset to use api.openai.com; point at a proxy or a local fake server otherwise
+    OPENAI_BASE_URL: str | None = None
+    # Shared connection pool of the per-key OpenAI clients
+    OPENAI_MAX_CLIENTS: int = 256
+    OPENAI_MAX_CONNECTIONS: int = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_KEEPALIVE_EXPIRY: float = 60.0
+    OPENAI_TIMEOUT: float = 60.0
+    # Upstream calls wait for their user's and their API key's requests and tokens
+    # per minute (unset: unlimited) and for one of OPENAI_MAX_CONCURRENCY slots;
+    # those that would wait longer than OPENAI_MAX_QUEUE_SECONDS get a 429/503
+    OPENAI_MAX_CONCURRENCY: int | None = 64
+    OPENAI_USER_REQUESTS_PER_MINUTE: int | None = 30
+    OPENAI_USER_TOKENS_PER_MINUTE: int | None = 60000
+    OPENAI_KEY_REQUESTS_PER_MINUTE: int | None = 500
+    OPENAI_KEY_TOKENS_PER_MINUTE: int | None = 200000
+    OPENAI_MAX_QUEUE_SECONDS: float = 10.0
+    # 429 and 5xx answers are resent after a jittered exponential backoff, or
+    # their Retry-After if longer; those asking to wait past the maximum aren't
+    OPENAI_MAX_RETRIES: int = 2
+    OPENAI_RETRY_BASE_SECONDS: float = 0.5
+    OPENAI_RETRY_MAX_SECONDS: float = 20.0
+    # Exact-match cache for completions; the database tier is optional and
+    # survives restarts (e.g. sqlite:////tmp/completion_cache.db)
+    COMPLETION_CACHE_ENABLED: bool = True
+    COMPLETION_CACHE_MAX_ENTRIES: int = 1024
+    COMPLETION_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    COMPLETION_CACHE_DATABASE_URL: str | None = None
+    # Answer a code generation with the stored response of a near-identical earlier
+    # prompt of the same project (cosine similarity of the prompt embeddings).
+    # The embedder is "module:Class"; with a directory the per-project indexes
+    # are memory-mapped files there instead of being rebuilt by every process
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_EMBEDDER: str = "app.services.semantic_cache:HashingEmbedder"
+    SEMANTIC_CACHE_DIR: str | None = None
+    SEMANTIC_CACHE_MAX_PROJECTS: int = 256
+    # Requirement conversations are summarized once their history exceeds the budget
+    CONVERSATION_TOKEN_BUDGET: int = 2000
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+    # Share one upstream call between concurrent identical generations
+    AI_SINGLE_FLIGHT_ENABLED: bool = True
+    # Interactions from the AI endpoints are buffered and saved in batches off the request path
+    INTERACTION_WRITE_BATCH_SIZE: int = 100
+    INTERACTION_WRITE_FLUSH_SECONDS: float = 1.0
+    INTERACTION_WRITE_MAX_QUEUE: int = 10000
+    # A frozen Lambda environment never gets to run the timed flush, so flush after every request there
+    INTERACTION_FLUSH_EACH_REQUEST: bool = os.getenv("AWS_LAMBDA_FUNCTION_NAME") is not None
+    # Interaction history exports are read from a server-side cursor this many
+    # rows at a time, so their memory use doesn't grow with the history
+    EXPORT_BATCH_SIZE: int = 500
+    # JSON and text bodies of at least this many bytes are sent with brotli or
+    # gzip, whichever the client accepts; streamed responses never are
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    # Per-route latency, database and OpenAI metrics, served in Prometheus format at /metrics
+    METRICS_ENABLED: bool = True
+    # Fail any request that runs more queries than this, to catch N+1 queries in development and tests
+    QUERY_BUDGET: int | None = None
+    # Requests sending this token in X-Profile are profiled, and it guards the
+    # /api/admin/profiles endpoints; profiling is entirely off while unset
+    PROFILING_TOKEN: SecretStr | None = None
+    PROFILING_INTERVAL_SECONDS: float = 0.005
+    PROFILING_MAX_REPORTS: int = 50
+    # Also write every report to <dir>/<id>.collapsed
+    PROFILING_DIR: str | None = None
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,253 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: a count per bucket (the last one is +Inf), the sum and the count
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, *labels) -> float:
+        series = self._values.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (bucket_counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated in place under a per-metric lock, so
+    recording is a dict lookup and an addition. The ``stats`` of the caches
+    and pools are read through collectors only when ``/metrics`` is scraped.
+    """
+
+    def __init__(self, prefix: str = "ai_wizard"):
+        self.prefix = prefix
+        self._metrics: list[Counter | Histogram] = []
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}_{name}", documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, component: str, stats: Callable[[], dict]) -> None:
+        self._collectors[component] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for component, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {component} metrics: {str(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    name = f"{self.prefix}_{component}_{key}"
+                    lines.extend([f"# TYPE {name} gauge", f"{name} {float(value)}"])
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Time to send the complete response, streams included.", ("method", "route", "status")
+)
+http_request_db_queries = metrics.histogram(
+    "http_request_db_queries", "Database queries run per request.", ("route",), QUERY_COUNT_BUCKETS
+)
+http_request_db_seconds = metrics.histogram("http_request_db_seconds", "Database time per request.", ("route",))
+db_queries = metrics.counter("db_queries_total", "Database queries run.", ("engine",))
+db_query_seconds = metrics.counter("db_query_seconds_total", "Time spent running database queries.", ("engine",))
+openai_request_duration = metrics.histogram(
+    "openai_request_duration_seconds", "Upstream OpenAI latency, streams until their last chunk.", ("model", "kind"), UPSTREAM_BUCKETS
+)
+openai_tokens = metrics.counter("openai_tokens_total", "Tokens reported by OpenAI.", ("model", "type"))
+openai_errors = metrics.counter("openai_errors_total", "Failed upstream OpenAI calls.", ("model", "error"))
+openai_queue_wait = metrics.histogram(
+    "openai_queue_wait_seconds", "Time upstream OpenAI calls waited for their rate limits and a concurrency slot."
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "db_seconds", "query_budget")
+
+    def __init__(self, query_budget: int | None = None):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.query_budget = query_budget
+
+
+# Set for the duration of each HTTP request. Threadpool calls and SQLAlchemy's
+# async greenlets run with a copy of the context, which shares this object.
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def query_budget(queries: int):
+    """Fails the first query past ``queries`` run inside the block, e.g. to pin a service call in a test."""
+    request = RequestMetrics(queries)
+    token = current_request.set(request)
+    try:
+        yield request
+    finally:
+        request.query_budget = None
+        current_request.reset(token)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Counts the queries of ``engine`` and their time, overall and for the current request.
+
+    A query past the request's budget raises ``QueryBudgetExceeded`` before it
+    runs, so the traceback points at the code that issued it, typically a lazy load.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        request = current_request.get()
+        if request is not None and request.query_budget is not None and request.queries >= request.query_budget:
+            raise QueryBudgetExceeded(f"Query budget of {request.query_budget} exceeded by: {statement}")
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_queries.inc(name)
+        db_query_seconds.inc(name, amount=elapsed)
+        request = current_request.get()
+        if request is not None:
+            request.queries += 1
+            request.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """Records the latency and database work of every HTTP request by route.
+
+    Requests are labelled with the route template (``/api/projects/{project_id}``),
+    not the raw path, to keep the number of series bounded. With a
+    ``query_budget`` every request fails on its first query past the budget,
+    which is how N+1 queries are caught in development and in the tests.
+    """
+
+    def __init__(self, app, query_budget: Callable[[], int | None] = lambda: None):
+        self.app = app
+        self.query_budget = query_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestMetrics(self.query_budget())
+        token = current_request.set(request)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Background tasks started by the request share its metrics, the budget ends with it
+            request.query_budget = None
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], route, status)
+            http_request_db_queries.observe(request.queries, route)
+            http_request_db_seconds.observe(request.db_seconds, route)
@@ -0,0 +1,33 @@
+import time
+from functools import lru_cache
+from app.core.config import settings
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """One context for the whole app, built on first use in each process.
+
+    Hashes with a different cost factor are reported by verify_and_update so
+    they can be upgraded on the next login. passlib and bcrypt are only
+    imported here, keeping them out of cold starts that never hash.
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+
+# The functions below run in the password hashing pool. They report when they
+# started and how long the bcrypt work took, so the caller can tell queue wait
+# from hashing time.
+
+def hash_password(password: str) -> tuple[str, float, float]:
+    pwd_context = get_pwd_context()
+    started_at = time.time()
+    start = time.perf_counter()
+    return pwd_context.hash(password), started_at, time.perf_counter() - start
+
+
+def verify_and_update_password(password: str, hashed_password: str) -> tuple[tuple[bool, str | None], float, float]:
+    pwd_context = get_pwd_context()
+    started_at = time.time()
+    start = time.perf_counter()
+    return pwd_context.verify_and_update(password, hashed_password), started_at, time.perf_counter() - start
@@ -1,16 +1,41 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.metrics import instrument_engine
 
 # For SQLite (including in-memory database)
 connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
 
 engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The query budget counts queries with the same listeners as the metrics
+instrument_queries = settings.METRICS_ENABLED or settings.QUERY_BUDGET is not None
+if instrument_queries:
+    instrument_engine(engine, "sync")
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_async_database_url(database_url: str) -> str:
+    # Map the sync driver in DATABASE_URL to its asyncio counterpart
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if database_url.startswith(("postgresql:", "postgresql+psycopg2:")):
+        return "postgresql+asyncpg:" + database_url.split(":", 1)[1]
+    if database_url.startswith("postgres:"):
+        return database_url.replace("postgres:", "postgresql+asyncpg:", 1)
+    return database_url
+
+async_engine = create_async_engine(get_async_database_url(settings.DATABASE_URL))
+if instrument_queries:
+    instrument_engine(async_engine.sync_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,67 @@
+import base64
+import datetime
+from typing import Callable
+from fastapi import HTTPException, Response, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Select, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime.datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_score_cursor(score: float, id: int) -> str:
+    # repr round-trips the float exactly, so the next page seeks from the same row
+    return base64.urlsafe_b64encode(f"{score!r}|{id}".encode()).decode()
+
+
+def decode_score_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        score, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(score), int(id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_page(statement: Select, model, limit: int | None = None, cursor: str | None = None) -> Select:
+    """Orders ``statement`` newest first on ``(created_at, id)`` and seeks past ``cursor``.
+
+    Seeking instead of OFFSET keeps every page a single index range scan on
+    the matching ``(owner, created_at, id)`` index, however deep the client pages.
+    """
+    statement = statement.order_by(model.created_at.desc(), model.id.desc())
+    if cursor is not None:
+        statement = statement.where(tuple_(model.created_at, model.id) < decode_cursor(cursor))
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def set_next_cursor(response: Response, items: list, limit: int, encode: Callable = lambda item: encode_cursor(item.created_at, item.id)) -> list:
+    # A full page may have more behind it; the client stops when the header is missing
+    if len(items) == limit:
+        response.headers["X-Next-Cursor"] = encode(items[-1])
+    return items
+
+
+def page_response(items: list[dict], limit: int, headers: dict[str, str] | None = None) -> ORJSONResponse:
+    """Encodes a page of row dicts (see app.db.projection) with orjson.
+
+    Returned from a list endpoint it bypasses the response_model validation
+    and encoding, the rows already have exactly the schema's fields.
+    """
+    headers = dict(headers or {})
+    if len(items) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(items[-1]["created_at"], items[-1]["id"])
+    return ORJSONResponse(items, headers=headers)
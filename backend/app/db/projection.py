@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from sqlalchemy import Result
+
+
+def columns_for(model, schema: type[BaseModel]) -> tuple:
+    """The columns of ``model`` behind the fields of ``schema``, in field order.
+
+    Selecting these instead of the entity skips building and tracking ORM
+    objects for rows that are only serialized.
+    """
+    return tuple(getattr(model, name) for name in schema.model_fields)
+
+
+def row_dicts(result: Result) -> list[dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
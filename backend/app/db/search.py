@@ -0,0 +1,93 @@
+import re
+from fastapi import HTTPException, status
+from sqlalchemy import Select, column, func, literal_column, select, table, tuple_
+from app.db.pagination import decode_score_cursor
+from app.models.ai_interaction import AIInteraction
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_WORDS = 16
+# Stemming language of the index, matching the porter tokenizer of the FTS5 table
+SEARCH_CONFIG = "english"
+
+ai_interactions_fts = table("ai_interactions_fts", column("rowid"))
+_fts = literal_column("ai_interactions_fts")
+_search_vector = literal_column("ai_interactions.search_vector")
+
+
+def search_terms(text: str) -> list[str]:
+    return re.findall(r"\w+", text)
+
+
+def _sqlite_search(text: str):
+    terms = search_terms(text)
+    if not terms:
+        return None
+    # Every term is quoted, so input is matched as words and never parsed as FTS5 query syntax
+    match = " ".join(f'"{term}"' for term in terms)
+    # bm25() is lower for better matches
+    score = -func.bm25(_fts)
+    statement = (
+        select(
+            AIInteraction.id,
+            AIInteraction.user_id,
+            AIInteraction.project_id,
+            AIInteraction.created_at,
+            score.label("score"),
+            func.snippet(_fts, 0, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_WORDS).label("prompt_snippet"),
+            func.snippet(_fts, 1, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_WORDS).label("response_snippet"),
+        )
+        .select_from(ai_interactions_fts.join(AIInteraction.__table__, AIInteraction.id == ai_interactions_fts.c.rowid))
+        .where(_fts.op("MATCH")(match))
+    )
+    return statement, score
+
+
+def _postgresql_search(text: str):
+    if not search_terms(text):
+        return None
+    config = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+    # websearch_to_tsquery accepts any input: quoted phrases, "or" and -exclusions, never a syntax error
+    query = func.websearch_to_tsquery(config, text)
+    score = func.ts_rank_cd(_search_vector, query)
+    headline_options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}"
+    statement = select(
+        AIInteraction.id,
+        AIInteraction.user_id,
+        AIInteraction.project_id,
+        AIInteraction.created_at,
+        score.label("score"),
+        func.ts_headline(config, AIInteraction.prompt, query, headline_options).label("prompt_snippet"),
+        func.ts_headline(config, AIInteraction.response, query, headline_options).label("response_snippet"),
+    ).where(_search_vector.op("@@")(query))
+    return statement, score
+
+
+_searches = {"sqlite": _sqlite_search, "postgresql": _postgresql_search}
+
+
+def interaction_search(dialect: str, user_id: int, text: str, project_id: int | None = None, limit: int | None = None, cursor: str | None = None) -> Select | None:
+    """Ranked full-text search over the interactions of ``user_id``, optionally within one project.
+
+    Rows carry the interaction's ids, a ``score`` (higher is better) and a
+    snippet of the prompt and of the response with the matches highlighted.
+    The snippets are not HTML escaped. Pages seek past ``cursor`` on
+    ``(score, id)`` like the other list endpoints do on ``(created_at, id)``.
+    Returns None when ``text`` has nothing to search for.
+    """
+    search = _searches.get(dialect)
+    if search is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=f"Search is not supported on {dialect}")
+    built = search(text)
+    if built is None:
+        return None
+    statement, score = built
+    statement = statement.where(AIInteraction.user_id == user_id)
+    if project_id is not None:
+        statement = statement.where(AIInteraction.project_id == project_id)
+    statement = statement.order_by(score.desc(), AIInteraction.id.desc())
+    if cursor is not None:
+        statement = statement.where(tuple_(score, AIInteraction.id) < decode_score_cursor(cursor))
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
@@ -1,9 +1,33 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.router import api_router
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, metrics
+from app.services.openai_client import openai_clients
+from app.services.completion_cache import completion_cache
+from app.services.interaction_writer import FlushInteractionsMiddleware, interaction_writer
+from app.services.user_cache import user_cache
+from app.services.firebase_tokens import firebase_tokens
+from app.services.password_hasher import password_hasher
+from app.services.single_flight import ai_flights
+from app.services.upstream_limiter import upstream_limiter
+from app.services.profiler import ProfilingMiddleware
 
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Save the interactions still buffered, then release pooled connections and the password hashing workers
+    await interaction_writer.aclose()
+    await openai_clients.aclose()
+    await completion_cache.aclose()
+    user_cache.close()
+    await firebase_tokens.aclose()
+    password_hasher.shutdown()
+
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION, lifespan=lifespan)
 
 # Set up CORS
 app.add_middleware(
@@ -14,6 +38,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+
+if settings.INTERACTION_FLUSH_EACH_REQUEST:
+    app.add_middleware(FlushInteractionsMiddleware)
+
+if settings.PROFILING_TOKEN:
+    app.add_middleware(ProfilingMiddleware, token=settings.PROFILING_TOKEN.get_secret_value())
+
+if settings.METRICS_ENABLED or settings.QUERY_BUDGET is not None:
+    # Added last to be the outermost, so the timings include the other middleware
+    app.add_middleware(MetricsMiddleware, query_budget=lambda: settings.QUERY_BUDGET)
+
+if settings.METRICS_ENABLED:
+    metrics.add_collector("completion_cache", lambda: completion_cache.stats)
+    metrics.add_collector("ai_single_flight", lambda: {"calls": ai_flights.calls, "coalesced": ai_flights.coalesced})
+    metrics.add_collector("interaction_writer", lambda: interaction_writer.stats)
+    metrics.add_collector("user_cache", lambda: user_cache.stats)
+    metrics.add_collector("firebase_tokens", lambda: firebase_tokens.stats)
+    metrics.add_collector("password_hasher", lambda: password_hasher.stats)
+    metrics.add_collector("openai_upstream", lambda: upstream_limiter.stats)
+    if settings.SEMANTIC_CACHE_ENABLED:
+        from app.services.semantic_cache import semantic_cache
+        metrics.add_collector("semantic_cache", lambda: semantic_cache.stats)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include API router
 app.include_router(api_router, prefix="/api")
 
@@ -1,3 +1,5 @@
 from .user import User
 from .project import Project
-from .ai_interaction import AIInteraction
\ No newline at end of file
+from .ai_interaction import AIInteraction
+from .interaction_blob import InteractionBlob
+from .conversation import Conversation, ConversationMessage
\ No newline at end of file
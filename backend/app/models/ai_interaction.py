@@ -1,17 +1,150 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from itertools import chain
+from sqlalchemy import DDL, Column, Integer, LargeBinary, ForeignKey, DateTime, Index, delete, event, exists, inspect, select
+from sqlalchemy.orm import Session, column_property, relationship
 from app.models.base import Base
+from app.models.interaction_blob import InteractionBlob, blob_rows, body_hash, insert_blobs
 import datetime
 
+def blob_body(hash_column):
+    return select(InteractionBlob.body).where(InteractionBlob.hash == hash_column).correlate_except(InteractionBlob).scalar_subquery()
+
 class AIInteraction(Base):
     __tablename__ = "ai_interactions"
+    # Keyset pagination seeks on (owner, created_at, id), see app.db.pagination
+    __table_args__ = (
+        Index("ix_ai_interactions_project_id_created_at_id", "project_id", "created_at", "id"),
+        Index("ix_ai_interactions_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Whether a blob is still referenced, see delete_unreferenced_blobs
+        Index("ix_ai_interactions_prompt_hash", "prompt_hash"),
+        Index("ix_ai_interactions_response_hash", "response_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     project_id = Column(Integer, ForeignKey("projects.id"))
-    prompt = Column(String, nullable=False)
-    response = Column(String, nullable=False)
+    # The bodies live in interaction_blobs, compressed and stored once per distinct text
+    prompt_hash = Column(LargeBinary(32), ForeignKey("interaction_blobs.hash"), nullable=False)
+    response_hash = Column(LargeBinary(32), ForeignKey("interaction_blobs.hash"), nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    # Read with a subquery per row, only by queries that ask for them:
+    # selecting the attributes (on their own, with select_from(AIInteraction)),
+    # or entities loaded with undefer(). Touching them on an entity loaded
+    # without raises instead of querying per row. Assigned ones are stored by
+    # store_interaction_bodies on flush.
+    prompt = column_property(blob_body(prompt_hash), deferred=True, raiseload=True)
+    response = column_property(blob_body(response_hash), deferred=True, raiseload=True)
+
     user = relationship("User", back_populates="interactions")
-    project = relationship("Project", back_populates="ai_interactions")
\ No newline at end of file
+    project = relationship("Project", back_populates="ai_interactions")
+
+def interaction_body_rows(rows: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Splits interaction rows with a ``prompt`` and ``response`` into the
+    rows of their blobs, to insert first with ``insert_blobs``, and the
+    interaction rows referencing them by hash."""
+    blobs = blob_rows(chain.from_iterable((row["prompt"], row["response"]) for row in rows))
+    interactions = [
+        {**{key: value for key, value in row.items() if key not in ("prompt", "response")}, "prompt_hash": body_hash(row["prompt"]), "response_hash": body_hash(row["response"])}
+        for row in rows
+    ]
+    return blobs, interactions
+
+def delete_unreferenced_blobs(hashes):
+    """DELETE of the blobs among ``hashes`` that no interaction refers to any more.
+
+    Blobs locked by another transaction, which insert_blobs is reusing for
+    interactions not committed yet, are skipped rather than waited for.
+    """
+    unreferenced = (
+        select(InteractionBlob.hash)
+        .where(
+            InteractionBlob.hash.in_(hashes),
+            ~exists().where(AIInteraction.prompt_hash == InteractionBlob.hash),
+            ~exists().where(AIInteraction.response_hash == InteractionBlob.hash),
+        )
+        .with_for_update(skip_locked=True)
+    )
+    return delete(InteractionBlob).where(InteractionBlob.hash.in_(unreferenced))
+
+@event.listens_for(Session, "before_flush")
+def store_interaction_bodies(session, flush_context, instances):
+    # Entities created or changed through the ORM: their new bodies are
+    # inserted as blobs and the hashes set before the interaction rows are
+    # written. The hashes they stop using are kept for delete_replaced_blobs.
+    texts, replaced = [], session.info.setdefault("replaced_blob_hashes", set())
+    for interaction in chain(session.new, session.dirty):
+        if not isinstance(interaction, AIInteraction):
+            continue
+        attributes = inspect(interaction).attrs
+        for body, hash_attribute in (("prompt", "prompt_hash"), ("response", "response_hash")):
+            added = attributes[body].history.added
+            if added:
+                texts.append(added[0])
+                if inspect(interaction).persistent:
+                    replaced.add(getattr(interaction, hash_attribute))
+                setattr(interaction, hash_attribute, body_hash(added[0]))
+    for interaction in session.deleted:
+        if isinstance(interaction, AIInteraction):
+            replaced.update((interaction.prompt_hash, interaction.response_hash))
+    if texts:
+        session.execute(insert_blobs(session.get_bind().dialect.name), blob_rows(texts))
+
+@event.listens_for(Session, "after_flush")
+def delete_replaced_blobs(session, flush_context):
+    # Once the interactions are written, the bodies nothing refers to any more
+    # go in the same transaction. Rows removed with bulk statements bypass
+    # this and need delete_unreferenced_blobs of their hashes.
+    replaced = session.info.pop("replaced_blob_hashes", None)
+    if replaced:
+        session.execute(delete_unreferenced_blobs(replaced))
+
+# Full-text search over prompts and responses, queried by app.db.search. On
+# SQLite an external content FTS5 table indexes the bodies through a view
+# that decompresses them (interaction_body() is registered on every SQLite
+# connection) and triggers keep it in sync; on PostgreSQL a tsvector column,
+# set by a trigger from the blobs, carries a GIN index. Created with the table
+# by create_all, and by migrations 0004 and 0005 for migrated databases.
+SQLITE_SEARCH_DDL = (
+    "CREATE VIEW ai_interaction_bodies AS "
+    "SELECT i.id, interaction_body(p.body) AS prompt, interaction_body(r.body) AS response FROM ai_interactions i "
+    "JOIN interaction_blobs p ON p.hash = i.prompt_hash JOIN interaction_blobs r ON r.hash = i.response_hash",
+    "CREATE VIRTUAL TABLE ai_interactions_fts USING fts5("
+    "prompt, response, content='ai_interaction_bodies', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER ai_interactions_fts_insert AFTER INSERT ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) SELECT id, prompt, response FROM ai_interaction_bodies WHERE id = new.id; END",
+    "CREATE TRIGGER ai_interactions_fts_delete AFTER DELETE ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.prompt_hash), "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.response_hash)); END",
+    "CREATE TRIGGER ai_interactions_fts_update AFTER UPDATE OF prompt_hash, response_hash ON ai_interactions BEGIN "
+    "INSERT INTO ai_interactions_fts(ai_interactions_fts, rowid, prompt, response) VALUES ('delete', old.id, "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.prompt_hash), "
+    "(SELECT interaction_body(body) FROM interaction_blobs WHERE hash = old.response_hash)); "
+    "INSERT INTO ai_interactions_fts(rowid, prompt, response) SELECT id, prompt, response FROM ai_interaction_bodies WHERE id = new.id; END",
+)
+POSTGRESQL_SEARCH_DDL = (
+    "ALTER TABLE ai_interactions ADD COLUMN search_vector tsvector",
+    "CREATE FUNCTION ai_interactions_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+    "NEW.search_vector := to_tsvector('english', "
+    "(SELECT body FROM interaction_blobs WHERE hash = NEW.prompt_hash) || ' ' || (SELECT body FROM interaction_blobs WHERE hash = NEW.response_hash)); "
+    "RETURN NEW; END $$",
+    "CREATE TRIGGER ai_interactions_search_vector BEFORE INSERT OR UPDATE OF prompt_hash, response_hash ON ai_interactions "
+    "FOR EACH ROW EXECUTE FUNCTION ai_interactions_search_vector()",
+    "CREATE INDEX ix_ai_interactions_search_vector ON ai_interactions USING gin (search_vector)",
+)
+
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(AIInteraction.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+# The triggers go with the table, the FTS5 table, the view and the trigger function have to be dropped explicitly
+event.listen(AIInteraction.__table__, "after_drop", DDL("DROP TABLE IF EXISTS ai_interactions_fts").execute_if(dialect="sqlite"))
+event.listen(AIInteraction.__table__, "after_drop", DDL("DROP VIEW IF EXISTS ai_interaction_bodies").execute_if(dialect="sqlite"))
+for statement in POSTGRESQL_SEARCH_DDL:
+    event.listen(AIInteraction.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(AIInteraction.__table__, "after_drop", DDL("DROP FUNCTION IF EXISTS ai_interactions_search_vector()").execute_if(dialect="postgresql"))
+
+# Names of the search objects, including the FTS5 shadow tables (ai_interactions_fts_data, ...)
+SEARCH_OBJECTS = ("ai_interactions_fts", "ai_interaction_bodies", "search_vector", "ix_ai_interactions_search_vector")
+
+def include_schema_name(name, type_, parent_names) -> bool:
+    # Autogenerate must not drop the search objects, which the model doesn't declare
+    return not (name or "").startswith(SEARCH_OBJECTS)
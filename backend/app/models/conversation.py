@@ -0,0 +1,40 @@
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+from app.models.base import Base
+import datetime
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), unique=True, nullable=False)
+    # Rolling summary of the messages that no longer fit the token budget
+    summary = Column(Text)
+    summary_token_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    messages = relationship("ConversationMessage", back_populates="conversation", order_by="ConversationMessage.id")
+
+class ConversationMessage(Base):
+    __tablename__ = "conversation_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    # Counted once on insert so the history is never re-tokenized
+    token_count = Column(Integer, nullable=False)
+    summarized = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    conversation = relationship("Conversation", back_populates="messages")
+
+
+def insert_conversation(dialect: str):
+    """INSERT of a project's conversation that leaves an existing one alone."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Conversation.__table__).on_conflict_do_nothing(index_elements=["project_id"])
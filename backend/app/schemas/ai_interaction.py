@@ -1,10 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class AIInteractionCreate(BaseModel):
     prompt: str
     response: str
 
+class AIInteractionBatchCreate(BaseModel):
+    interactions: list[AIInteractionCreate] = Field(min_length=1, max_length=1000)
+
 class AIInteraction(BaseModel):
     id: int
     user_id: int
@@ -14,4 +17,18 @@ class AIInteraction(BaseModel):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class AIInteractionSearchResult(BaseModel):
+    id: int
+    user_id: int
+    project_id: int | None
+    created_at: datetime
+    # Relevance to the query, higher is better; only comparable within one search
+    score: float
+    # Excerpts with the matched words between <mark> and </mark>, not HTML escaped
+    prompt_snippet: str
+    response_snippet: str
+
+    class Config:
+        from_attributes = True
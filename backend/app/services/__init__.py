@@ -1,4 +1,4 @@
-from .user_service import UserService
-from .project_service import ProjectService
-from .ai_interaction_service import AIInteractionService
-from .auth_service import AuthService
\ No newline at end of file
+from .user_service import UserService, AsyncUserService
+from .project_service import ProjectService, AsyncProjectService
+from .ai_interaction_service import AIInteractionService, AsyncAIInteractionService
+from .auth_service import AuthService, AsyncAuthService
\ No newline at end of file
@@ -1,8 +1,50 @@
+from typing import AsyncIterator, Iterator
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.models.ai_interaction import AIInteraction
-from app.schemas.ai_interaction import AIInteractionCreate
+from sqlalchemy import Row, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+from app.db.database import get_db, get_async_db
+from app.db.pagination import keyset_page
+from app.db.projection import columns_for, row_dicts
+from app.db.search import interaction_search
+from app.models.ai_interaction import AIInteraction, interaction_body_rows
+from app.models.interaction_blob import insert_blobs
+from app.schemas.ai_interaction import AIInteractionCreate, AIInteraction as AIInteractionSchema
+
+# Executed with a list of rows this becomes one multi-row INSERT ... RETURNING
+# (split by SQLAlchemy's insertmanyvalues only for very large batches), after
+# the blobs of the bodies (see interaction_body_rows).
+# sort_by_parameter_order would make SQLite fall back to one INSERT per row;
+# ids are assigned in VALUES order instead, so the rows are sorted by id.
+insert_ai_interactions = insert(AIInteraction).returning(AIInteraction)
+
+# Loader options for reads serialized with schemas.AIInteraction, which has no
+# relationships; touching one raises instead of issuing a lazy load per row.
+# The deferred bodies are loaded with the rows.
+interaction_response_options = (raiseload("*"), undefer(AIInteraction.prompt), undefer(AIInteraction.response))
+
+# The list endpoints select just these columns and encode the rows directly
+interaction_response_columns = columns_for(AIInteraction, AIInteractionSchema)
+
+def user_interaction_export(user_id: int, batch_size: int):
+    # Oldest first, fetched from a server-side cursor batch_size rows at a time
+    # (yield_per), so neither the driver nor the ORM holds more than a batch
+    return (
+        select(*interaction_response_columns)
+        .filter(AIInteraction.user_id == user_id)
+        .order_by(AIInteraction.created_at, AIInteraction.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+def ai_interaction_rows(user_id: int, project_id: int, interactions: list[AIInteractionCreate]) -> list[dict]:
+    return [{**interaction.model_dump(), "user_id": user_id, "project_id": project_id} for interaction in interactions]
+
+def with_bodies(db_interaction: AIInteraction, interaction: AIInteractionCreate) -> AIInteraction:
+    # The bodies just written, so serializing the new interaction doesn't read them back
+    set_committed_value(db_interaction, "prompt", interaction.prompt)
+    set_committed_value(db_interaction, "response", interaction.response)
+    return db_interaction
 
 class AIInteractionService:
     def __init__(self, db: Session = Depends(get_db)):
@@ -13,16 +55,102 @@ class AIInteractionService:
         self.db.add(db_interaction)
         self.db.commit()
         self.db.refresh(db_interaction)
-        return db_interaction
+        return with_bodies(db_interaction, interaction)
+
+    def create_ai_interactions(self, user_id: int, project_id: int, interactions: list[AIInteractionCreate]) -> list[AIInteraction]:
+        blobs, rows = interaction_body_rows(ai_interaction_rows(user_id, project_id, interactions))
+        self.db.execute(insert_blobs(self.db.get_bind().dialect.name), blobs)
+        db_interactions = sorted(self.db.scalars(insert_ai_interactions, rows), key=lambda i: i.id)
+        # Detached rows keep their RETURNING values instead of being reloaded one by one after the commit
+        for db_interaction, interaction in zip(db_interactions, interactions):
+            self.db.expunge(with_bodies(db_interaction, interaction))
+        self.db.commit()
+        return db_interactions
 
     def get_ai_interaction(self, interaction_id: int) -> AIInteraction:
-        interaction = self.db.query(AIInteraction).filter(AIInteraction.id == interaction_id).first()
+        interaction = self.db.query(AIInteraction).options(*interaction_response_options).filter(AIInteraction.id == interaction_id).first()
+        if not interaction:
+            raise HTTPException(status_code=404, detail="AI Interaction not found")
+        return interaction
+
+    def get_project_interactions(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return list(self.db.scalars(statement))
+
+    def get_user_interactions(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.user_id == user_id), AIInteraction, limit, cursor)
+        return list(self.db.scalars(statement))
+
+    def get_project_interaction_rows(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return row_dicts(self.db.execute(statement))
+
+    def get_user_interaction_rows(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.user_id == user_id), AIInteraction, limit, cursor)
+        return row_dicts(self.db.execute(statement))
+
+    def stream_user_interaction_rows(self, user_id: int, batch_size: int) -> Iterator[list[dict]]:
+        result = self.db.execute(user_interaction_export(user_id, batch_size))
+        keys = list(result.keys())
+        for rows in result.partitions():
+            yield [dict(zip(keys, row)) for row in rows]
+
+    def search_interactions(self, user_id: int, text: str, project_id: int | None = None, limit: int | None = None, cursor: str | None = None) -> list[Row]:
+        statement = interaction_search(self.db.get_bind().dialect.name, user_id, text, project_id, limit, cursor)
+        return [] if statement is None else list(self.db.execute(statement))
+
+class AsyncAIInteractionService:
+    def __init__(self, db: AsyncSession = Depends(get_async_db)):
+        self.db = db
+
+    async def create_ai_interaction(self, user_id: int, project_id: int, interaction: AIInteractionCreate) -> AIInteraction:
+        db_interaction = AIInteraction(**interaction.model_dump(), user_id=user_id, project_id=project_id)
+        self.db.add(db_interaction)
+        await self.db.commit()
+        await self.db.refresh(db_interaction)
+        return with_bodies(db_interaction, interaction)
+
+    async def create_ai_interactions(self, user_id: int, project_id: int, interactions: list[AIInteractionCreate]) -> list[AIInteraction]:
+        blobs, rows = interaction_body_rows(ai_interaction_rows(user_id, project_id, interactions))
+        await self.db.execute(insert_blobs(self.db.get_bind().dialect.name), blobs)
+        result = await self.db.scalars(insert_ai_interactions, rows)
+        db_interactions = sorted(result, key=lambda i: i.id)
+        for db_interaction, interaction in zip(db_interactions, interactions):
+            with_bodies(db_interaction, interaction)
+        await self.db.commit()
+        return db_interactions
+
+    async def get_ai_interaction(self, interaction_id: int) -> AIInteraction:
+        result = await self.db.execute(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.id == interaction_id))
+        interaction = result.scalars().first()
         if not interaction:
             raise HTTPException(status_code=404, detail="AI Interaction not found")
         return interaction
 
-    def get_project_interactions(self, project_id: int) -> list[AIInteraction]:
-        return self.db.query(AIInteraction).filter(AIInteraction.project_id == project_id).all()
+    async def get_project_interactions(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        result = await self.db.execute(statement)
+        return list(result.scalars().all())
+
+    async def get_user_interactions(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.user_id == user_id), AIInteraction, limit, cursor)
+        result = await self.db.execute(statement)
+        return list(result.scalars().all())
+
+    async def get_project_interaction_rows(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return row_dicts(await self.db.execute(statement))
+
+    async def get_user_interaction_rows(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.user_id == user_id), AIInteraction, limit, cursor)
+        return row_dicts(await self.db.execute(statement))
+
+    async def stream_user_interaction_rows(self, user_id: int, batch_size: int) -> AsyncIterator[list[dict]]:
+        result = await self.db.stream(user_interaction_export(user_id, batch_size))
+        keys = list(result.keys())
+        async for rows in result.partitions():
+            yield [dict(zip(keys, row)) for row in rows]
 
-    def get_user_interactions(self, user_id: int) -> list[AIInteraction]:
-        return self.db.query(AIInteraction).filter(AIInteraction.user_id == user_id).all()
\ No newline at end of file
+    async def search_interactions(self, user_id: int, text: str, project_id: int | None = None, limit: int | None = None, cursor: str | None = None) -> list[Row]:
+        statement = interaction_search(self.db.get_bind().dialect.name, user_id, text, project_id, limit, cursor)
+        return [] if statement is None else list(await self.db.execute(statement))
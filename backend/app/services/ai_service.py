@@ -1,11 +1,39 @@
-from fastapi import Depends, HTTPException, status
+import hashlib
+import json
+import time
+from typing import AsyncIterator
+from fastapi import HTTPException, status
 from app.core.config import settings
-from app.services.auth_service import AuthService
+from app.core.metrics import openai_errors, openai_request_duration, openai_tokens
 from app.models.user import User
-import openai
+from app.services.openai_client import openai_clients
+from app.services.conversation_service import new_message
+from app.services.completion_cache import completion_cache, completion_cache_key
+from app.services.single_flight import ai_flights
+from app.services.token_counter import count_message_tokens
+from app.services.upstream_limiter import UpstreamBusy, upstream_limiter
+
+class PendingTurn:
+    """A requirements message with the prompt built for it from the stored conversation.
+
+    Nothing is stored until ``save`` is given the reply: the message, the
+    reply and the messages folded into the summary on the way are then
+    written in one transaction.
+    """
+
+    def __init__(self, conversation_id: int, message: str, messages: list[dict], folded_message_ids: list[int], summary: str | None):
+        self.conversation_id = conversation_id
+        self.message = message
+        self.messages = messages
+        self.folded_message_ids = folded_message_ids
+        self.summary = summary
+
+    async def save(self, conversation_service, reply: str) -> None:
+        await conversation_service.add_turn(self.conversation_id, self.message, reply, self.folded_message_ids, self.summary)
+
 
 class AIService:
-    def __init__(self, current_user: User = Depends(AuthService.get_current_user)):
+    def __init__(self, current_user: User):
         self.current_user = current_user
         self.model = settings.OPENAI_MODEL
 
@@ -25,51 +53,219 @@ class AIService:
         # This should interact with your database or secure storage
         pass
 
-    async def generate_code(self, prompt: str) -> str:
+    def _code_messages(self, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant that generates code."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _completion_cache_enabled(self) -> bool:
+        # Users can opt out with {"completion_cache": false} in their profile preferences
+        if not settings.COMPLETION_CACHE_ENABLED:
+            return False
+        profile = self.current_user.profile
+        preferences = json.loads(profile.preferences) if profile and profile.preferences else None
+        return (preferences or {}).get("completion_cache", True)
+
+    async def _semantic_lookup(self, project_id: int, prompt: str) -> str | None:
+        # Imported on first use, NumPy stays out of the cold start while the cache is disabled
+        from app.services.semantic_cache import semantic_cache
         try:
-            api_key = await self._get_api_key()
-            openai.api_key = api_key
+            return await semantic_cache.lookup(project_id, prompt)
+        except Exception as e:
+            print(f"Error reading semantic cache: {str(e)}")
+            return None
+
+    async def _cached(self, cache_key: str, semantic_key: tuple[int, str] | None) -> str | None:
+        cached = await completion_cache.get(cache_key)
+        if cached is None and semantic_key is not None and settings.SEMANTIC_CACHE_ENABLED:
+            cached = await self._semantic_lookup(*semantic_key)
+        return cached
+
+    async def _complete(self, messages: list[dict], max_tokens: int, temperature: float = 0.7, fresh: bool = False, semantic_key: tuple[int, str] | None = None) -> str:
+        use_cache = self._completion_cache_enabled()
+        cache_key = completion_cache_key(self.model, messages, temperature, max_tokens)
+        if use_cache and not fresh:
+            cached = await self._cached(cache_key, semantic_key)
+            if cached is not None:
+                return cached
 
-            response = await openai.ChatCompletion.acreate(
+        api_key = await self._get_api_key()
+        request = lambda: self._request_completion(api_key, messages, max_tokens, temperature, cache_key if use_cache else None)
+        if not settings.AI_SINGLE_FLIGHT_ENABLED:
+            return await request()
+        return await ai_flights.do(self._flight_key(api_key, cache_key), request)
+
+    def _flight_key(self, api_key: str, cache_key: str) -> str:
+        # Calls are only coalesced per API key, so one user's failing key
+        # never fails another user's request
+        return hashlib.sha256(api_key.encode()).hexdigest()[:16] + ":" + cache_key
+
+    def _record_usage(self, usage) -> None:
+        if usage is not None:
+            openai_tokens.inc(self.model, "prompt", amount=usage.prompt_tokens)
+            openai_tokens.inc(self.model, "completion", amount=usage.completion_tokens)
+
+    def _upstream_call(self, api_key: str, messages: list[dict], max_tokens: int, create):
+        # OpenAI counts max_tokens against the tokens per minute until the call is done
+        return upstream_limiter.call(self.current_user.id, api_key, count_message_tokens(messages) + max_tokens, create)
+
+    async def _request_completion(self, api_key: str, messages: list[dict], max_tokens: int, temperature: float, cache_key: str | None) -> str:
+        started = time.perf_counter()
+        try:
+            async with self._upstream_call(api_key, messages, max_tokens, lambda: openai_clients.get(api_key).chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that generates code."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
+                messages=messages,
+                max_tokens=max_tokens,
                 n=1,
                 stop=None,
-                temperature=0.7,
-            )
-            return response.choices[0].message.content.strip()
+                temperature=temperature,
+            )) as (admission, response):
+                if response.usage is not None:
+                    admission.reconcile(response.usage.total_tokens)
+        except UpstreamBusy:
+            # Refused before reaching OpenAI
+            raise
+        except Exception as e:
+            openai_errors.inc(self.model, type(e).__name__)
+            raise
+        openai_request_duration.observe(time.perf_counter() - started, self.model, "completion")
+        self._record_usage(response.usage)
+        content = response.choices[0].message.content.strip()
+        if cache_key:
+            await completion_cache.set(cache_key, content)
+        return content
+
+    async def generate_code(self, prompt: str, fresh: bool = False, project_id: int | None = None) -> str:
+        # With a project, near-identical earlier prompts of the project can answer from the semantic cache
+        semantic_key = (project_id, prompt) if project_id is not None else None
+        try:
+            return await self._complete(self._code_messages(prompt), max_tokens=1000, fresh=fresh, semantic_key=semantic_key)
+        except UpstreamBusy:
+            # Answered with its 429/503 and Retry-After, so the client knows to come back
+            raise
         except Exception as e:
             # Log the error and return a generic message
             print(f"Error generating code: {str(e)}")
             return "An error occurred while generating code."
 
-    async def refine_requirements(self, conversation_history: list[str]) -> str:
+    async def requirements_turn(self, conversation_service, project_id: int, message: str) -> PendingTurn:
+        # The conversation lives on the server: only the new turn comes in, and
+        # turns that no longer fit the token budget are folded into a summary
+        conversation = await conversation_service.get_or_create_conversation(project_id)
+        active_messages = await conversation_service.get_active_messages(conversation.id)
+        # The message is only stored along with its reply
+        active_messages.append(new_message(conversation.id, "user", message))
+        summary, folded_message_ids = conversation.summary, []
+        history_tokens = conversation.summary_token_count + sum(m.token_count for m in active_messages)
+        if history_tokens > settings.CONVERSATION_TOKEN_BUDGET:
+            older_messages, active_messages = self._split_history(active_messages)
+            if older_messages:
+                summary = await self._summarize(summary, older_messages)
+                folded_message_ids = [m.id for m in older_messages]
+        return PendingTurn(conversation.id, message, self._session_messages(summary, active_messages), folded_message_ids, summary)
+
+    async def continue_requirements(self, conversation_service, project_id: int, message: str) -> str:
         try:
-            api_key = await self._get_api_key()
-            openai.api_key = api_key
+            turn = await self.requirements_turn(conversation_service, project_id, message)
+            reply = await self._complete(turn.messages, max_tokens=200)
+        except UpstreamBusy:
+            raise
+        except Exception as e:
+            # Log the error and return a generic message
+            print(f"Error refining requirements: {str(e)}")
+            return "An error occurred while refining requirements."
+        await turn.save(conversation_service, reply)
+        return reply
+
+    def _split_history(self, messages: list) -> tuple[list, list]:
+        # Keep the newest turns within half the budget, the latest one always
+        split = len(messages) - 1
+        recent_tokens = messages[split].token_count
+        while split > 0 and recent_tokens + messages[split - 1].token_count <= settings.CONVERSATION_TOKEN_BUDGET // 2:
+            split -= 1
+            recent_tokens += messages[split].token_count
+        return messages[:split], messages[split:]
+
+    async def _summarize(self, summary: str | None, messages: list) -> str:
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        content = (f"Previous summary:\n{summary}\n\n" if summary else "") + f"Conversation:\n{transcript}"
+        return await self._complete(
+            [
+                {"role": "system", "content": "You summarize project requirement discussions. Keep every requirement, decision and open question."},
+                {"role": "user", "content": content}
+            ],
+            max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+        )
+
+    def _session_messages(self, summary: str | None, messages: list) -> list[dict]:
+        session_messages = [{"role": "system", "content": "You are a helpful assistant that refines project requirements."}]
+        if summary:
+            session_messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
+        session_messages.extend({"role": m.role, "content": m.content} for m in messages)
+        return session_messages
+
+    async def stream_code(self, prompt: str, fresh: bool = False, project_id: int | None = None) -> AsyncIterator[str]:
+        semantic_key = (project_id, prompt) if project_id is not None else None
+        return await self._stream(self._code_messages(prompt), max_tokens=1000, fresh=fresh, semantic_key=semantic_key)
 
-            messages = [{"role": "system", "content": "You are a helpful assistant that refines project requirements."}]
-            for i, message in enumerate(conversation_history):
-                role = "user" if i % 2 == 0 else "assistant"
-                messages.append({"role": role, "content": message})
+    async def stream_requirements(self, turn: PendingTurn, fresh: bool = False) -> AsyncIterator[str]:
+        # The turn is left for the caller to save once the stream is done
+        return await self._stream(turn.messages, max_tokens=200, fresh=fresh)
 
-            response = await openai.ChatCompletion.acreate(
+    async def _stream(self, messages: list[dict], max_tokens: int, temperature: float = 0.7, fresh: bool = False, semantic_key: tuple[int, str] | None = None) -> AsyncIterator[str]:
+        use_cache = self._completion_cache_enabled()
+        cache_key = completion_cache_key(self.model, messages, temperature, max_tokens)
+        if use_cache and not fresh:
+            cached = await self._cached(cache_key, semantic_key)
+            if cached is not None:
+                return self._replay(cached)
+
+        # The API key is resolved up front so a missing key is still reported
+        # as a 400 instead of failing after the response has started
+        api_key = await self._get_api_key()
+        stream = lambda: self._stream_completion(api_key, messages, max_tokens, temperature, cache_key if use_cache else None)
+        if not settings.AI_SINGLE_FLIGHT_ENABLED:
+            return stream()
+        return ai_flights.stream(self._flight_key(api_key, cache_key), stream)
+
+    async def _replay(self, content: str) -> AsyncIterator[str]:
+        yield content
+
+    async def _stream_completion(self, api_key: str, messages: list[dict], max_tokens: int, temperature: float, cache_key: str | None) -> AsyncIterator[str]:
+        chunks = []
+        started = time.perf_counter()
+        # The admission lasts until the stream ends; only opening it is retried,
+        # once tokens have been sent a failure can't be undone
+        try:
+            async with self._upstream_call(api_key, messages, max_tokens, lambda: openai_clients.get(api_key).chat.completions.create(
                 model=self.model,
                 messages=messages,
-                max_tokens=200,
+                max_tokens=max_tokens,
                 n=1,
                 stop=None,
-                temperature=0.7,
-            )
-            return response.choices[0].message.content.strip()
+                temperature=temperature,
+                stream=True,
+                # The usage arrives in a final chunk without choices
+                stream_options={"include_usage": True},
+            )) as (admission, stream):
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            chunks.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                        self._record_usage(chunk.usage)
+                        if chunk.usage is not None:
+                            admission.reconcile(chunk.usage.total_tokens)
+        except UpstreamBusy:
+            # Refused before reaching OpenAI
+            raise
         except Exception as e:
-            # Log the error and return a generic message
-            print(f"Error refining requirements: {str(e)}")
-            return "An error occurred while refining requirements."
+            openai_errors.inc(self.model, type(e).__name__)
+            raise
+        openai_request_duration.observe(time.perf_counter() - started, self.model, "stream")
+        if cache_key:
+            await completion_cache.set(cache_key, "".join(chunks).strip())
 
     async def set_api_key(self, api_key: str) -> bool:
         # Implement secure storage of the API key
@@ -79,4 +275,4 @@ class AIService:
     async def remove_api_key(self) -> bool:
         # Implement secure removal of the API key
         # This should interact with your database or secure storage
-        pass
\ No newline at end of file
+        pass
@@ -1,30 +1,39 @@
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.models.user import User
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
+from app.services.user_service import user_with_profile_options
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class AuthService:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+        return password_hasher.verify_and_update_sync(plain_password, hashed_password)[0]
 
     def get_password_hash(self, password: str) -> str:
-        return pwd_context.hash(password)
+        return password_hasher.hash_sync(password)
 
     def authenticate_user(self, email: str, password: str) -> User:
         user = self.db.query(User).filter(User.email == email).first()
-        if not user or not self.verify_password(password, user.hashed_password):
+        if not user:
             return None
+        verified, new_hash = password_hasher.verify_and_update_sync(password, user.hashed_password)
+        if not verified:
+            return None
+        if new_hash:
+            # The cost factor changed since this hash was made, upgrade it while we have the password
+            user.hashed_password = new_hash
+            self.db.commit()
         return user
 
     def create_access_token(self, data: dict, expires_delta: timedelta = None) -> str:
@@ -34,23 +43,91 @@ class AuthService:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+        from jose import jwt
+        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY.get_secret_value(), algorithm=settings.ALGORITHM)
         return encoded_jwt
 
+    def get_current_user(self, token: str = Depends(oauth2_scheme)) -> User:
+        if settings.USER_CACHE_ENABLED:
+            user_cache.poll()
+            cached_user = user_cache.get(token)
+            if cached_user is not None:
+                # Attached to this request's session like a loaded user, without a query
+                return self.db.merge(cached_user, load=False)
+        # Taken before the user is loaded, so an update in the meantime keeps it out of the cache
+        generation = user_cache.generation()
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        # jose is imported on first use to keep it out of cold starts
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY.get_secret_value(), algorithms=[settings.ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
+            raise credentials_exception
+        # The user is what /users/me serializes, profile included
+        user = self.db.query(User).options(*user_with_profile_options).filter(User.email == email).first()
+        if user is None:
+            raise credentials_exception
+        if settings.USER_CACHE_ENABLED:
+            user_cache.set(token, user, payload["exp"], generation)
+        return user
+
+class AsyncAuthService(AuthService):
+    def __init__(self, db: AsyncSession = Depends(get_async_db)):
+        self.db = db
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return (await password_hasher.verify_and_update(plain_password, hashed_password))[0]
+
+    async def get_password_hash(self, password: str) -> str:
+        return await password_hasher.hash(password)
+
+    async def authenticate_user(self, email: str, password: str) -> User:
+        result = await self.db.execute(select(User).filter(User.email == email))
+        user = result.scalars().first()
+        if not user:
+            return None
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        if not verified:
+            return None
+        if new_hash:
+            user.hashed_password = new_hash
+            await self.db.commit()
+        return user
+
     async def get_current_user(self, token: str = Depends(oauth2_scheme)) -> User:
+        if settings.USER_CACHE_ENABLED:
+            await user_cache.apoll()
+            cached_user = user_cache.get(token)
+            if cached_user is not None:
+                return await self.db.merge(cached_user, load=False)
+        # Taken before the user is loaded, so an update in the meantime keeps it out of the cache
+        generation = user_cache.generation()
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+        # jose is imported on first use to keep it out of cold starts
+        from jose import JWTError, jwt
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            payload = jwt.decode(token, settings.SECRET_KEY.get_secret_value(), algorithms=[settings.ALGORITHM])
             email: str = payload.get("sub")
             if email is None:
                 raise credentials_exception
         except JWTError:
             raise credentials_exception
-        user = self.db.query(User).filter(User.email == email).first()
+        # /users/me serializes the profile, which can't be lazy loaded on an AsyncSession
+        result = await self.db.execute(select(User).options(*user_with_profile_options).filter(User.email == email))
+        user = result.scalars().first()
         if user is None:
             raise credentials_exception
-        return user
\ No newline at end of file
+        if settings.USER_CACHE_ENABLED:
+            user_cache.set(token, user, payload["exp"], generation)
+        return user
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from app.core.config import settings
+from app.db.database import get_async_database_url
+
+
+def normalize_messages(messages: list[dict]) -> list[dict]:
+    # Line endings and surrounding whitespace don't change the answer
+    return [{**message, "content": message["content"].replace("\r\n", "\n").strip()} for message in messages]
+
+
+def completion_cache_key(model: str, messages: list[dict], temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": normalize_messages(messages), "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MemoryCompletionCache:
+    """In-process LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (value, self._clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+completion_cache_metadata = MetaData()
+
+completion_cache_table = Table(
+    "completion_cache",
+    completion_cache_metadata,
+    Column("key", String(64), primary_key=True),
+    Column("response", Text, nullable=False),
+    Column("expires_at", Float, nullable=False, index=True),
+)
+
+
+class SQLCompletionCache:
+    """Persistent tier in a SQLite or Postgres database, so cached completions
+    survive process restarts and Lambda cold starts.
+
+    The table lives in its own metadata and is created on first use.
+    """
+
+    def __init__(self, database_url: str, ttl: float, clock: Callable[[], float] = time.time):
+        self.database_url = get_async_database_url(database_url)
+        self.ttl = ttl
+        self._clock = clock
+        self._engine: AsyncEngine | None = None
+
+    async def _get_engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_async_engine(self.database_url)
+            async with self._engine.begin() as conn:
+                await conn.run_sync(completion_cache_metadata.create_all)
+        return self._engine
+
+    async def get(self, key: str) -> str | None:
+        engine = await self._get_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(completion_cache_table.c.response)
+                .where(completion_cache_table.c.key == key)
+                .where(completion_cache_table.c.expires_at > self._clock())
+            )
+            return result.scalar_one_or_none()
+
+    async def set(self, key: str, value: str) -> None:
+        engine = await self._get_engine()
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        values = {"key": key, "response": value, "expires_at": self._clock() + self.ttl}
+        statement = insert(completion_cache_table).values(**values)
+        statement = statement.on_conflict_do_update(index_elements=["key"], set_={"response": value, "expires_at": values["expires_at"]})
+        async with engine.begin() as conn:
+            await conn.execute(statement)
+
+    async def purge_expired(self) -> None:
+        engine = await self._get_engine()
+        async with engine.begin() as conn:
+            await conn.execute(delete(completion_cache_table).where(completion_cache_table.c.expires_at <= self._clock()))
+
+    async def aclose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+
+class CompletionCache:
+    """Exact-match cache for chat completions.
+
+    Lookups go to the in-memory tier first and then to the optional
+    persistent tier; persistent hits are copied back into memory. Failures
+    of the persistent tier are logged and treated as misses so they never
+    fail a generation.
+    """
+
+    def __init__(self, memory: MemoryCompletionCache, persistent: SQLCompletionCache | None = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            try:
+                value = await self.persistent.get(key)
+            except Exception as e:
+                print(f"Error reading completion cache: {str(e)}")
+            if value is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                await self.persistent.set(key, value)
+            except Exception as e:
+                print(f"Error writing completion cache: {str(e)}")
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "persistent_hits": self.persistent_hits, "misses": self.misses, "size": len(self.memory)}
+
+    async def aclose(self) -> None:
+        if self.persistent is not None:
+            await self.persistent.aclose()
+
+
+completion_cache = CompletionCache(
+    MemoryCompletionCache(settings.COMPLETION_CACHE_MAX_ENTRIES, settings.COMPLETION_CACHE_TTL_SECONDS),
+    SQLCompletionCache(settings.COMPLETION_CACHE_DATABASE_URL, settings.COMPLETION_CACHE_TTL_SECONDS) if settings.COMPLETION_CACHE_DATABASE_URL else None,
+)
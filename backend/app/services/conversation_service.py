@@ -0,0 +1,71 @@
+from fastapi import Depends
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db.database import get_db, get_async_db
+from app.models.conversation import Conversation, ConversationMessage, insert_conversation
+from app.services.token_counter import count_tokens
+
+def new_message(conversation_id: int | None, role: str, content: str) -> ConversationMessage:
+    return ConversationMessage(conversation_id=conversation_id, role=role, content=content, token_count=count_tokens(content), summarized=False)
+
+
+class ConversationService:
+    def __init__(self, db: Session = Depends(get_db)):
+        self.db = db
+
+    def get_or_create_conversation(self, project_id: int) -> Conversation:
+        conversation = self.db.query(Conversation).filter(Conversation.project_id == project_id).first()
+        if not conversation:
+            # Concurrent first turns both get here: the later insert is skipped and reads the earlier one's row
+            self.db.execute(insert_conversation(self.db.get_bind().dialect.name).values(project_id=project_id, summary_token_count=0))
+            self.db.commit()
+            conversation = self.db.query(Conversation).filter(Conversation.project_id == project_id).one()
+        return conversation
+
+    def get_active_messages(self, conversation_id: int) -> list[ConversationMessage]:
+        return (
+            self.db.query(ConversationMessage)
+            .filter(ConversationMessage.conversation_id == conversation_id, ConversationMessage.summarized.is_(False))
+            .order_by(ConversationMessage.id)
+            .all()
+        )
+
+    def add_turn(self, conversation_id: int, message: str, reply: str, folded_message_ids: list[int], summary: str | None) -> None:
+        # A turn is stored in one transaction, with the messages folded into
+        # the summary on its way, so a failed turn leaves nothing behind
+        self.db.add_all([new_message(conversation_id, "user", message), new_message(conversation_id, "assistant", reply)])
+        if folded_message_ids:
+            self.db.query(ConversationMessage).filter(ConversationMessage.id.in_(folded_message_ids)).update({"summarized": True}, synchronize_session=False)
+            self.db.query(Conversation).filter(Conversation.id == conversation_id).update({"summary": summary, "summary_token_count": count_tokens(summary)})
+        self.db.commit()
+
+
+class AsyncConversationService:
+    def __init__(self, db: AsyncSession = Depends(get_async_db)):
+        self.db = db
+
+    async def get_or_create_conversation(self, project_id: int) -> Conversation:
+        query = select(Conversation).filter(Conversation.project_id == project_id)
+        conversation = (await self.db.execute(query)).scalars().first()
+        if not conversation:
+            # Concurrent first turns both get here: the later insert is skipped and reads the earlier one's row
+            await self.db.execute(insert_conversation(self.db.get_bind().dialect.name).values(project_id=project_id, summary_token_count=0))
+            await self.db.commit()
+            conversation = (await self.db.execute(query)).scalars().one()
+        return conversation
+
+    async def get_active_messages(self, conversation_id: int) -> list[ConversationMessage]:
+        result = await self.db.execute(
+            select(ConversationMessage)
+            .filter(ConversationMessage.conversation_id == conversation_id, ConversationMessage.summarized.is_(False))
+            .order_by(ConversationMessage.id)
+        )
+        return list(result.scalars().all())
+
+    async def add_turn(self, conversation_id: int, message: str, reply: str, folded_message_ids: list[int], summary: str | None) -> None:
+        self.db.add_all([new_message(conversation_id, "user", message), new_message(conversation_id, "assistant", reply)])
+        if folded_message_ids:
+            await self.db.execute(update(ConversationMessage).filter(ConversationMessage.id.in_(folded_message_ids)).values(summarized=True))
+            await self.db.execute(update(Conversation).filter(Conversation.id == conversation_id).values(summary=summary, summary_token_count=count_tokens(summary)))
+        await self.db.commit()
@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+firebase_config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config', 'firebase-adminsdk.json'))
+
+_firebase_app = None
+
+
+def get_firebase_app():
+    """Initializes the Firebase Admin SDK on first use instead of at import time."""
+    global _firebase_app
+    if _firebase_app is None:
+        import firebase_admin
+        from firebase_admin import credentials
+        _firebase_app = firebase_admin.initialize_app(credentials.Certificate(firebase_config_path))
+    return _firebase_app
+
+
+class InvalidFirebaseToken(Exception):
+    pass
+
+
+class PublicCertificates:
+    """Google's ID token signing certificates, kept fresh by a background task.
+
+    The first ``get_key`` waits for the initial fetch; after that lookups
+    only read the current key set while the task refetches it ahead of the
+    ``max-age`` the endpoint announces. Failed refreshes are retried and the
+    previous keys stay in use meanwhile. A ``kid`` that isn't in the set,
+    as after a key rotation, fetches it again right away, at most once per
+    ``min_refetch_interval`` seconds.
+    """
+
+    def __init__(self, url: str, default_max_age: float = 3600, retry_interval: float = 30, load_timeout: float = 10,
+                 min_refetch_interval: float = 60, clock: Callable[[], float] = time.monotonic):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.retry_interval = retry_interval
+        self.load_timeout = load_timeout
+        self.min_refetch_interval = min_refetch_interval
+        self._clock = clock
+        self._keys: dict = {}
+        self._loaded: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._refetch: asyncio.Task | None = None
+        self._refetch_after = 0.0
+        self._client: "httpx.AsyncClient | None" = None
+        self._closing: set[asyncio.Task] = set()
+        self.fetches = 0
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._discard_previous(loop)
+            self._loaded = asyncio.Event()
+            if self._keys:
+                self._loaded.set()
+            import httpx
+            self._client = httpx.AsyncClient(timeout=10)
+            self._task = loop.create_task(self._run())
+
+    def _discard_previous(self, loop: asyncio.AbstractEventLoop) -> None:
+        # The task and client left behind by a finished task or another event loop
+        if self._task is None:
+            return
+        task, client, task_loop = self._task, self._client, self._task.get_loop()
+        self._task = self._client = None
+        if task_loop is not loop and task_loop.is_running():
+            # Still alive in another thread, so stop them there
+            task_loop.call_soon_threadsafe(task.cancel)
+            asyncio.run_coroutine_threadsafe(self._close_client(client), task_loop)
+            return
+        if not task_loop.is_closed():
+            task.cancel()
+        closing = loop.create_task(self._close_client(client))
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_client(client: "httpx.AsyncClient") -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"Error closing the Firebase certificates client: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                max_age = await self.refresh()
+                # Refetch well before the keys go stale
+                delay = max(max_age * 0.8, 1)
+            except Exception as e:
+                print(f"Error fetching Firebase signing certificates: {str(e)}")
+                delay = self.retry_interval
+            await asyncio.sleep(delay)
+
+    async def refresh(self) -> float:
+        response = await self._client.get(self.url)
+        response.raise_for_status()
+        from jose import jwk
+        keys = {kid: jwk.construct(certificate, "RS256") for kid, certificate in response.json().items()}
+        match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+        max_age = float(match.group(1)) if match else self.default_max_age
+        self._keys = keys
+        self.fetches += 1
+        self._refetch_after = self._clock() + self.min_refetch_interval
+        self._loaded.set()
+        return max_age
+
+    async def get_key(self, kid: str):
+        self.start()
+        if not self._keys:
+            try:
+                await asyncio.wait_for(self._loaded.wait(), self.load_timeout)
+            except asyncio.TimeoutError:
+                raise InvalidFirebaseToken("Firebase signing certificates are not available.")
+        if kid not in self._keys:
+            await self._refetch_for_unknown_key()
+        return self._keys.get(kid)
+
+    async def _refetch_for_unknown_key(self) -> None:
+        # Concurrent lookups share one fetch; made up kids can't trigger more
+        # than one per min_refetch_interval
+        loop = asyncio.get_running_loop()
+        if self._refetch is None or self._refetch.done() or self._refetch.get_loop() is not loop:
+            if self._clock() < self._refetch_after:
+                return
+            self._refetch_after = self._clock() + self.min_refetch_interval
+            self._refetch = loop.create_task(self.refresh())
+        try:
+            await asyncio.shield(self._refetch)
+        except Exception as e:
+            print(f"Error fetching Firebase signing certificates: {str(e)}")
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            await self._client.aclose()
+        self._task = None
+
+
+class FirebaseTokenVerifier:
+    """Verifies Firebase ID tokens and caches the claims of verified tokens.
+
+    Performs the checks of ``firebase_admin.auth.verify_id_token`` against
+    the pre-fetched certificates. Verified claims are cached by token hash
+    until the token's ``exp``, so repeat requests skip the RSA signature check.
+    """
+
+    def __init__(self, certificates: PublicCertificates, max_entries: int, project_id: str | None = None, clock: Callable[[], float] = time.time):
+        self.certificates = certificates
+        self.max_entries = max_entries
+        self._project_id = project_id
+        self._clock = clock
+        self._verified: OrderedDict[str, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def project_id(self) -> str:
+        if self._project_id is None:
+            self._project_id = get_firebase_app().project_id
+        return self._project_id
+
+    async def verify(self, token: str) -> dict:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        claims = self._verified.get(key)
+        if claims is not None:
+            if claims["exp"] > self._clock():
+                self._verified.move_to_end(key)
+                self.hits += 1
+                return dict(claims)
+            del self._verified[key]
+        self.misses += 1
+
+        claims = await self._verify_signature(token)
+        self._verified[key] = claims
+        while len(self._verified) > self.max_entries:
+            self._verified.popitem(last=False)
+        return dict(claims)
+
+    async def _verify_signature(self, token: str) -> dict:
+        # jose is imported on the first verification, like firebase_admin
+        from jose import JWTError, jwt
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise InvalidFirebaseToken(str(e))
+        if header.get("alg") != "RS256":
+            raise InvalidFirebaseToken('Firebase ID token has incorrect algorithm. Expected "RS256".')
+        public_key = await self.certificates.get_key(header.get("kid"))
+        if public_key is None:
+            raise InvalidFirebaseToken('Firebase ID token has an unknown "kid" claim.')
+        try:
+            claims = jwt.decode(
+                token,
+                public_key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=f"https://securetoken.google.com/{self.project_id}",
+            )
+        except JWTError as e:
+            raise InvalidFirebaseToken(str(e))
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidFirebaseToken('Firebase ID token has an invalid "sub" claim.')
+        if claims.get("iat", 0) > self._clock():
+            raise InvalidFirebaseToken("Firebase ID token was issued in the future.")
+        claims["uid"] = subject
+        return claims
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._verified), "certificate_fetches": self.certificates.fetches}
+
+    async def aclose(self) -> None:
+        await self.certificates.aclose()
+
+
+firebase_tokens = FirebaseTokenVerifier(PublicCertificates(settings.FIREBASE_CERTS_URL), settings.FIREBASE_TOKEN_CACHE_MAX_ENTRIES)
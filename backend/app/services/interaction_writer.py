@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, SessionLocal
+from app.models.ai_interaction import AIInteraction, interaction_body_rows
+from app.models.interaction_blob import insert_blobs
+from app.schemas.ai_interaction import AIInteractionCreate
+
+# ids are assigned in VALUES order, so sorted they line up with the rows
+# (see insert_ai_interactions in app.services.ai_interaction_service)
+insert_interaction_ids = insert(AIInteraction).returning(AIInteraction.id)
+
+# Errors of the rows themselves, e.g. a project deleted while its interactions
+# were buffered: retrying won't help. Anything else, such as a lost
+# connection, is taken to be the database's and retried.
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+class InteractionWriter:
+    """Write-behind buffer for AI interactions.
+
+    ``enqueue`` only appends to an in-memory buffer, so the AI endpoints can
+    answer without waiting for the database. A background task saves the
+    buffer with one bulk INSERT per ``batch_size`` rows, either once a batch
+    is full or every ``flush_interval`` seconds. Rows that fail to save
+    because of the database are put back and retried on the next flush; once
+    ``max_queue`` rows are waiting the oldest ones are dropped. A batch that
+    fails because of its rows (``ROW_ERRORS``) is split in halves until each
+    bad row has failed on its own, and those rows are rejected.
+
+    ``save`` queues an interaction and waits for its id: it wakes the task
+    right away, and the interactions saved while a flush is running share
+    the next one's INSERT.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, session_factory=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        # Defaults to the app's async or sync sessions, following settings.USE_ASYNC_DB
+        self.session_factory = session_factory
+        # Rows with the future of whoever waits for their id, if anyone does
+        self._buffer: list[tuple[dict, asyncio.Future | None]] = []
+        # Event loop primitives, made for the loop that runs the flush task
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        self._lock: asyncio.Lock | None = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def enqueue(self, user_id: int, project_id: int, interaction: AIInteractionCreate, waiter: asyncio.Future | None = None) -> None:
+        # created_at is taken now, not when the row is eventually written
+        self._buffer.append(({**interaction.model_dump(), "user_id": user_id, "project_id": project_id, "created_at": datetime.datetime.utcnow()}, waiter))
+        self._trim()
+        self._ensure_running()
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def save(self, user_id: int, project_id: int, interaction: AIInteractionCreate) -> int | None:
+        """Queues the interaction and returns its id once saved, None if that takes over ``flush_interval``.
+
+        Raises the error of an interaction rejected by the database.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self.enqueue(user_id, project_id, interaction, waiter)
+        self._wake.set()
+        try:
+            # Shielded, a late id is still set on the future, which nobody reads
+            return await asyncio.wait_for(asyncio.shield(waiter), self.flush_interval)
+        except asyncio.TimeoutError:
+            # Nor a late rejection, which would otherwise be logged as never retrieved
+            waiter.add_done_callback(lambda future: future.cancelled() or future.exception())
+            return None
+        except asyncio.CancelledError:
+            # The waiter is only cancelled when its row is dropped from a full queue
+            if not waiter.cancelled():
+                raise
+            return None
+
+    def _trim(self) -> None:
+        overflow = len(self._buffer) - self.max_queue
+        if overflow > 0:
+            print(f"Interaction write queue is full, dropping {overflow} interactions")
+            for _, waiter in self._buffer[:overflow]:
+                if waiter is not None:
+                    waiter.cancel()
+            del self._buffer[:overflow]
+            self.dropped += overflow
+
+    def _bind_loop(self) -> None:
+        # An Event or Lock only works on one loop: a new loop (a test's, a
+        # Lambda invocation's) gets its own and a new flush task
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = None
+
+    def _ensure_running(self) -> None:
+        self._bind_loop()
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._bind_loop()
+        async with self._lock:
+            while self._buffer:
+                pending = [self._buffer[:self.batch_size]]
+                del self._buffer[:self.batch_size]
+                while pending:
+                    entries = pending.pop(0)
+                    start = time.perf_counter()
+                    try:
+                        ids = await self._insert([row for row, _ in entries])
+                    except asyncio.CancelledError:
+                        self._buffer[:0] = entries + [entry for chunk in pending for entry in chunk]
+                        raise
+                    except ROW_ERRORS as e:
+                        self.failed_flushes += 1
+                        if len(entries) > 1:
+                            half = len(entries) // 2
+                            pending[:0] = [entries[:half], entries[half:]]
+                        else:
+                            self._reject(entries[0], e)
+                        continue
+                    except Exception as e:
+                        print(f"Error saving AI interactions: {str(e)}")
+                        self.failed_flushes += 1
+                        self._buffer[:0] = entries + [entry for chunk in pending for entry in chunk]
+                        self._trim()
+                        return
+                    elapsed = time.perf_counter() - start
+                    for (_, waiter), interaction_id in zip(entries, ids):
+                        if waiter is not None and not waiter.done() and not waiter.get_loop().is_closed():
+                            waiter.set_result(interaction_id)
+                    self.flushes += 1
+                    self.flushed += len(entries)
+                    self.last_flush_seconds = elapsed
+                    self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                    self.total_flush_seconds += elapsed
+
+    def _reject(self, entry: tuple[dict, asyncio.Future | None], error: Exception) -> None:
+        row, waiter = entry
+        print(f"Rejected AI interaction of user {row['user_id']} in project {row['project_id']}: {str(error)}")
+        self.rejected += 1
+        if waiter is not None and not waiter.done() and not waiter.get_loop().is_closed():
+            waiter.set_exception(error)
+
+    async def _insert(self, rows: list[dict]) -> list[int]:
+        if self.session_factory is None and not settings.USE_ASYNC_DB:
+            return await run_in_threadpool(self._insert_sync, rows)
+        blobs, rows = interaction_body_rows(rows)
+        async with (self.session_factory or AsyncSessionLocal)() as db:
+            await db.execute(insert_blobs(db.get_bind().dialect.name), blobs)
+            ids = (await db.scalars(insert_interaction_ids, rows)).all()
+            await db.commit()
+        return sorted(ids)
+
+    def _insert_sync(self, rows: list[dict]) -> list[int]:
+        blobs, rows = interaction_body_rows(rows)
+        with SessionLocal() as db:
+            db.execute(insert_blobs(db.get_bind().dialect.name), blobs)
+            ids = db.scalars(insert_interaction_ids, rows).all()
+            db.commit()
+        return sorted(ids)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._buffer),
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+
+class FlushInteractionsMiddleware:
+    """Flushes the interaction buffer once a response has been fully sent.
+
+    Used on Lambda, where the environment is frozen between invocations and
+    the background flush would not run until the next request, if ever.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                await interaction_writer.flush()
+
+
+interaction_writer = InteractionWriter(settings.INTERACTION_WRITE_BATCH_SIZE, settings.INTERACTION_WRITE_FLUSH_SECONDS, settings.INTERACTION_WRITE_MAX_QUEUE)
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+
+class OpenAIClientRegistry:
+    """Long-lived ``AsyncOpenAI`` clients, one per API key.
+
+    All clients share a single httpx connection pool, so connections to the
+    OpenAI API are kept alive and reused across requests and users instead
+    of paying a TLS handshake per generation. The API key travels in the
+    request headers of each client, which is why sharing the pool is safe.
+    The number of per-key clients is bounded; the least recently used one
+    is dropped when the limit is reached.
+    """
+
+    def __init__(self, max_clients: int = None):
+        self.max_clients = max_clients or settings.OPENAI_MAX_CLIENTS
+        self._clients: OrderedDict[str, "AsyncOpenAI"] = OrderedDict()
+        self._http_client: "httpx.AsyncClient | None" = None
+
+    def _get_http_client(self) -> "httpx.AsyncClient":
+        # openai and httpx are imported on first use, they add noticeably to cold starts
+        import httpx
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=5.0),
+                follow_redirects=True,
+            )
+        return self._http_client
+
+    def get(self, api_key: str) -> "AsyncOpenAI":
+        client = self._clients.get(api_key)
+        if client is not None:
+            self._clients.move_to_end(api_key)
+            return client
+
+        from openai import AsyncOpenAI
+        # Retries are the upstream limiter's (app.services.upstream_limiter), which honor the limits
+        client = AsyncOpenAI(api_key=api_key, base_url=settings.OPENAI_BASE_URL, http_client=self._get_http_client(), max_retries=0)
+        self._clients[api_key] = client
+        if len(self._clients) > self.max_clients:
+            # Evicted clients hold no connections of their own, nothing to close
+            self._clients.popitem(last=False)
+        return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    async def aclose(self) -> None:
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+openai_clients = OpenAIClientRegistry()
@@ -0,0 +1,128 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.security import hash_password, verify_and_update_password
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated pool with admission control.
+
+    The pool is separate from the threadpool that serves requests, so a burst
+    of signups or logins can't starve other endpoints. At most
+    ``max_pending`` operations may be queued or running; beyond that callers
+    get a 503 with Retry-After instead of an ever longer wait. Both async
+    callers and sync services (already on a threadpool thread) are supported.
+    """
+
+    def __init__(self, workers: int, max_pending: int, use_processes: bool = True):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashes = 0
+        self.last_queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.total_queue_wait_seconds = 0.0
+        self.max_hash_seconds = 0.0
+        self.total_hash_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    # spawn, because forking a process that runs an event loop and threads isn't safe
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _submit(self, fn, *args) -> tuple[Future, float]:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many password operations in progress, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future, time.time()
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def _record(self, submitted_at: float, outcome: tuple) -> object:
+        result, started_at, hash_seconds = outcome
+        queue_wait = max(started_at - submitted_at, 0.0)
+        with self._lock:
+            self.completed += 1
+            self.last_queue_wait_seconds = queue_wait
+            self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, queue_wait)
+            self.total_queue_wait_seconds += queue_wait
+            self.max_hash_seconds = max(self.max_hash_seconds, hash_seconds)
+            self.total_hash_seconds += hash_seconds
+        return result
+
+    def _record_verification(self, submitted_at: float, outcome: tuple) -> tuple[bool, str | None]:
+        verified, new_hash = self._record(submitted_at, outcome)
+        if verified and new_hash is not None:
+            with self._lock:
+                self.rehashes += 1
+        return verified, new_hash
+
+    async def hash(self, password: str) -> str:
+        future, submitted_at = self._submit(hash_password, password)
+        return self._record(submitted_at, await asyncio.wrap_future(future))
+
+    def hash_sync(self, password: str) -> str:
+        future, submitted_at = self._submit(hash_password, password)
+        return self._record(submitted_at, future.result())
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """Returns whether the password matches and, if the hash uses outdated settings, a new hash for it."""
+        future, submitted_at = self._submit(verify_and_update_password, password, hashed_password)
+        return self._record_verification(submitted_at, await asyncio.wrap_future(future))
+
+    def verify_and_update_sync(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        future, submitted_at = self._submit(verify_and_update_password, password, hashed_password)
+        return self._record_verification(submitted_at, future.result())
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashes": self.rehashes,
+                "last_queue_wait_seconds": self.last_queue_wait_seconds,
+                "max_queue_wait_seconds": self.max_queue_wait_seconds,
+                "avg_queue_wait_seconds": self.total_queue_wait_seconds / self.completed if self.completed else 0.0,
+                "max_hash_seconds": self.max_hash_seconds,
+                "avg_hash_seconds": self.total_hash_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING, settings.PASSWORD_HASH_USE_PROCESSES)
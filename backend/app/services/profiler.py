@@ -0,0 +1,250 @@
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Callable
+from app.core.config import settings
+
+
+def _frame_label(frame) -> str:
+    filename = frame.f_code.co_filename
+    if "site-packages" + os.sep in filename:
+        filename = filename.rsplit("site-packages" + os.sep, 1)[1]
+    elif os.sep + "app" + os.sep in filename:
+        filename = "app" + os.sep + filename.rsplit(os.sep + "app" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{frame.f_code.co_qualname} ({filename})".replace(";", ":")
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfile:
+    """Statistical profile of a single request.
+
+    A sampler thread records the stack of the event loop thread whenever it
+    runs one of the request's tasks, and of the threadpool threads that run
+    the request's sync service calls. Samples where none of them is busy are
+    recorded as ``<awaiting>``, i.e. time spent waiting on I/O (the database,
+    OpenAI) or for the loop. Stacks are kept in the collapsed format that
+    flamegraph.pl, speedscope and friends read.
+    """
+
+    def __init__(self, method: str, path: str, interval: float):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route: str | None = None
+        self.status: int | None = None
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.tasks: weakref.WeakSet = weakref.WeakSet()
+        self.threads: dict[int, int] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.tasks.add(asyncio.current_task())
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_until_stopped, name=f"profile-{self.id[:8]}", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _sample_until_stopped(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        busy = False
+        if asyncio.current_task(self._loop) in self.tasks and self._loop_thread in frames:
+            self.stacks[_collapse(frames[self._loop_thread])] += 1
+            busy = True
+        for thread_id in list(self.threads):
+            if thread_id in frames:
+                self.stacks[_collapse(frames[thread_id])] += 1
+                busy = True
+        if not busy:
+            self.stacks["<awaiting>"] += 1
+        self.samples += 1
+
+    def enter_thread(self) -> None:
+        thread_id = threading.get_ident()
+        self.threads[thread_id] = self.threads.get(thread_id, 0) + 1
+
+    def exit_thread(self) -> None:
+        thread_id = threading.get_ident()
+        self.threads[thread_id] -= 1
+        if not self.threads[thread_id]:
+            del self.threads[thread_id]
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration,
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+        }
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+
+def profiled_thread(fn: Callable) -> Callable:
+    """Wraps ``fn`` for the threadpool so the request's profile samples the thread running it.
+
+    Returns ``fn`` itself when the request isn't being profiled.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return fn
+
+    def run(*args, **kwargs):
+        profile.enter_thread()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.exit_thread()
+
+    return run
+
+
+class Profiler:
+    """Decides which requests are profiled and keeps their reports.
+
+    A request is profiled when it carries the profiling token in the
+    ``X-Profile`` header, or while an admin has armed the profiler for the
+    next requests (optionally only those under a path prefix). The most
+    recent ``max_reports`` reports are kept in memory and, with a
+    ``directory``, written there as ``<id>.collapsed`` files.
+    """
+
+    def __init__(self, interval: float, max_reports: int, directory: str | None = None):
+        self.interval = interval
+        self.max_reports = max_reports
+        self.directory = directory
+        self.reports: OrderedDict[str, RequestProfile] = OrderedDict()
+        self.armed_requests = 0
+        self.armed_path_prefix: str | None = None
+        self._active = 0
+        self._previous_task_factory = None
+
+    def arm(self, requests: int, path_prefix: str | None = None) -> None:
+        self.armed_requests = requests
+        self.armed_path_prefix = path_prefix
+
+    def should_profile(self, path: str, header: str | None, token: str) -> bool:
+        if header is not None:
+            return hmac.compare_digest(header.encode(), token.encode())
+        if self.armed_requests > 0 and (self.armed_path_prefix is None or path.startswith(self.armed_path_prefix)):
+            self.armed_requests -= 1
+            return True
+        return False
+
+    def _task_factory(self, loop, coro, **kwargs):
+        # Tasks spawned by a profiled request (e.g. a streaming body) belong to its profile
+        if self._previous_task_factory is not None:
+            task = self._previous_task_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.tasks.add(task)
+        return task
+
+    def begin(self, profile: RequestProfile) -> None:
+        loop = asyncio.get_running_loop()
+        if self._active == 0:
+            self._previous_task_factory = loop.get_task_factory()
+            loop.set_task_factory(self._task_factory)
+        self._active += 1
+        profile.start()
+
+    def end(self, profile: RequestProfile) -> None:
+        profile.stop()
+        self._active -= 1
+        if self._active == 0:
+            asyncio.get_running_loop().set_task_factory(self._previous_task_factory)
+            self._previous_task_factory = None
+        self.reports[profile.id] = profile
+        while len(self.reports) > self.max_reports:
+            self.reports.popitem(last=False)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, f"{profile.id}.collapsed"), "w") as f:
+                    f.write(profile.collapsed())
+            except OSError as e:
+                print(f"Error writing profile {profile.id}: {str(e)}")
+
+
+class ProfilingMiddleware:
+    """Profiles the requests selected by the profiler and reports the profile id in ``X-Profile-Id``.
+
+    Only installed when a profiling token is configured, so unprofiled
+    deployments don't pay for it at all.
+    """
+
+    def __init__(self, app, token: str):
+        self.app = app
+        self.token = token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = next((value.decode() for name, value in scope["headers"] if name == b"x-profile"), None)
+        if not profiler.should_profile(scope["path"], header, self.token):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], profiler.interval)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = current_profile.set(profile)
+        profiler.begin(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.end(profile)
+            current_profile.reset(token)
+            profile.route = getattr(scope.get("route"), "path", None)
+
+
+profiler = Profiler(settings.PROFILING_INTERVAL_SECONDS, settings.PROFILING_MAX_REPORTS, settings.PROFILING_DIR)
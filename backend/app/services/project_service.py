@@ -1,10 +1,87 @@
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload
+from app.db.database import get_db, get_async_db
+from app.db.pagination import keyset_page
+from app.db.projection import columns_for, row_dicts
 from app.models.project import Project
 from app.models.ai_interaction import AIInteraction
-from app.schemas.project import ProjectCreate, ProjectUpdate
+from app.models.conversation import Conversation, ConversationMessage
+from app.schemas.project import ProjectCreate, ProjectUpdate, Project as ProjectSchema
 from app.schemas.ai_interaction import AIInteractionCreate
+from app.services.ai_interaction_service import AIInteractionService, AsyncAIInteractionService, interaction_response_columns, interaction_response_options
+
+# Loader options for reads serialized with schemas.Project, which has no relationships
+project_response_options = (raiseload("*"),)
+
+# The list endpoint selects just these columns and encodes the rows directly
+project_response_columns = columns_for(Project, ProjectSchema)
+
+# Ownership-scoped statements: the owner check is part of the WHERE clause, so
+# reading, changing or deleting someone's project takes a single round trip.
+# Only when nothing matched is the project looked up again, to answer 404 or 403.
+
+def owned_project(user_id: int, project_id: int):
+    return select(Project).options(*project_response_options).filter(Project.id == project_id, Project.user_id == user_id)
+
+def owned_project_id(user_id: int, project_id: int):
+    return select(Project.id).filter(Project.id == project_id, Project.user_id == user_id)
+
+def update_owned_project(user_id: int, project_id: int, values: dict):
+    return (
+        update(Project)
+        .where(Project.id == project_id, Project.user_id == user_id)
+        .values(**values)
+        .returning(Project)
+        # The RETURNING row replaces whatever the session already holds for the project
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+
+def detach_owned_project_interactions(user_id: int, project_id: int):
+    # Interactions outlive their project with project_id set to NULL, as the ORM delete did
+    return (
+        update(AIInteraction)
+        .where(AIInteraction.project_id == owned_project_id(user_id, project_id).scalar_subquery())
+        .values(project_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+def delete_project_conversation_messages(project_id: int):
+    # A project's requirement conversation goes with it, messages first for the foreign keys
+    return (
+        delete(ConversationMessage)
+        .where(ConversationMessage.conversation_id.in_(select(Conversation.id).where(Conversation.project_id == project_id)))
+        .execution_options(synchronize_session=False)
+    )
+
+def delete_project_conversation(project_id: int):
+    return delete(Conversation).where(Conversation.project_id == project_id).execution_options(synchronize_session=False)
+
+def delete_owned_project(user_id: int, project_id: int):
+    return delete(Project).where(Project.id == project_id, Project.user_id == user_id).execution_options(synchronize_session=False)
+
+# Versions of the list endpoints: cheap aggregates that change whenever the
+# listed rows do, hashed into their ETags (see app.api.conditional)
+
+def user_projects_version(user_id: int):
+    # The count catches deletions, max(updated_at) every create and update
+    return select(func.count(Project.id), func.max(Project.id), func.max(Project.updated_at)).filter(Project.user_id == user_id)
+
+def owned_project_interactions_version(user_id: int, project_id: int):
+    # No row unless the user owns the project, so the owner check comes for free
+    return (
+        select(func.count(AIInteraction.id), func.max(AIInteraction.id), func.max(AIInteraction.created_at))
+        .select_from(Project)
+        .outerjoin(AIInteraction, AIInteraction.project_id == Project.id)
+        .filter(Project.id == project_id, Project.user_id == user_id)
+        .group_by(Project.id)
+    )
+
+def project_access_error(project_exists: bool, action: str) -> HTTPException:
+    if not project_exists:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to {action} this project")
 
 class ProjectService:
     def __init__(self, db: Session = Depends(get_db)):
@@ -18,10 +95,16 @@ class ProjectService:
         return db_project
 
     def get_project(self, project_id: int) -> Project:
-        return self.db.query(Project).filter(Project.id == project_id).first()
+        return self.db.query(Project).options(*project_response_options).filter(Project.id == project_id).first()
+
+    def get_user_projects(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[Project]:
+        return list(self.db.scalars(keyset_page(select(Project).options(*project_response_options).filter(Project.user_id == user_id), Project, limit, cursor)))
 
-    def get_user_projects(self, user_id: int) -> list[Project]:
-        return self.db.query(Project).filter(Project.user_id == user_id).all()
+    def get_user_project_rows(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        return row_dicts(self.db.execute(keyset_page(select(*project_response_columns).filter(Project.user_id == user_id), Project, limit, cursor)))
+
+    def get_user_projects_version(self, user_id: int) -> tuple:
+        return tuple(self.db.execute(user_projects_version(user_id)).one())
 
     def update_project(self, project_id: int, project: ProjectUpdate) -> Project:
         db_project = self.get_project(project_id)
@@ -36,17 +119,167 @@ class ProjectService:
     def delete_project(self, project_id: int) -> bool:
         db_project = self.get_project(project_id)
         if db_project:
+            self.db.execute(delete_project_conversation_messages(project_id))
+            self.db.execute(delete_project_conversation(project_id))
             self.db.delete(db_project)
             self.db.commit()
             return True
         return False
 
-    def create_ai_interaction(self, user_id: int, project_id: int, interaction: AIInteractionCreate) -> AIInteraction:
-        db_interaction = AIInteraction(**interaction.dict(), user_id=user_id, project_id=project_id)
-        self.db.add(db_interaction)
+    def _access_error(self, project_id: int, action: str) -> HTTPException:
+        return project_access_error(self.db.scalar(select(Project.id).filter(Project.id == project_id)) is not None, action)
+
+    def check_project_owner(self, user_id: int, project_id: int, action: str = "access") -> None:
+        if self.db.scalar(owned_project_id(user_id, project_id)) is None:
+            raise self._access_error(project_id, action)
+
+    def get_user_project(self, user_id: int, project_id: int) -> Project:
+        db_project = self.db.scalar(owned_project(user_id, project_id))
+        if db_project is None:
+            raise self._access_error(project_id, "access")
+        return db_project
+
+    def update_user_project(self, user_id: int, project_id: int, project: ProjectUpdate) -> Project:
+        values = project.model_dump(exclude_unset=True)
+        if not values:
+            return self.get_user_project(user_id, project_id)
+        db_project = self.db.scalar(update_owned_project(user_id, project_id, values))
+        if db_project is None:
+            self.db.rollback()
+            raise self._access_error(project_id, "modify")
+        # Detached before the commit would expire it, the RETURNING row is current
+        self.db.expunge(db_project)
         self.db.commit()
-        self.db.refresh(db_interaction)
-        return db_interaction
+        return db_project
+
+    def delete_user_project(self, user_id: int, project_id: int) -> bool:
+        # Someone else's project is left alone: nothing is committed unless the project itself was deleted
+        self.db.execute(detach_owned_project_interactions(user_id, project_id))
+        self.db.execute(delete_project_conversation_messages(project_id))
+        self.db.execute(delete_project_conversation(project_id))
+        if self.db.execute(delete_owned_project(user_id, project_id)).rowcount == 0:
+            self.db.rollback()
+            raise self._access_error(project_id, "delete")
+        self.db.commit()
+        return True
+
+    def create_ai_interaction(self, user_id: int, project_id: int, interaction: AIInteractionCreate) -> AIInteraction:
+        return AIInteractionService(self.db).create_ai_interaction(user_id, project_id, interaction)
+
+    def create_ai_interactions(self, user_id: int, project_id: int, interactions: list[AIInteractionCreate]) -> list[AIInteraction]:
+        return AIInteractionService(self.db).create_ai_interactions(user_id, project_id, interactions)
+
+    def get_project_interactions(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return list(self.db.scalars(statement))
+
+    def get_project_interaction_rows(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return row_dicts(self.db.execute(statement))
+
+    def get_project_interactions_version(self, user_id: int, project_id: int, action: str = "view interactions for") -> tuple:
+        version = self.db.execute(owned_project_interactions_version(user_id, project_id)).first()
+        if version is None:
+            raise self._access_error(project_id, action)
+        return tuple(version)
+
+class AsyncProjectService:
+    def __init__(self, db: AsyncSession = Depends(get_async_db)):
+        self.db = db
+
+    async def create_project(self, user_id: int, project: ProjectCreate) -> Project:
+        db_project = Project(**project.model_dump(), user_id=user_id)
+        self.db.add(db_project)
+        await self.db.commit()
+        await self.db.refresh(db_project)
+        return db_project
+
+    async def get_project(self, project_id: int) -> Project:
+        result = await self.db.execute(select(Project).options(*project_response_options).filter(Project.id == project_id))
+        return result.scalars().first()
+
+    async def get_user_projects(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[Project]:
+        result = await self.db.execute(keyset_page(select(Project).options(*project_response_options).filter(Project.user_id == user_id), Project, limit, cursor))
+        return list(result.scalars().all())
+
+    async def get_user_project_rows(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        return row_dicts(await self.db.execute(keyset_page(select(*project_response_columns).filter(Project.user_id == user_id), Project, limit, cursor)))
+
+    async def get_user_projects_version(self, user_id: int) -> tuple:
+        return tuple((await self.db.execute(user_projects_version(user_id))).one())
+
+    async def update_project(self, project_id: int, project: ProjectUpdate) -> Project:
+        db_project = await self.get_project(project_id)
+        if db_project:
+            update_data = project.model_dump(exclude_unset=True)
+            for key, value in update_data.items():
+                setattr(db_project, key, value)
+            await self.db.commit()
+            await self.db.refresh(db_project)
+        return db_project
+
+    async def delete_project(self, project_id: int) -> bool:
+        db_project = await self.get_project(project_id)
+        if db_project:
+            await self.db.execute(delete_project_conversation_messages(project_id))
+            await self.db.execute(delete_project_conversation(project_id))
+            await self.db.delete(db_project)
+            await self.db.commit()
+            return True
+        return False
+
+    async def _access_error(self, project_id: int, action: str) -> HTTPException:
+        return project_access_error(await self.db.scalar(select(Project.id).filter(Project.id == project_id)) is not None, action)
+
+    async def check_project_owner(self, user_id: int, project_id: int, action: str = "access") -> None:
+        if await self.db.scalar(owned_project_id(user_id, project_id)) is None:
+            raise await self._access_error(project_id, action)
+
+    async def get_user_project(self, user_id: int, project_id: int) -> Project:
+        db_project = await self.db.scalar(owned_project(user_id, project_id))
+        if db_project is None:
+            raise await self._access_error(project_id, "access")
+        return db_project
+
+    async def update_user_project(self, user_id: int, project_id: int, project: ProjectUpdate) -> Project:
+        values = project.model_dump(exclude_unset=True)
+        if not values:
+            return await self.get_user_project(user_id, project_id)
+        db_project = await self.db.scalar(update_owned_project(user_id, project_id, values))
+        if db_project is None:
+            await self.db.rollback()
+            raise await self._access_error(project_id, "modify")
+        await self.db.commit()
+        return db_project
+
+    async def delete_user_project(self, user_id: int, project_id: int) -> bool:
+        # Someone else's project is left alone: nothing is committed unless the project itself was deleted
+        await self.db.execute(detach_owned_project_interactions(user_id, project_id))
+        await self.db.execute(delete_project_conversation_messages(project_id))
+        await self.db.execute(delete_project_conversation(project_id))
+        if (await self.db.execute(delete_owned_project(user_id, project_id))).rowcount == 0:
+            await self.db.rollback()
+            raise await self._access_error(project_id, "delete")
+        await self.db.commit()
+        return True
+
+    async def create_ai_interaction(self, user_id: int, project_id: int, interaction: AIInteractionCreate) -> AIInteraction:
+        return await AsyncAIInteractionService(self.db).create_ai_interaction(user_id, project_id, interaction)
+
+    async def create_ai_interactions(self, user_id: int, project_id: int, interactions: list[AIInteractionCreate]) -> list[AIInteraction]:
+        return await AsyncAIInteractionService(self.db).create_ai_interactions(user_id, project_id, interactions)
+
+    async def get_project_interactions(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[AIInteraction]:
+        statement = keyset_page(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        result = await self.db.execute(statement)
+        return list(result.scalars().all())
+
+    async def get_project_interaction_rows(self, project_id: int, limit: int | None = None, cursor: str | None = None) -> list[dict]:
+        statement = keyset_page(select(*interaction_response_columns).filter(AIInteraction.project_id == project_id), AIInteraction, limit, cursor)
+        return row_dicts(await self.db.execute(statement))
 
-    def get_project_interactions(self, project_id: int) -> list[AIInteraction]:
-        return self.db.query(AIInteraction).filter(AIInteraction.project_id == project_id).all()
\ No newline at end of file
+    async def get_project_interactions_version(self, user_id: int, project_id: int, action: str = "view interactions for") -> tuple:
+        version = (await self.db.execute(owned_project_interactions_version(user_id, project_id))).first()
+        if version is None:
+            raise await self._access_error(project_id, action)
+        return tuple(version)
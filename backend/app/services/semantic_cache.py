@@ -0,0 +1,284 @@
+import asyncio
+import fcntl
+import hashlib
+import importlib
+import os
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Protocol
+import numpy as np
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.models.ai_interaction import AIInteraction
+
+# Prompts embedded per call while an index catches up with the stored interactions
+EMBED_BATCH_SIZE = 256
+# Ids below the newest indexed one that a catch-up reads again: they can
+# belong to transactions that were still uncommitted when it last looked
+RESCAN_IDS = 1024
+
+
+class Embedder(Protocol):
+    """Turns texts into the rows of a float32 matrix of unit vectors.
+
+    ``name`` and ``dimensions`` identify the vector space: persisted indexes
+    of another embedder are never mixed with this one's.
+    """
+
+    name: str
+    dimensions: int
+
+    async def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # All-zero rows (nothing to embed) stay zero and match nothing
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class HashingEmbedder:
+    """Deterministic local embedder: the lower-cased words and character
+    trigrams of a text are hashed into ``dimensions`` signed buckets.
+
+    Needs no model or network and gives the same vectors in every process,
+    so it works for tests and as a baseline. Near-duplicates (reworded
+    whitespace, punctuation, a changed word or two) score close to 1; it has
+    no notion of synonyms.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        joined = f" {' '.join(words)} "
+        return words + [joined[i:i + 3] for i in range(len(joined) - 2)]
+
+    def _embed_one(self, text: str, row: np.ndarray) -> None:
+        for feature in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            row[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for text, row in zip(texts, matrix):
+            self._embed_one(text, row)
+        return normalize_rows(matrix)
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        # Pure Python hashing, kept off the event loop
+        return await run_in_threadpool(self._embed, texts)
+
+
+def load_embedder(path: str) -> Embedder:
+    # "package.module:Class", instantiated without arguments
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class SemanticIndex:
+    """Prompt embeddings of one project's interactions, one row per interaction id.
+
+    ``last_id`` is the newest interaction indexed; ``add`` skips the ids
+    that are already in, whatever their order. With a ``path`` the rows are appended to
+    ``<path>.index``, one record of id and vector each, which is
+    memory-mapped: a restarted process pages the index in on demand instead
+    of re-embedding every prompt. Processes sharing the directory take turns
+    on the file with ``flock`` and skip the rows another one appended first.
+    Without a path the rows live in a growable in-memory buffer.
+    """
+
+    def __init__(self, dimensions: int, path: str | None = None):
+        self.dimensions = dimensions
+        self.path = path
+        self._record = np.dtype([("id", np.int64), ("vector", np.float32, (dimensions,))])
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self._last_id = 0
+        self.lock = asyncio.Lock()
+        if path is not None:
+            with self._locked():
+                self._map()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def ids_above(self, floor: int) -> list[int]:
+        ids = self._ids[:self._count]
+        return ids[ids > floor].tolist()
+
+    @contextmanager
+    def _locked(self):
+        with open(f"{self.path}.index", "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self) -> None:
+        # Called with the file locked
+        index_path = f"{self.path}.index"
+        size = os.path.getsize(index_path)
+        rows = size // self._record.itemsize
+        # Drop a record only half written by a crashed process, later appends must stay aligned
+        if size != rows * self._record.itemsize:
+            os.truncate(index_path, rows * self._record.itemsize)
+        if rows != self._count:
+            records = np.memmap(index_path, dtype=self._record, mode="r", shape=(rows,))
+            self._vectors, self._ids = records["vector"], records["id"]
+            self._last_id = int(self._ids.max()) if rows else 0
+        self._count = rows
+
+    def add(self, ids: list[int], vectors: np.ndarray) -> None:
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.path is not None:
+            records = np.empty(len(ids), dtype=self._record)
+            records["id"], records["vector"] = ids, vectors
+            with self._locked() as f:
+                # Another process may have indexed these interactions since this one last looked
+                self._map()
+                f.write(records[~np.isin(records["id"], self._ids[:self._count])].tobytes())
+                f.flush()
+                self._map()
+            return
+        new = ~np.isin(ids, self._ids[:self._count])
+        ids, vectors = np.asarray(ids, dtype=np.int64)[new], vectors[new]
+        if not len(ids):
+            return
+        needed = self._count + len(ids)
+        if needed > len(self._ids):
+            # Doubling keeps appends amortized O(1) per row
+            capacity = max(needed, 2 * len(self._ids), 64)
+            grown_vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            grown_vectors[:self._count] = self._vectors[:self._count]
+            grown_ids = np.zeros(capacity, dtype=np.int64)
+            grown_ids[:self._count] = self._ids[:self._count]
+            self._vectors, self._ids = grown_vectors, grown_ids
+        self._vectors[self._count:needed] = vectors
+        self._ids[self._count:needed] = ids
+        self._count = needed
+        self._last_id = max(self._last_id, int(ids.max()))
+
+    def search(self, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Best matching id and its cosine similarity for every row of ``queries``, in one matrix product."""
+        if not self._count:
+            return np.zeros(len(queries), dtype=np.int64), np.full(len(queries), -1.0, dtype=np.float32)
+        scores = self._vectors[:self._count] @ queries.T
+        best = scores.argmax(axis=0)
+        return np.asarray(self._ids[best]), scores[best, np.arange(len(queries))]
+
+
+class SemanticCache:
+    """Answers a prompt with the stored response of a near-identical earlier
+    prompt of the same project.
+
+    Every project gets a ``SemanticIndex`` of its interactions' prompts.
+    Before a lookup the index embeds the interactions stored since it was
+    last used, so updates are incremental however the interactions were
+    saved. The last ``RESCAN_IDS`` ids it had already passed are looked at
+    again, for interactions whose transaction committed after a newer one's. A lookup embeds the prompts and scores them against the whole
+    index in one matrix product; the best match counts when its cosine
+    similarity reaches ``threshold``. Its response is read from the database,
+    so deleted interactions are never served. The ``max_indexes`` most
+    recently used indexes are kept in memory.
+    """
+
+    def __init__(self, embedder: Embedder, threshold: float, directory: str | None = None, max_indexes: int = 256, session_factory=None):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.directory = directory
+        self.max_indexes = max_indexes
+        if session_factory is None:
+            from app.db.database import AsyncSessionLocal as session_factory
+        self._session_factory = session_factory
+        self._indexes: OrderedDict[int, SemanticIndex] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.embedded = 0
+
+    def _index(self, project_id: int) -> SemanticIndex:
+        index = self._indexes.get(project_id)
+        if index is None:
+            path = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"project-{project_id}-{self.embedder.name}-{self.embedder.dimensions}")
+            index = self._indexes[project_id] = SemanticIndex(self.embedder.dimensions, path)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(project_id)
+        return index
+
+    async def _catch_up(self, project_id: int, index: SemanticIndex) -> None:
+        async with index.lock:
+            floor = max(index.last_id - RESCAN_IDS, 0)
+            async with self._session_factory() as db:
+                result = await db.execute(
+                    select(AIInteraction.id, AIInteraction.prompt)
+                    .where(
+                        AIInteraction.project_id == project_id,
+                        AIInteraction.id > floor,
+                        AIInteraction.id.not_in(index.ids_above(floor)),
+                    )
+                    .order_by(AIInteraction.id)
+                )
+                rows = result.all()
+            for start in range(0, len(rows), EMBED_BATCH_SIZE):
+                batch = rows[start:start + EMBED_BATCH_SIZE]
+                vectors = await self.embedder.embed([row.prompt for row in batch])
+                # Takes the index file's lock, which another process may be holding
+                await run_in_threadpool(index.add, [row.id for row in batch], vectors)
+                self.embedded += len(batch)
+
+    async def lookup_many(self, project_id: int, prompts: list[str]) -> list[str | None]:
+        index = self._index(project_id)
+        await self._catch_up(project_id, index)
+        ids, scores = index.search(await self.embedder.embed(prompts))
+        matched = {int(id) for id, score in zip(ids, scores) if score >= self.threshold}
+        responses = {}
+        if matched:
+            async with self._session_factory() as db:
+                result = await db.execute(
+                    select(AIInteraction.id, AIInteraction.response).where(AIInteraction.id.in_(matched), AIInteraction.project_id == project_id)
+                )
+                responses = dict(result.all())
+        answers = [responses.get(int(id)) if score >= self.threshold else None for id, score in zip(ids, scores)]
+        hits = sum(answer is not None for answer in answers)
+        self.hits += hits
+        self.misses += len(answers) - hits
+        return answers
+
+    async def lookup(self, project_id: int, prompt: str) -> str | None:
+        return (await self.lookup_many(project_id, [prompt]))[0]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "embedded": self.embedded,
+            "indexes": len(self._indexes),
+            "vectors": sum(len(index) for index in self._indexes.values()),
+        }
+
+
+# Only imported when SEMANTIC_CACHE_ENABLED is set, which keeps NumPy out of the cold start otherwise
+semantic_cache = SemanticCache(
+    load_embedder(settings.SEMANTIC_CACHE_EMBEDDER),
+    settings.SEMANTIC_CACHE_THRESHOLD,
+    settings.SEMANTIC_CACHE_DIR,
+    settings.SEMANTIC_CACHE_MAX_PROJECTS,
+)
@@ -0,0 +1,88 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+
+
+class _Broadcast:
+    """Fans one token stream out to any number of subscribers.
+
+    Tokens are buffered, so a subscriber that joins late first gets
+    everything produced so far replayed and then follows the live stream.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.tokens: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for token in source:
+                self.tokens.append(token)
+                async with self._changed:
+                    self._changed.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.tokens) or self.done)
+            while position < len(self.tokens):
+                yield self.tokens[position]
+                position += 1
+            if self.done and position >= len(self.tokens):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """Coalesces concurrent identical upstream calls.
+
+    While a call for a key is in flight, further callers with the same key
+    wait for it and share its result, or its exception, instead of starting
+    their own. Once it finishes the key is released; repeat requests after
+    that are the completion cache's job.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _Broadcast] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        future = self._calls.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded, so a caller that goes away doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.calls += 1
+            broadcast = _Broadcast(fn())
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            self.coalesced += 1
+        return broadcast.subscribe()
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+
+ai_flights = SingleFlight()
@@ -0,0 +1,14 @@
+import math
+
+# Estimate instead of running a tokenizer: about four characters per token for
+# English text and code, plus the per-message framing of the chat format
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
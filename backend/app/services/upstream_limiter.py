@@ -0,0 +1,265 @@
+import asyncio
+import email.utils
+import hashlib
+import math
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.metrics import openai_queue_wait
+
+T = TypeVar("T")
+
+# Buckets of this many users and API keys are kept; a forgotten one starts full again
+MAX_BUCKETS = 10000
+
+
+class UpstreamBusy(HTTPException):
+    """An upstream call refused because it would have waited too long for its turn."""
+
+
+class TokenBucket:
+    """Holds up to ``per_minute`` units and refills at ``per_minute`` a minute.
+
+    Taking more than is left overdraws the bucket, which is how a waiting
+    call reserves its share: the calls after it see the deficit and wait
+    behind it.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken without overdrawing."""
+        self._refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+
+class Admission:
+    """A call let through by ``UpstreamLimiter.admit``, charged with an estimate of its tokens."""
+
+    def __init__(self, token_buckets: list[TokenBucket], estimated_tokens: int):
+        self.token_buckets = token_buckets
+        self.estimated_tokens = estimated_tokens
+
+    def reconcile(self, tokens: int) -> None:
+        # Refunds an overestimate, charges an underestimate
+        now = time.monotonic()
+        for bucket in self.token_buckets:
+            bucket.take(tokens - self.estimated_tokens, now)
+        self.estimated_tokens = tokens
+
+
+def retry_after_seconds(headers) -> float | None:
+    """The wait an upstream answer asks for, from retry-after-ms (OpenAI's) or Retry-After."""
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamLimiter:
+    """Admission control for upstream OpenAI calls.
+
+    A call first waits for its user's and its API key's token buckets, one
+    counting requests and one counting tokens per minute each, then for one
+    of ``max_concurrency`` slots. Tokens are charged up front with an
+    estimate and reconciled with the reported usage afterwards. A call that
+    would wait more than ``max_queue_seconds`` is refused with a 429 (rate
+    limits) or a 503 (no free slot) and a Retry-After instead, so a spike
+    turns into quick refusals rather than a wave of upstream 429s. Limits
+    left unset are not enforced.
+
+    ``call`` admits a call and resends it when it is answered with a 429 or
+    a 5xx, at most ``max_retries`` times, after an exponential backoff with
+    full jitter or the answer's Retry-After, whichever is longer. Every
+    attempt is admitted, and charged, on its own, and the backoff is spent
+    without a slot.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        user_requests_per_minute: int | None = None,
+        user_tokens_per_minute: int | None = None,
+        key_requests_per_minute: int | None = None,
+        key_tokens_per_minute: int | None = None,
+        max_queue_seconds: float = 10.0,
+        max_retries: int = 2,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 20.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.limits = {
+            "user": (user_requests_per_minute, user_tokens_per_minute),
+            "key": (key_requests_per_minute, key_tokens_per_minute),
+        }
+        self.max_queue_seconds = max_queue_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._buckets: OrderedDict[tuple, tuple[TokenBucket | None, TokenBucket | None]] = OrderedDict()
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.retries = 0
+        self.last_queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.total_queue_wait_seconds = 0.0
+
+    def _buckets_for(self, scope: str, key) -> tuple[TokenBucket | None, TokenBucket | None]:
+        buckets = self._buckets.get((scope, key))
+        if buckets is not None:
+            self._buckets.move_to_end((scope, key))
+            return buckets
+        buckets = tuple(TokenBucket(limit) if limit else None for limit in self.limits[scope])
+        self._buckets[(scope, key)] = buckets
+        if len(self._buckets) > MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        return buckets
+
+    def _reject(self, status_code: int, detail: str, retry_after: float) -> UpstreamBusy:
+        self.rejected += 1
+        return UpstreamBusy(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, api_key: str, estimated_tokens: int) -> AsyncIterator[Admission]:
+        # Keys are only kept as a digest
+        key = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        charges, token_buckets = [], []
+        for request_bucket, token_bucket in (self._buckets_for("user", user_id), self._buckets_for("key", key)):
+            if request_bucket:
+                charges.append((request_bucket, 1))
+            if token_bucket:
+                charges.append((token_bucket, estimated_tokens))
+                token_buckets.append(token_bucket)
+        started = time.monotonic()
+        delay = max((bucket.delay(amount, started) for bucket, amount in charges), default=0.0)
+        if delay > self.max_queue_seconds:
+            raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, "Too many AI requests, please retry shortly", delay)
+        for bucket, amount in charges:
+            bucket.take(amount, started)
+
+        self.waiting += 1
+        acquired = False
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            if self._slots is not None and not self._slots.locked():
+                await self._slots.acquire()
+            elif self._slots is not None:
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.max_queue_seconds - delay)
+                except asyncio.TimeoutError:
+                    raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, "The AI service is busy, please retry shortly", 1) from None
+            acquired = True
+        finally:
+            self.waiting -= 1
+            if not acquired:
+                # Refused or cancelled while waiting: the reservation goes back
+                now = time.monotonic()
+                for bucket, amount in charges:
+                    bucket.take(-amount, now)
+        self._record(time.monotonic() - started)
+
+        self.in_flight += 1
+        try:
+            yield Admission(token_buckets, estimated_tokens)
+        finally:
+            self.in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def _record(self, queue_wait: float) -> None:
+        self.admitted += 1
+        self.last_queue_wait_seconds = queue_wait
+        self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, queue_wait)
+        self.total_queue_wait_seconds += queue_wait
+        openai_queue_wait.observe(queue_wait)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float | None:
+        """Seconds to wait before resending after ``error``, None if it isn't worth resending."""
+        status_code = getattr(error, "status_code", None)
+        if status_code is None or (status_code != 429 and status_code < 500):
+            return None
+        # A 429 for an exhausted quota won't clear up by waiting
+        if getattr(error, "code", None) == "insufficient_quota":
+            return None
+        backoff = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = retry_after_seconds(response.headers) if response is not None else None
+        if retry_after is None:
+            return backoff
+        if retry_after > self.retry_max_seconds:
+            return None
+        return max(retry_after, backoff)
+
+    @asynccontextmanager
+    async def call(self, user_id: int, api_key: str, estimated_tokens: int, send: Callable[[], Awaitable[T]]) -> AsyncIterator[tuple[Admission, T]]:
+        """Admits and awaits ``send``, retrying it as needed; the admission of
+        the attempt that succeeded lasts until the block ends, e.g. with the stream it opened."""
+        attempt = 0
+        while True:
+            async with self.admit(user_id, api_key, estimated_tokens) as admission:
+                try:
+                    result = await send()
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt) if attempt < self.max_retries else None
+                    if delay is None:
+                        raise
+                else:
+                    yield admission, result
+                    return
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "last_queue_wait_seconds": self.last_queue_wait_seconds,
+            "max_queue_wait_seconds": self.max_queue_wait_seconds,
+            "total_queue_wait_seconds": self.total_queue_wait_seconds,
+        }
+
+
+upstream_limiter = UpstreamLimiter(
+    settings.OPENAI_MAX_CONCURRENCY,
+    settings.OPENAI_USER_REQUESTS_PER_MINUTE,
+    settings.OPENAI_USER_TOKENS_PER_MINUTE,
+    settings.OPENAI_KEY_REQUESTS_PER_MINUTE,
+    settings.OPENAI_KEY_TOKENS_PER_MINUTE,
+    settings.OPENAI_MAX_QUEUE_SECONDS,
+    settings.OPENAI_MAX_RETRIES,
+    settings.OPENAI_RETRY_BASE_SECONDS,
+    settings.OPENAI_RETRY_MAX_SECONDS,
+)
@@ -0,0 +1,257 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+from sqlalchemy import Column, Float, Integer, MetaData, Table, create_engine, delete, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.models.user import User
+from app.models.user_profile import UserProfile
+
+
+def _columns(instance) -> dict:
+    return {column.key: getattr(instance, column.key) for column in instance.__table__.columns}
+
+
+def snapshot_user(user: User) -> dict:
+    return {"user": _columns(user), "profile": _columns(user.profile) if user.profile is not None else None}
+
+
+def restore_user(snapshot: dict) -> User:
+    """A fresh User per request, so no two requests share a mutable one.
+
+    It comes back detached, as if loaded by an earlier session, profile
+    included: ``Session.merge(user, load=False)`` then attaches it to the
+    request's session without a query.
+    """
+    user = User(**snapshot["user"])
+    profile = UserProfile(**snapshot["profile"]) if snapshot["profile"] is not None else None
+    if profile is not None:
+        make_transient_to_detached(profile)
+    set_committed_value(user, "profile", profile)
+    make_transient_to_detached(user)
+    return user
+
+
+user_cache_metadata = MetaData()
+
+user_cache_invalidations_table = Table(
+    "user_cache_invalidations",
+    user_cache_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+
+class SQLInvalidationBackend:
+    """Shares user invalidations between workers through a database table.
+
+    Every worker polls for rows with a higher id than the last one it has
+    seen, so clock skew between workers doesn't matter. Rows older than
+    ``retention`` seconds are no longer needed by anyone and are purged on
+    publish.
+    """
+
+    def __init__(self, database_url: str, retention: float, clock: Callable[[], float] = time.time):
+        self.database_url = database_url
+        self.retention = retention
+        self._clock = clock
+        self._engine: Engine | None = None
+        self._last_id: int | None = None
+
+    def _get_engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(self.database_url)
+            user_cache_metadata.create_all(self._engine)
+        return self._engine
+
+    def publish(self, user_id: int) -> None:
+        now = self._clock()
+        with self._get_engine().begin() as conn:
+            conn.execute(insert(user_cache_invalidations_table).values(user_id=user_id, created_at=now))
+            conn.execute(delete(user_cache_invalidations_table).where(user_cache_invalidations_table.c.created_at < now - self.retention))
+
+    def poll(self) -> list[int]:
+        with self._get_engine().connect() as conn:
+            if self._last_id is None:
+                # Anything published before this worker started can't be in its cache
+                self._last_id = conn.execute(select(func.coalesce(func.max(user_cache_invalidations_table.c.id), 0))).scalar_one()
+                return []
+            rows = conn.execute(
+                select(user_cache_invalidations_table.c.id, user_cache_invalidations_table.c.user_id)
+                .where(user_cache_invalidations_table.c.id > self._last_id)
+                .order_by(user_cache_invalidations_table.c.id)
+            ).all()
+        if rows:
+            self._last_id = rows[-1].id
+        return [row.user_id for row in rows]
+
+    def close(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+
+class UserCache:
+    """Maps verified access tokens to a snapshot of their user.
+
+    A hit skips both the JWT verification and the user query. Entries live
+    for at most ``ttl`` seconds and never past the token's ``exp``. Tokens are
+    stored hashed. Changes to a user must go through ``invalidate_user``; with
+    an invalidation backend, other workers pick the change up within
+    ``poll_interval`` seconds.
+
+    The sync services use it from threadpool threads, so every change to the
+    entries is made under a lock.
+
+    A request can load a user, lose the race to an update that invalidates
+    them, and only then cache what it loaded. Every invalidation therefore
+    gets a generation: callers take ``generation()`` before loading the user
+    and pass it to ``set``, which drops a user invalidated since.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, backend: SQLInvalidationBackend | None = None,
+                 poll_interval: float = 2.0, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._keys_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self._next_poll = 0.0
+        self._generation = 0
+        # Generation of each user's latest invalidation, oldest first
+        self._invalidated_at: OrderedDict[int, int] = OrderedDict()
+        # Snapshots taken before this generation are never stored
+        self._oldest_generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> User | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self._clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return restore_user(entry[0])
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def set(self, token: str, user: User, token_expires_at: float, generation: int | None = None) -> None:
+        expires_at = min(self._clock() + self.ttl, token_expires_at)
+        if expires_at <= self._clock():
+            return
+        key = self._key(token)
+        snapshot = snapshot_user(user)
+        with self._lock:
+            if generation is not None and (generation < self._oldest_generation or self._invalidated_at.get(user.id, 0) > generation):
+                # Invalidated after it was loaded, so it may already be stale
+                return
+            self._entries[key] = (snapshot, expires_at)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        # Called with the lock held
+        snapshot, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(snapshot["user"]["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[snapshot["user"]["id"]]
+
+    def _evict_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._invalidated_at.pop(user_id, None)
+            self._invalidated_at[user_id] = self._generation
+            while len(self._invalidated_at) > self.max_entries:
+                # Forgetting a user's invalidation means refusing every load that started before it
+                _, self._oldest_generation = self._invalidated_at.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._evict_user(user_id)
+        if self.backend is not None:
+            try:
+                self.backend.publish(user_id)
+            except Exception as e:
+                print(f"Error publishing user cache invalidation: {str(e)}")
+
+    async def ainvalidate_user(self, user_id: int) -> None:
+        self._evict_user(user_id)
+        if self.backend is not None:
+            try:
+                await run_in_threadpool(self.backend.publish, user_id)
+            except Exception as e:
+                print(f"Error publishing user cache invalidation: {str(e)}")
+
+    def poll(self) -> None:
+        # Applies invalidations from other workers, at most once per poll_interval
+        with self._lock:
+            if self.backend is None or self._clock() < self._next_poll:
+                return
+            self._next_poll = self._clock() + self.poll_interval
+        try:
+            user_ids = self.backend.poll()
+        except Exception as e:
+            # Can't tell what changed elsewhere, so don't trust anything cached
+            print(f"Error polling user cache invalidations: {str(e)}")
+            self.clear()
+            return
+        for user_id in user_ids:
+            self._evict_user(user_id)
+
+    async def apoll(self) -> None:
+        if self.backend is not None and self._clock() >= self._next_poll:
+            await run_in_threadpool(self.poll)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._generation += 1
+            self._invalidated_at.clear()
+            self._oldest_generation = self._generation
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
+
+
+user_cache = UserCache(
+    settings.USER_CACHE_MAX_ENTRIES,
+    settings.USER_CACHE_TTL_SECONDS,
+    SQLInvalidationBackend(settings.USER_CACHE_INVALIDATION_DATABASE_URL, retention=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    if settings.USER_CACHE_INVALIDATION_DATABASE_URL else None,
+    settings.USER_CACHE_POLL_SECONDS,
+)
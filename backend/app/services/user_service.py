@@ -1,12 +1,19 @@
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from app.db.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, raiseload
+from app.db.database import get_db, get_async_db
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
 from app.models.user import User
 from app.models.user_profile import UserProfile
 from app.schemas.user import UserCreate, UserUpdate, UserProfileCreate, UserProfileUpdate
 import json
 
+# Loader options for users serialized with schemas.UserWithProfile: the profile
+# comes in the same query, any other relationship raises instead of lazy loading
+user_with_profile_options = (joinedload(User.profile), raiseload("*"))
+
 class UserService:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -35,6 +42,7 @@ class UserService:
                 setattr(db_user, key, value)
             self.db.commit()
             self.db.refresh(db_user)
+            user_cache.invalidate_user(user_id)
         return db_user
 
     def delete_user(self, user_id: int) -> bool:
@@ -42,6 +50,7 @@ class UserService:
         if db_user:
             self.db.delete(db_user)
             self.db.commit()
+            user_cache.invalidate_user(user_id)
             return True
         return False
 
@@ -51,6 +60,7 @@ class UserService:
         self.db.add(db_profile)
         self.db.commit()
         self.db.refresh(db_profile)
+        user_cache.invalidate_user(user_id)
         return db_profile
 
     def get_user_profile(self, user_id: int) -> UserProfile:
@@ -66,8 +76,79 @@ class UserService:
                 setattr(db_profile, key, value)
             self.db.commit()
             self.db.refresh(db_profile)
+            user_cache.invalidate_user(user_id)
         return db_profile
 
     def get_password_hash(self, password: str) -> str:
-        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-        return pwd_context.hash(password)
\ No newline at end of file
+        return password_hasher.hash_sync(password)
+
+class AsyncUserService:
+    def __init__(self, db: AsyncSession = Depends(get_async_db)):
+        self.db = db
+
+    async def create_user(self, user: UserCreate) -> User:
+        db_user = User(**user.model_dump(exclude={"password"}))
+        db_user.hashed_password = await self.get_password_hash(user.password)
+        self.db.add(db_user)
+        await self.db.commit()
+        await self.db.refresh(db_user)
+        return db_user
+
+    async def get_user(self, user_id: int) -> User:
+        result = await self.db.execute(select(User).filter(User.id == user_id))
+        return result.scalars().first()
+
+    async def get_user_by_email(self, email: str) -> User:
+        result = await self.db.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
+
+    async def update_user(self, user_id: int, user: UserUpdate) -> User:
+        db_user = await self.get_user(user_id)
+        if db_user:
+            update_data = user.model_dump(exclude_unset=True)
+            if "password" in update_data:
+                update_data["hashed_password"] = await self.get_password_hash(update_data.pop("password"))
+            for key, value in update_data.items():
+                setattr(db_user, key, value)
+            await self.db.commit()
+            await self.db.refresh(db_user)
+            await user_cache.ainvalidate_user(user_id)
+        return db_user
+
+    async def delete_user(self, user_id: int) -> bool:
+        db_user = await self.get_user(user_id)
+        if db_user:
+            await self.db.delete(db_user)
+            await self.db.commit()
+            await user_cache.ainvalidate_user(user_id)
+            return True
+        return False
+
+    async def create_user_profile(self, user_id: int, profile: UserProfileCreate) -> UserProfile:
+        db_profile = UserProfile(**profile.model_dump(), user_id=user_id)
+        db_profile.preferences = json.dumps(profile.preferences)
+        self.db.add(db_profile)
+        await self.db.commit()
+        await self.db.refresh(db_profile)
+        await user_cache.ainvalidate_user(user_id)
+        return db_profile
+
+    async def get_user_profile(self, user_id: int) -> UserProfile:
+        result = await self.db.execute(select(UserProfile).filter(UserProfile.user_id == user_id))
+        return result.scalars().first()
+
+    async def update_user_profile(self, user_id: int, profile: UserProfileUpdate) -> UserProfile:
+        db_profile = await self.get_user_profile(user_id)
+        if db_profile:
+            update_data = profile.model_dump(exclude_unset=True)
+            if "preferences" in update_data:
+                update_data["preferences"] = json.dumps(update_data["preferences"])
+            for key, value in update_data.items():
+                setattr(db_profile, key, value)
+            await self.db.commit()
+            await self.db.refresh(db_profile)
+            await user_cache.ainvalidate_user(user_id)
+        return db_profile
+
+    async def get_password_hash(self, password: str) -> str:
+        return await password_hasher.hash(password)
@@ -0,0 +1,77 @@
+"""Latency of an authenticated read (GET /api/projects/) with and without the user cache.
+
+Uses a throwaway SQLite file database unless DATABASE_URL is set; point it at
+Postgres to include a real network round trip per query.
+
+    poetry run python -m benchmarks.auth_cache
+"""
+import asyncio
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'auth_cache_benchmark.db')}")
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from app.core.config import settings
+from app.db.database import SessionLocal, async_engine, engine
+from app.main import app
+from app.models.base import Base
+from app.models import user_profile  # noqa: F401
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+from app.services.auth_service import AuthService
+from app.services.project_service import ProjectService
+from app.services.user_cache import user_cache
+from app.services.user_service import UserService
+
+REQUESTS = 1000
+
+
+def create_token() -> str:
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        if UserService(db).get_user_by_email("benchmark@example.com") is None:
+            user = UserService(db).create_user(UserCreate(email="benchmark@example.com", password="benchmark", full_name="Benchmark User"))
+            for i in range(10):
+                ProjectService(db).create_project(user.id, ProjectCreate(name=f"Benchmark Project {i}"))
+        return AuthService(db).create_access_token({"sub": "benchmark@example.com"}, datetime.timedelta(minutes=30))
+
+
+async def run(client: AsyncClient, token: str, cached: bool) -> tuple[list[float], float]:
+    settings.USER_CACHE_ENABLED = cached
+    user_cache.clear()
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+    latencies = []
+    try:
+        for _ in range(REQUESTS):
+            started = time.perf_counter()
+            response = await client.get("/api/projects/", headers={"Authorization": f"Bearer {token}"})
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+    return latencies, len(statements) / REQUESTS
+
+
+async def main() -> None:
+    token = create_token()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+        print(f"{'user cache':>10} {'queries/req':>12} {'mean':>9} {'p50':>9} {'p99':>9}")
+        for cached in (False, True):
+            latencies, queries = await run(client, token, cached)
+            latencies.sort()
+            print(
+                f"{'on' if cached else 'off':>10} {queries:>12.2f} {statistics.mean(latencies) * 1000:>7.2f}ms "
+                f"{latencies[len(latencies) // 2] * 1000:>7.2f}ms {latencies[int(len(latencies) * 0.99)] * 1000:>7.2f}ms"
+            )
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Cold start cost: importing app.main and serving the first requests in a fresh interpreter.
+
+Every run is a new Python process, as on a Lambda cold start. It reports the
+interpreter start, the import of app.main and the first unauthenticated
+(GET /) and authenticated (GET /api/projects/) requests, plus which of the
+heavy optional libraries were loaded by the import. Uses a throwaway SQLite
+file database unless DATABASE_URL is set.
+
+    poetry run python -m benchmarks.cold_start
+    poetry run python -m benchmarks.cold_start --save-baseline cold_start.json
+    poetry run python -m benchmarks.cold_start --baseline cold_start.json
+
+With --baseline the run exits non-zero when a median is more than
+--tolerance slower than the baseline.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'cold_start_benchmark.db')}")
+
+RUNS = 10
+HEAVY_MODULES = ["openai", "httpx", "jose", "passlib", "bcrypt", "firebase_admin", "numpy"]
+
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+loaded = [name for name in {heavy_modules!r} if name in sys.modules]
+from httpx import ASGITransport, AsyncClient
+
+async def first_requests():
+    async with AsyncClient(transport=ASGITransport(app=app.main.app), base_url="http://benchmark") as client:
+        start = time.perf_counter()
+        (await client.get("/")).raise_for_status()
+        root = time.perf_counter() - start
+        start = time.perf_counter()
+        (await client.get("/api/projects/", headers={{"Authorization": "Bearer {token}"}})).raise_for_status()
+        return root, time.perf_counter() - start
+
+root, authenticated = asyncio.run(first_requests())
+print(json.dumps({{"import": imported - started, "first_request": root, "first_authenticated_request": authenticated, "loaded": loaded}}))
+"""
+
+
+def create_token() -> str:
+    from app.db.database import SessionLocal, engine
+    from app.models.base import Base
+    from app.models import user_profile  # noqa: F401
+    from app.schemas.project import ProjectCreate
+    from app.schemas.user import UserCreate
+    from app.services.auth_service import AuthService
+    from app.services.project_service import ProjectService
+    from app.services.user_service import UserService
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        if UserService(db).get_user_by_email("benchmark@example.com") is None:
+            user = UserService(db).create_user(UserCreate(email="benchmark@example.com", password="benchmark", full_name="Benchmark User"))
+            ProjectService(db).create_project(user.id, ProjectCreate(name="Benchmark Project"))
+        return AuthService(db).create_access_token({"sub": "benchmark@example.com"}, datetime.timedelta(minutes=30))
+
+
+def run_once(token: str) -> dict:
+    code = CHILD.format(heavy_modules=HEAVY_MODULES, token=token)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - started
+    result = json.loads(output.strip().splitlines()[-1])
+    timings = {name: result[name] for name in ("import", "first_request", "first_authenticated_request")}
+    timings["process"] = total
+    return {"timings": timings, "loaded": result["loaded"]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--baseline", help="compare against medians saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="write the medians of this run to a JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    token = create_token()
+    runs = [run_once(token) for _ in range(args.runs)]
+    medians = {name: statistics.median(run["timings"][name] for run in runs) for name in runs[0]["timings"]}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{args.runs} cold starts, heavy modules loaded by import: {', '.join(runs[0]['loaded']) or 'none'}")
+    print(f"{'phase':>28} {'median':>9} {'min':>9} {'max':>9}" + (f" {'baseline':>9}" if baseline else ""))
+    regressions = []
+    for name, median in medians.items():
+        values = [run["timings"][name] for run in runs]
+        line = f"{name:>28} {median * 1000:>7.1f}ms {min(values) * 1000:>7.1f}ms {max(values) * 1000:>7.1f}ms"
+        if baseline and name in baseline:
+            line += f" {baseline[name] * 1000:>7.1f}ms"
+            if median > baseline[name] * (1 + args.tolerance):
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(medians, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
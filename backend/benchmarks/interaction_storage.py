@@ -0,0 +1,156 @@
+"""Interaction body storage before and after migration 0005: database size and read latency.
+
+Builds a SQLite file database at revision 0004, with the bodies in
+ai_interactions, and fills it with interactions whose responses repeat the
+way generated code does: a share of them are exact repeats of an earlier
+response (the same question asked again, a cached completion), the rest are
+variations of a few templates. Measures the size and three reads, migrates
+the database to head, which moves the bodies into compressed, deduplicated
+blobs, and measures again:
+
+    scan        count(*) over a column without an index, a full table scan
+    metadata    a page of rows of the table, which no longer includes the bodies
+    bodies      a page of rows with their bodies, as the list endpoints read them
+
+    poetry run python -m benchmarks.interaction_storage
+    poetry run python -m benchmarks.interaction_storage --rows 100000 --repeats 0.5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import MetaData, Table, create_engine, select, text
+from sqlalchemy.orm import Session
+from app.db.pagination import keyset_page
+from app.models.ai_interaction import AIInteraction
+from app.services.ai_interaction_service import interaction_response_columns
+
+ROWS = 20_000
+PROJECTS = 20
+REPEATS = 0.3
+PAGE_SIZE = 100
+RUNS = 20
+
+TEMPLATES = [
+    "import {module}\n\n\ndef {name}(path: str) -> list[dict]:\n    \"\"\"Read {thing} from path.\"\"\"\n"
+    "    rows = []\n    with open(path) as f:\n        for line in f:\n            rows.append({module}.loads(line))\n"
+    "    return [row for row in rows if row.get('{field}') is not None]\n",
+    "class {Name}Repository:\n    def __init__(self, db):\n        self.db = db\n\n    def get(self, {field}_id: int):\n"
+    "        return self.db.query({Name}).filter({Name}.id == {field}_id).first()\n\n    def list(self, limit: int = {number}):\n"
+    "        return self.db.query({Name}).order_by({Name}.created_at.desc()).limit(limit).all()\n",
+    "async def {name}(client, url: str, retries: int = {number}) -> dict:\n    for attempt in range(retries):\n        try:\n"
+    "            response = await client.get(url, timeout={number})\n            response.raise_for_status()\n"
+    "            return response.json()['{field}']\n        except Exception:\n            await asyncio.sleep(2 ** attempt)\n"
+    "    raise RuntimeError('{thing} unavailable')\n",
+]
+WORDS = ["user", "order", "invoice", "report", "event", "session", "payment", "profile", "message", "task"]
+
+
+def generated_response(rng: random.Random) -> str:
+    word = rng.choice(WORDS)
+    parts = [
+        rng.choice(TEMPLATES).format(
+            module=rng.choice(["json", "orjson", "ujson"]), name=f"load_{word}s", Name=word.title(), thing=f"{word}s",
+            field=rng.choice(WORDS), number=rng.randint(2, 500),
+        )
+        for _ in range(rng.randint(3, 8))
+    ]
+    return "```python\n" + "\n\n".join(parts) + "```\n\nThis reads the " + word + "s and handles the errors described above."
+
+
+def fill(database_path: str, rows: int, repeats: float) -> None:
+    rng = random.Random(0)
+    responses = []
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO users (id, email, hashed_password) VALUES (1, 'benchmark@example.com', 'x')")
+        connection.executemany("INSERT INTO projects (id, user_id, name) VALUES (?, 1, ?)", [(i, f"Project {i}") for i in range(1, PROJECTS + 1)])
+        batch = []
+        for i in range(rows):
+            if responses and rng.random() < repeats:
+                response = rng.choice(responses)
+            else:
+                response = generated_response(rng)
+                responses.append(response)
+            prompt = f"Write a function that loads the {rng.choice(WORDS)}s of request {i} and skips the broken ones"
+            batch.append((1, i % PROJECTS + 1, prompt, response, f"2026-01-01 00:00:{i % 60:02d}.{i:06d}"))
+        connection.executemany("INSERT INTO ai_interactions (user_id, project_id, prompt, response, created_at) VALUES (?, ?, ?, ?, ?)", batch)
+
+
+def database_size(database_path: str) -> int:
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("VACUUM")
+    return os.path.getsize(database_path)
+
+
+def median_ms(engine, statement, runs: int) -> float:
+    # Untimed, so the first run's statement compilation and page cache misses don't count
+    with Session(engine) as db:
+        db.execute(statement).all()
+    timings = []
+    for _ in range(runs):
+        with Session(engine) as db:
+            started = time.perf_counter()
+            db.execute(statement).all()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def measure(engine, migrated: bool, runs: int) -> dict[str, float]:
+    scan = text("SELECT count(*) FROM ai_interactions WHERE created_at >= '2026-01-01 00:00:30'")
+    # The table as it is in the database, the bodies' columns included before the migration
+    table = Table("ai_interactions", MetaData(), autoload_with=engine)
+    metadata = keyset_page(select(table).filter(table.c.project_id == 1), table.c, PAGE_SIZE, None)
+    if migrated:
+        bodies = keyset_page(select(*interaction_response_columns).filter(AIInteraction.project_id == 1), AIInteraction, PAGE_SIZE, None)
+    else:
+        bodies = metadata
+    return {"scan": median_ms(engine, scan, runs), "metadata": median_ms(engine, metadata, runs), "bodies": median_ms(engine, bodies, runs)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--repeats", type=float, default=REPEATS, help="share of responses that repeat an earlier one exactly")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    database_path = os.path.join(tempfile.mkdtemp(), "interaction_storage_benchmark.db")
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{database_path}")
+    command.upgrade(config, "0004")
+    fill(database_path, args.rows, args.repeats)
+
+    before_size = database_size(database_path)
+    engine = create_engine(f"sqlite:///{database_path}")
+    before = measure(engine, False, args.runs)
+    engine.dispose()
+
+    started = time.perf_counter()
+    command.upgrade(config, "head")
+    migration_seconds = time.perf_counter() - started
+    after_size = database_size(database_path)
+    engine = create_engine(f"sqlite:///{database_path}")
+    after = measure(engine, True, args.runs)
+    with engine.connect() as connection:
+        blobs, body_bytes = connection.execute(text("SELECT count(*), sum(size) FROM interaction_blobs")).one()
+    engine.dispose()
+
+    print(f"{args.rows} interactions, {blobs} distinct bodies ({body_bytes / 1e6:.1f}MB uncompressed), migrated in {migration_seconds:.1f}s")
+    print(f"{'':>10} {'before':>10} {'after':>10} {'change':>8}")
+    print(f"{'size':>10} {before_size / 1e6:>8.1f}MB {after_size / 1e6:>8.1f}MB {after_size / before_size:>7.2f}x")
+    for name in before:
+        print(f"{name:>10} {before[name]:>8.2f}ms {after[name]:>8.2f}ms {after[name] / before[name]:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
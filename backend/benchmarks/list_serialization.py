@@ -0,0 +1,104 @@
+"""Serializing a project's interactions: ORM objects through the response model vs. row dicts through orjson.
+
+The ORM path is what a list endpoint with response_model=list[AIInteraction]
+does: load entities, validate them with from_attributes, dump them in JSON
+mode and encode with json.dumps. The row path is what the list endpoints do
+now: select the schema's columns, build dicts and encode them with orjson.
+Both produce the same JSON. Uses a throwaway SQLite file database unless
+DATABASE_URL is set.
+
+    poetry run python -m benchmarks.list_serialization
+    poetry run python -m benchmarks.list_serialization --sizes 1000 10000 --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'list_serialization_benchmark.db')}")
+
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from app.db.database import SessionLocal, engine
+from app.models.ai_interaction import AIInteraction as InteractionModel, interaction_body_rows
+from app.models.interaction_blob import insert_blobs
+from app.models.base import Base
+from app.models import user_profile  # noqa: F401
+from app.schemas.ai_interaction import AIInteraction, AIInteractionCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+from app.services.ai_interaction_service import AIInteractionService, ai_interaction_rows
+from app.services.project_service import ProjectService
+from app.services.user_service import UserService
+
+SIZES = [1_000, 10_000, 100_000]
+RUNS = 5
+PROMPT = "Write a function that validates the user's input and reports every invalid field. " * 2
+RESPONSE = "def validate(data):\n    errors = {}\n    for field, value in data.items():\n        ...\n" * 10
+
+adapter = TypeAdapter(list[AIInteraction])
+
+
+def create_projects(sizes: list[int]) -> dict[int, int]:
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = UserService(db).create_user(UserCreate(email=f"benchmark-{time.time()}@example.com", password="benchmark", full_name="Benchmark User"))
+        projects = {}
+        for size in sizes:
+            project = ProjectService(db).create_project(user.id, ProjectCreate(name=f"{size} interactions"))
+            projects[size] = project.id
+            for start in range(0, size, 10_000):
+                blobs, rows = interaction_body_rows(ai_interaction_rows(user.id, project.id, [AIInteractionCreate(prompt=PROMPT, response=RESPONSE)] * min(10_000, size - start)))
+                db.execute(insert_blobs(engine.dialect.name), blobs)
+                db.execute(insert(InteractionModel), rows)
+            db.commit()
+        return projects
+
+
+def orm_path(project_id: int) -> bytes:
+    with SessionLocal() as db:
+        interactions = AIInteractionService(db).get_project_interactions(project_id)
+        content = adapter.dump_python(adapter.validate_python(interactions, from_attributes=True), mode="json")
+    # As fastapi.responses.JSONResponse renders it
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def row_path(project_id: int) -> bytes:
+    with SessionLocal() as db:
+        return ORJSONResponse(AIInteractionService(db).get_project_interaction_rows(project_id)).body
+
+
+def measure(fn, project_id: int, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(project_id)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    projects = create_projects(args.sizes)
+    print(f"{'rows':>8} {'orm median':>11} {'rows median':>12} {'speedup':>8} {'body':>9}")
+    for size, project_id in projects.items():
+        body = row_path(project_id)
+        if json.loads(body) != json.loads(orm_path(project_id)):
+            print(f"{size}: the two paths produced different JSON")
+            return 1
+        orm = statistics.median(measure(orm_path, project_id, args.runs))
+        rows = statistics.median(measure(row_path, project_id, args.runs))
+        print(f"{size:>8} {orm * 1000:>9.1f}ms {rows * 1000:>10.1f}ms {orm / rows:>7.1f}x {len(body) / 1e6:>7.1f}MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Upstream OpenAI calls under a burst of identical generate_code requests.
+
+Runs against the local fake OpenAI server from the test suite, with and
+without single-flight coalescing. The completion cache is disabled so only
+coalescing is measured.
+
+    poetry run python -m benchmarks.single_flight
+"""
+import asyncio
+import time
+from app.core.config import settings
+from app.models.user import User
+from app.services import ai_service
+from app.services.ai_service import AIService
+from app.services.openai_client import openai_clients
+from app.services.single_flight import SingleFlight
+from tests.fake_openai import FakeOpenAI
+
+BURST_SIZES = [1, 10, 50, 200]
+UPSTREAM_LATENCY = 0.25
+
+
+async def get_user_api_key(self, user_id):
+    return "sk-benchmark"
+
+
+async def run_burst(fake: FakeOpenAI, size: int, single_flight: bool) -> tuple[int, float]:
+    settings.AI_SINGLE_FLIGHT_ENABLED = single_flight
+    ai_service.ai_flights = SingleFlight()
+    fake.requests.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(AIService(User(id=1)).generate_code("Scaffold a FastAPI app") for _ in range(size)))
+    return len(fake.requests), time.perf_counter() - started
+
+
+async def main() -> None:
+    settings.COMPLETION_CACHE_ENABLED = False
+    AIService._get_user_api_key = get_user_api_key
+    with FakeOpenAI() as fake:
+        settings.OPENAI_BASE_URL = fake.base_url
+        fake.delay = UPSTREAM_LATENCY
+        print(f"{'burst':>6} {'mode':>14} {'upstream calls':>15} {'wall time':>10}")
+        for size in BURST_SIZES:
+            for single_flight in (False, True):
+                calls, elapsed = await run_burst(fake, size, single_flight)
+                mode = "single-flight" if single_flight else "uncoalesced"
+                print(f"{size:>6} {mode:>14} {calls:>15} {elapsed:>9.2f}s")
+        await openai_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,33 @@
 #!/bin/bash
-zip -j lambda_function.zip lambda_handler.py
+# Bundles the handler with the app package and its dependencies, exported from poetry.lock
+set -e
+if ! command -v poetry > /dev/null; then
+  echo "poetry is required to export the Lambda dependencies: https://python-poetry.org/docs/#installation" >&2
+  exit 1
+fi
+if ! poetry export --help > /dev/null 2>&1; then
+  # Poetry 2 moved export into a plugin
+  echo "poetry export is not available, install the export plugin: poetry self add poetry-plugin-export" >&2
+  exit 1
+fi
+# pip evaluates the exported environment markers against the interpreter it runs on,
+# so anything but the Lambda runtime's Python would silently skip dependencies
+PYTHON=${PYTHON:-python3.12}
+if ! "$PYTHON" -c 'import sys; sys.exit(sys.version_info[:2] != (3, 12))' 2> /dev/null; then
+  echo "Python 3.12 is required to install the Lambda dependencies, set PYTHON to its interpreter" >&2
+  exit 1
+fi
+BUILD_DIR=$(mktemp -d)
+cp lambda_handler.py "$BUILD_DIR"/
+cp -r ../../app "$BUILD_DIR"/app
+find "$BUILD_DIR" -name "__pycache__" -type d -prune -exec rm -rf {} +
+(cd ../.. && poetry export --without-hashes -f requirements.txt) > "$BUILD_DIR"/requirements.txt
+"$PYTHON" -m pip install -r "$BUILD_DIR"/requirements.txt --target "$BUILD_DIR" \
+  --platform manylinux2014_x86_64 --python-version 3.12 --only-binary=:all: --quiet
+rm "$BUILD_DIR"/requirements.txt
+rm -f lambda_function.zip
+(cd "$BUILD_DIR" && zip -qr "$OLDPWD"/lambda_function.zip .)
+rm -rf "$BUILD_DIR"
 echo "Lambda package created successfully:"
 pwd
-ls -lh lambda_function.zip
\ No newline at end of file
+ls -lh lambda_function.zip
@@ -1,5 +1,266 @@
-def handler(event, context):
+"""AWS Lambda entry point that serves app.main.app for API Gateway.
+
+Translates REST API (payload v1) and HTTP API (payload v2) proxy events into
+ASGI requests and the app's responses back into proxy results. The app, its
+database engines, HTTP clients and caches are created once per container
+and reused by every warm invocation. All invocations run on one long-lived
+event loop, because pooled async connections are bound to the loop that
+opened them.
+
+The app's lifespan is entered on the first request. It is exited on SIGTERM,
+which Lambda only sends before discarding a container when the function has
+an extension registered; without one the app gets no shutdown and relies on
+flushing its buffers after every request (FlushInteractionsMiddleware).
+
+Keep-warm pings (EventBridge schedules, Zappa's keep_warm, warmer plugins)
+are answered without touching the app. An event that is a list is handled
+as a batch, its requests run concurrently.
+
+Recorded events can be replayed locally, with the timing of each invocation:
+
+    poetry run python terraform/lambda/lambda_handler.py terraform/lambda/events/*.json --repeat 3
+"""
+import asyncio
+import base64
+import json
+import os
+import signal
+import sys
+import time
+from urllib.parse import urlencode
+
+# Running from the repository: make the backend package importable
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if os.path.isdir(os.path.join(BACKEND_DIR, "app")) and BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Imported during Lambda's init phase, so warm invocations never pay for it
+_init_started = time.perf_counter()
+from app.main import app  # noqa: E402
+init_seconds = time.perf_counter() - _init_started
+
+TEXT_CONTENT_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "application/x-ndjson")
+
+loop = asyncio.new_event_loop()
+_lifespan = None
+cold_start = True
+
+
+def is_warmup_event(event) -> bool:
+    if not isinstance(event, dict):
+        return False
+    return (
+        event.get("source") in ("aws.events", "serverless-plugin-warmup")
+        or event.get("detail-type") == "Scheduled Event"
+        or bool(event.get("warmer") or event.get("warmup"))
+    )
+
+
+def _headers(event: dict) -> list[tuple[bytes, bytes]]:
+    headers = []
+    multi_value = event.get("multiValueHeaders")
+    if multi_value:
+        for name, values in multi_value.items():
+            headers.extend((name.lower().encode(), value.encode()) for value in values or [])
+    else:
+        headers.extend((name.lower().encode(), value.encode()) for name, value in (event.get("headers") or {}).items())
+    if event.get("cookies"):
+        headers.append((b"cookie", "; ".join(event["cookies"]).encode()))
+    return headers
+
+
+def _query_string(event: dict) -> bytes:
+    if "rawQueryString" in event:
+        return event["rawQueryString"].encode()
+    if event.get("multiValueQueryStringParameters"):
+        return urlencode([(name, value) for name, values in event["multiValueQueryStringParameters"].items() for value in values]).encode()
+    return urlencode(event.get("queryStringParameters") or {}).encode()
+
+
+def build_scope(event: dict, context=None) -> dict:
+    request_context = event.get("requestContext") or {}
+    if event.get("version") == "2.0":
+        method = request_context["http"]["method"]
+        path = event["rawPath"]
+        source_ip = request_context["http"].get("sourceIp")
+    else:
+        method = event["httpMethod"]
+        path = event["path"]
+        source_ip = (request_context.get("identity") or {}).get("sourceIp")
+    headers = _headers(event)
+    header_values = dict(headers)
+    host = header_values.get(b"host", b"lambda").decode()
+    scheme = header_values.get(b"x-forwarded-proto", b"https").decode()
+    port = int(header_values.get(b"x-forwarded-port", b"443" if scheme == "https" else b"80"))
     return {
-        'statusCode': 200,
-        'body': 'Lambda function initialized successfully'
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": scheme,
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": _query_string(event),
+        "headers": headers,
+        "client": (source_ip, 0) if source_ip else None,
+        "server": (host, port),
+        "aws.event": event,
+        "aws.context": context,
+    }
+
+
+def _request_body(event: dict) -> bytes:
+    body = event.get("body") or b""
+    if isinstance(body, str):
+        body = base64.b64decode(body) if event.get("isBase64Encoded") else body.encode()
+    return body
+
+
+def build_result(event: dict, status: int, headers: list[tuple[bytes, bytes]], body: bytes) -> dict:
+    content_type = ""
+    content_encoding = ""
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            content_type = value.decode()
+        elif name.lower() == b"content-encoding":
+            content_encoding = value.decode()
+    is_text = not content_encoding and content_type.startswith(TEXT_CONTENT_TYPES)
+    result = {
+        "statusCode": status,
+        "body": body.decode() if is_text else base64.b64encode(body).decode(),
+        "isBase64Encoded": not is_text,
     }
+    if event.get("version") == "2.0":
+        result_headers = {}
+        for name, value in headers:
+            if name.lower() == b"set-cookie":
+                result.setdefault("cookies", []).append(value.decode())
+            else:
+                key = name.decode().lower()
+                result_headers[key] = f"{result_headers[key]}, {value.decode()}" if key in result_headers else value.decode()
+        result["headers"] = result_headers
+    else:
+        multi_value = {}
+        for name, value in headers:
+            multi_value.setdefault(name.decode().lower(), []).append(value.decode())
+        result["multiValueHeaders"] = multi_value
+    return result
+
+
+async def _start_app() -> None:
+    # Enter the app's lifespan once per container, see shutdown for its exit
+    global _lifespan
+    if _lifespan is None:
+        _lifespan = app.router.lifespan_context(app)
+        await _lifespan.__aenter__()
+
+
+def shutdown() -> None:
+    """Exits the app's lifespan: flushes buffered interactions, closes pools and clients."""
+    global _lifespan
+    if _lifespan is None or loop.is_running():
+        return
+    lifespan, _lifespan = _lifespan, None
+    try:
+        loop.run_until_complete(lifespan.__aexit__(None, None, None))
+    except Exception as e:
+        print(f"Error shutting down the app: {str(e)}")
+
+
+def _on_sigterm(signum, frame) -> None:
+    shutdown()
+    sys.exit(0)
+
+
+async def run_request(event: dict, context=None) -> dict:
+    await _start_app()
+    scope = build_scope(event, context)
+    body = _request_body(event)
+    response_done = asyncio.Event()
+    request_sent = False
+    status = 500
+    response_headers: list[tuple[bytes, bytes]] = []
+    chunks: list[bytes] = []
+
+    async def receive() -> dict:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        print(f"Error handling {scope['method']} {scope['path']}: {str(e)}")
+        # The whole result is returned at once, so a response that failed half
+        # way is replaced instead of passed on truncated with its status
+        return build_result(event, 500, [(b"content-type", b"text/plain; charset=utf-8")], b"Internal Server Error")
+    finally:
+        response_done.set()
+    return build_result(event, status, response_headers, b"".join(chunks))
+
+
+async def _invoke(event, context) -> dict:
+    if is_warmup_event(event):
+        return {"warm": True, "cold_start": cold_start}
+    return await run_request(event, context)
+
+
+async def _invoke_batch(events: list, context) -> list:
+    return list(await asyncio.gather(*(_invoke(event, context) for event in events)))
+
+
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
+
+def handler(event, context):
+    global cold_start
+    try:
+        if isinstance(event, list):
+            return loop.run_until_complete(_invoke_batch(event, context))
+        return loop.run_until_complete(_invoke(event, context))
+    finally:
+        cold_start = False
+
+
+def replay(paths: list[str], repeat: int = 1) -> None:
+    """Runs recorded events through the handler and prints how long each invocation took."""
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.append((os.path.basename(path), json.load(f)))
+    print(f"init (import app.main) {init_seconds * 1000:.2f}ms")
+    for round_number in range(1, repeat + 1):
+        for name, event in events:
+            was_cold = cold_start
+            started = time.perf_counter()
+            result = handler(event, None)
+            elapsed = (time.perf_counter() - started) * 1000
+            results = result if isinstance(result, list) else [result]
+            outcome = ", ".join(str(item.get("statusCode", "warm")) for item in results)
+            print(f"{round_number:>3} {'cold' if was_cold else 'warm':>4} {name:<40} {outcome:<12} {elapsed:>9.2f}ms")
+    shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay recorded API Gateway events through the Lambda handler.")
+    parser.add_argument("events", nargs="+", help="JSON files, each with one event or a list of events")
+    parser.add_argument("--repeat", type=int, default=1, help="replay all events this many times")
+    args = parser.parse_args()
+    replay(args.events, args.repeat)
@@ -2,24 +2,50 @@ import sys
 import os
 from dotenv import load_dotenv
 import pytest
+import pytest_asyncio
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 # Add the project root to the Python path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 from app.models.base import Base
-from app.db.database import get_db
+from app.api.deps import get_authenticated_user
+from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.db.database import get_db, get_async_db
 from app.main import app
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+from app.services.project_service import AsyncProjectService
+from app.services.user_service import AsyncUserService
 from fastapi.testclient import TestClient
+from tests.fake_openai import FakeOpenAI
 
 # Load test environment variables
 load_dotenv(".env.test")
 
 # Set up the in-memory SQLite database for testing
-test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+test_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+instrument_engine(test_engine, "test")
+
+# Every request a test makes fails past this many queries, so N+1 queries can't creep in.
+# It's only a ceiling: test_query_budget pins the exact count of each endpoint.
+TEST_QUERY_BUDGET = 10
+
+@pytest.fixture(autouse=True)
+def query_budget(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_BUDGET", TEST_QUERY_BUDGET)
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    # Every test has its own database, so users cached by an earlier test are meaningless
+    from app.services.user_cache import user_cache
+    user_cache.clear()
 
 @pytest.fixture(scope="function")
 def db():
@@ -33,8 +59,96 @@ def db():
     finally:
         db.close()
 
+@pytest_asyncio.fixture(scope="function")
+async def async_session_factory():
+    # aiosqlite connections are bound to the event loop, so every test gets its own database
+    async_engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    instrument_engine(async_engine.sync_engine, "test")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    await async_engine.dispose()
+
+@pytest_asyncio.fixture(scope="function")
+async def async_db(async_session_factory):
+    async with async_session_factory() as db:
+        yield db
+
+@pytest_asyncio.fixture(scope="function")
+async def interaction_writer(async_session_factory, monkeypatch):
+    from app.api.endpoints import ai
+    from app.services import interaction_writer as interaction_writer_module
+    from app.services.interaction_writer import InteractionWriter
+
+    writer = InteractionWriter(batch_size=10, flush_interval=60, max_queue=100, session_factory=async_session_factory)
+    monkeypatch.setattr(interaction_writer_module, "interaction_writer", writer)
+    monkeypatch.setattr(ai, "interaction_writer", writer)
+    yield writer
+    await writer.aclose()
+
+@pytest_asyncio.fixture(scope="function")
+async def async_client(async_session_factory, interaction_writer, monkeypatch):
+    """Client for the app running on the test's event loop, backed by the async test database."""
+    from httpx import ASGITransport, AsyncClient
+    from app.api import deps
+
+    async def get_test_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    monkeypatch.setattr(deps, "AsyncSessionLocal", async_session_factory)
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+    app.dependency_overrides.pop(get_async_db, None)
+
+@pytest.fixture
+def signed_in(async_db):
+    """Creates a user by email and authenticates the app's requests as them, the last one signed in."""
+
+    async def sign_in(email):
+        user = await AsyncUserService(async_db).create_user(UserCreate(email=email, password="testpassword", full_name="Test User"))
+        # get_authenticated_user hands out users with their profile loaded
+        await async_db.refresh(user, ["profile"])
+        app.dependency_overrides[get_authenticated_user] = lambda: user
+        return user
+
+    yield sign_in
+    app.dependency_overrides.pop(get_authenticated_user, None)
+
+@pytest_asyncio.fixture
+async def project_owner(async_db, signed_in):
+    """A signed in user and a project of theirs."""
+    user = await signed_in("owner@example.com")
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Owned Project"))
+    return user, project
+
 @pytest.fixture(scope="module")
 def client():
     app.dependency_overrides[get_db] = lambda: TestingSessionLocal()
     with TestClient(app) as c:
         yield c
+
+@pytest_asyncio.fixture
+async def fake_openai(monkeypatch):
+    from app.core.config import settings
+    from app.services import ai_service
+    from app.services.ai_service import AIService
+    from app.services.completion_cache import CompletionCache, MemoryCompletionCache
+    from app.services.openai_client import openai_clients
+    from app.services.single_flight import SingleFlight
+    from app.services.upstream_limiter import UpstreamLimiter
+
+    async def get_user_api_key(self, user_id):
+        return "sk-test"
+
+    with FakeOpenAI() as fake:
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", fake.base_url)
+        monkeypatch.setattr(AIService, "_get_user_api_key", get_user_api_key)
+        monkeypatch.setattr(ai_service, "completion_cache", CompletionCache(MemoryCompletionCache(100, 60)))
+        monkeypatch.setattr(ai_service, "ai_flights", SingleFlight())
+        # No limits, and retries that don't slow the tests down
+        monkeypatch.setattr(ai_service, "upstream_limiter", UpstreamLimiter(retry_base_seconds=0.01))
+        yield fake
+        # The pooled connections belong to this test's event loop
+        await openai_clients.aclose()
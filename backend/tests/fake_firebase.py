@@ -0,0 +1,78 @@
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from jose import jwt
+
+
+class FakeFirebase:
+    """Local stand-in for Google's securetoken certificate endpoint.
+
+    Serves the certificate of a freshly generated signing key with a
+    ``Cache-Control: max-age`` header, counts fetches, and signs ID tokens
+    the way Firebase Auth does.
+    """
+
+    def __init__(self, project_id: str = "ai-wizard-test", kid: str = "test-key"):
+        self.project_id = project_id
+        self.kid = kid
+        self.max_age = 3600
+        # Answer with this status instead of the certificates
+        self.error_status = None
+        self.fetches = 0
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake.fetches += 1
+                if fake.error_status:
+                    self.send_response(fake.error_status)
+                    self.end_headers()
+                    return
+                payload = json.dumps({fake.kid: fake.certificate()}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={fake.max_age}, must-revalidate, no-transform")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.certs_url = f"http://127.0.0.1:{self.server.server_port}/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def certificate(self) -> str:
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.system.gserviceaccount.com")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(self._private_key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self._private_key, hashes.SHA256())
+        )
+        return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+    def id_token(self, uid: str = "firebase-user", expires_in: int = 3600, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": f"https://securetoken.google.com/{self.project_id}", "aud": self.project_id,
+            "sub": uid, "iat": now, "exp": now + expires_in, "auth_time": now, **claims,
+        }
+        private_key = self._private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        return jwt.encode(payload, private_key.decode(), algorithm="RS256", headers={"kid": self.kid})
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAI:
+    """Local stand-in for the OpenAI chat completions endpoint.
+
+    Answers with ``tokens``, as SSE chunks when the request asks for a stream,
+    and records every request body it receives.
+    """
+
+    def __init__(self):
+        self.tokens = ["Hello", ",", " world", "!"]
+        # Seconds to wait before answering and between streamed tokens
+        self.delay = 0.0
+        self.token_delay = 0.0
+        # Answer with this status, these headers and an OpenAI style error body
+        # instead; with error_count, only that many requests fail
+        self.error_status = None
+        self.error_headers = {}
+        self.error_count = None
+        self.requests = []
+        self.connections = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.requests.append(body)
+                fake.connections.add(self.client_address)
+                time.sleep(fake.delay)
+                if fake.error_status and fake.error_count != 0:
+                    if fake.error_count is not None:
+                        fake.error_count -= 1
+                    self._error()
+                elif body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._complete(body)
+
+            def _error(self):
+                payload = json.dumps({"error": {"message": "Fake upstream error", "type": "server_error", "code": None}}).encode()
+                self.send_response(fake.error_status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in fake.error_headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _complete(self, body):
+                content = "".join(fake.tokens)
+                payload = json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": len(fake.tokens), "total_tokens": 10 + len(fake.tokens)},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for token in fake.tokens + [None]:
+                    delta, finish_reason = ({"content": token}, None) if token is not None else ({}, "stop")
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(fake.token_delay)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"], "choices": [],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": len(fake.tokens), "total_tokens": 10 + len(fake.tokens)},
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,76 @@
+import json
+import pytest
+from sqlalchemy import select
+from app.models.ai_interaction import AIInteraction
+from app.services.ai_interaction_service import interaction_response_options
+from app.services.ai_service import AIService
+from app.services.user_service import AsyncUserService
+from app.services.project_service import AsyncProjectService
+from app.schemas.user import UserCreate
+from app.schemas.project import ProjectCreate
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+@pytest.mark.asyncio
+async def test_stream_code_yields_tokens(fake_openai, project_owner):
+    user, _ = project_owner
+    tokens = await AIService(user).stream_code("Write hello world")
+    assert [token async for token in tokens] == fake_openai.tokens
+    assert fake_openai.requests[0]["stream"] is True
+    assert fake_openai.requests[0]["messages"][-1] == {"role": "user", "content": "Write hello world"}
+
+@pytest.mark.asyncio
+async def test_stream_generate_code_endpoint_saves_interaction(fake_openai, project_owner, async_client, async_db, interaction_writer):
+    user, project = project_owner
+    response = await async_client.post("/api/ai/generate-code/stream", json={"project_id": project.id, "prompt": "Write hello world"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(response.text)
+    assert [data["token"] for event, data in events if event == "message"] == fake_openai.tokens
+    assert events[-1][0] == "done"
+
+    # Saved by the write-behind buffer, which hands back the id for the done event
+    assert interaction_writer.stats["flushes"] == 1
+    interaction = (await async_db.execute(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.project_id == project.id))).scalars().one()
+    assert events[-1][1] == {"interaction_id": interaction.id}
+    assert interaction.prompt == "Write hello world"
+    assert interaction.response == "Hello, world!"
+    assert interaction.user_id == user.id
+
+@pytest.mark.asyncio
+async def test_stream_refine_requirements_endpoint(fake_openai, project_owner, async_client):
+    _, project = project_owner
+    response = await async_client.post("/api/ai/refine-requirements/stream", json={"project_id": project.id, "message": "I need a todo app"})
+    assert response.status_code == 200
+    assert parse_events(response.text)[-1][0] == "done"
+
+    # The next turn is sent with the stored conversation, not a client supplied one
+    fake_openai.tokens = ["Which", " platform?"]
+    response = await async_client.post("/api/ai/refine-requirements/stream", json={"project_id": project.id, "message": "Web only"})
+    assert parse_events(response.text)[-1][0] == "done"
+    assert fake_openai.requests[-1]["messages"][1:] == [
+        {"role": "user", "content": "I need a todo app"},
+        {"role": "assistant", "content": "Hello, world!"},
+        {"role": "user", "content": "Web only"},
+    ]
+    response = await async_client.post("/api/ai/refine-requirements", json={"project_id": project.id, "message": "With tags"})
+    assert [m["content"] for m in fake_openai.requests[-1]["messages"][1:]] == ["I need a todo app", "Hello, world!", "Web only", "Which platform?", "With tags"]
+
+@pytest.mark.asyncio
+async def test_stream_rejects_foreign_project(fake_openai, project_owner, async_client, async_db):
+    other = await AsyncUserService(async_db).create_user(UserCreate(email="other_stream@example.com", password="testpassword", full_name="Other User"))
+    foreign_project = await AsyncProjectService(async_db).create_project(other.id, ProjectCreate(name="Foreign Project"))
+    response = await async_client.post("/api/ai/generate-code/stream", json={"project_id": foreign_project.id, "prompt": "Hi"})
+    assert response.status_code == 403
+    assert fake_openai.requests == []
@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.api.deps import ThreadpoolService
+from app.services.user_service import UserService, AsyncUserService
+from app.services.project_service import AsyncProjectService
+from app.services.ai_interaction_service import AsyncAIInteractionService
+from app.services.auth_service import AsyncAuthService
+from app.schemas.user import UserCreate, UserUpdate, UserProfileCreate
+from app.schemas.project import ProjectCreate, ProjectUpdate
+from app.schemas.ai_interaction import AIInteractionCreate
+
+@pytest.mark.asyncio
+async def test_async_create_and_update_user(async_db: AsyncSession):
+    user_service = AsyncUserService(async_db)
+    user = await user_service.create_user(UserCreate(email="async@example.com", password="testpassword", full_name="Async User"))
+    assert user.hashed_password != "testpassword"
+
+    fetched_user = await user_service.get_user_by_email("async@example.com")
+    assert fetched_user.id == user.id
+
+    updated_user = await user_service.update_user(user.id, UserUpdate(full_name="Updated Async User"))
+    assert updated_user.full_name == "Updated Async User"
+
+    profile = await user_service.create_user_profile(user.id, UserProfileCreate(preferences={"theme": "dark"}))
+    assert profile.preferences == '{"theme": "dark"}'
+
+    assert await user_service.delete_user(user.id) is True
+    assert await user_service.get_user(user.id) is None
+
+@pytest.mark.asyncio
+async def test_async_project_lifecycle(async_db: AsyncSession):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="async_project@example.com", password="testpassword", full_name="Async Project User"))
+    project_service = AsyncProjectService(async_db)
+
+    project = await project_service.create_project(user.id, ProjectCreate(name="Async Project", description="An async project"))
+    assert [p.id for p in await project_service.get_user_projects(user.id)] == [project.id]
+
+    updated_project = await project_service.update_project(project.id, ProjectUpdate(name="Updated Async Project"))
+    assert updated_project.name == "Updated Async Project"
+
+    assert await project_service.delete_project(project.id) is True
+    assert await project_service.get_project(project.id) is None
+
+@pytest.mark.asyncio
+async def test_async_ai_interactions(async_db: AsyncSession):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="async_ai@example.com", password="testpassword", full_name="Async AI User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Async AI Project"))
+    ai_interaction_service = AsyncAIInteractionService(async_db)
+
+    await ai_interaction_service.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt="Prompt 1", response="Response 1"))
+    await ai_interaction_service.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt="Prompt 2", response="Response 2"))
+
+    interactions = await ai_interaction_service.get_project_interactions(project.id)
+    assert [i.prompt for i in interactions] == ["Prompt 2", "Prompt 1"]
+    assert len(await ai_interaction_service.get_user_interactions(user.id)) == 2
+
+@pytest.mark.asyncio
+async def test_async_auth_service(async_db: AsyncSession):
+    await AsyncUserService(async_db).create_user(UserCreate(email="async_auth@example.com", password="testpassword", full_name="Async Auth User"))
+    auth_service = AsyncAuthService(async_db)
+
+    assert await auth_service.authenticate_user("async_auth@example.com", "wrongpassword") is None
+    user = await auth_service.authenticate_user("async_auth@example.com", "testpassword")
+    assert user.email == "async_auth@example.com"
+
+@pytest.mark.asyncio
+async def test_threadpool_service_wraps_sync_service(db: Session):
+    user_service = ThreadpoolService(UserService(db))
+    user = await user_service.create_user(UserCreate(email="threadpool@example.com", password="testpassword", full_name="Threadpool User"))
+    fetched_user = await user_service.get_user_by_email("threadpool@example.com")
+    assert fetched_user.id == user.id
+
+@pytest.mark.asyncio
+async def test_batch_interactions_endpoint(async_db: AsyncSession, async_client):
+    from app.api.deps import get_authenticated_user
+    from app.main import app
+
+    owner = await AsyncUserService(async_db).create_user(UserCreate(email="async_batch@example.com", password="testpassword", full_name="Async Batch User"))
+    other = await AsyncUserService(async_db).create_user(UserCreate(email="async_batch_other@example.com", password="testpassword", full_name="Other User"))
+    project = await AsyncProjectService(async_db).create_project(owner.id, ProjectCreate(name="Async Batch Project"))
+    batch = {"interactions": [{"prompt": f"Prompt {i}", "response": f"Response {i}"} for i in range(5)]}
+
+    app.dependency_overrides[get_authenticated_user] = lambda: owner
+    try:
+        response = await async_client.post(f"/api/projects/{project.id}/interactions:batch", json=batch)
+        assert response.status_code == 200
+        assert [i["prompt"] for i in response.json()] == [f"Prompt {i}" for i in range(5)]
+        assert len({i["id"] for i in response.json()}) == 5
+
+        assert (await async_client.post(f"/api/projects/{project.id}/interactions:batch", json={"interactions": []})).status_code == 422
+
+        app.dependency_overrides[get_authenticated_user] = lambda: other
+        assert (await async_client.post(f"/api/projects/{project.id}/interactions:batch", json=batch)).status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
+    assert len(await AsyncAIInteractionService(async_db).get_project_interactions(project.id)) == 5
+
+@pytest.mark.asyncio
+async def test_project_endpoints_are_scoped_to_owner(async_db: AsyncSession, async_client):
+    from app.api.deps import get_authenticated_user
+    from app.main import app
+
+    owner = await AsyncUserService(async_db).create_user(UserCreate(email="async_scoped@example.com", password="testpassword", full_name="Async Scoped User"))
+    other = await AsyncUserService(async_db).create_user(UserCreate(email="async_scoped_other@example.com", password="testpassword", full_name="Other User"))
+    project = await AsyncProjectService(async_db).create_project(owner.id, ProjectCreate(name="Async Scoped Project"))
+    project_id, missing_id = project.id, project.id + 1000
+
+    app.dependency_overrides[get_authenticated_user] = lambda: other
+    try:
+        assert (await async_client.get(f"/api/projects/{project_id}")).status_code == 403
+        assert (await async_client.put(f"/api/projects/{project_id}", json={"name": "Stolen"})).status_code == 403
+        assert (await async_client.delete(f"/api/projects/{project_id}")).status_code == 403
+
+        app.dependency_overrides[get_authenticated_user] = lambda: owner
+        assert (await async_client.get(f"/api/projects/{missing_id}")).status_code == 404
+        assert (await async_client.delete(f"/api/projects/{missing_id}")).status_code == 404
+        assert (await async_client.get(f"/api/projects/{project_id}")).json()["name"] == "Async Scoped Project"
+        response = await async_client.put(f"/api/projects/{project_id}", json={"name": "Renamed Async Project"})
+        assert response.status_code == 200
+        assert response.json()["name"] == "Renamed Async Project"
+        assert (await async_client.delete(f"/api/projects/{project_id}")).json() is True
+        assert (await async_client.get(f"/api/projects/{project_id}")).status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
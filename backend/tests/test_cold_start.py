@@ -0,0 +1,10 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["openai", "httpx", "jose", "passlib", "bcrypt", "firebase_admin", "numpy"]
+
+def test_importing_the_app_defers_heavy_libraries():
+    # A fresh interpreter, since the test session has long imported all of them
+    code = f"import sys, app.main; print([name for name in {HEAVY_MODULES!r} if name in sys.modules])"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
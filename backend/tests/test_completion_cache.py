@@ -0,0 +1,104 @@
+import json
+import pytest
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService
+from app.services.completion_cache import CompletionCache, MemoryCompletionCache, SQLCompletionCache, completion_cache_key
+from app.models.user import User
+from app.models.user_profile import UserProfile
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_cache_key_covers_all_parameters():
+    messages = [{"role": "user", "content": "Hi"}]
+    key = completion_cache_key("gpt-4o-mini", messages, 0.7, 1000)
+    assert key == completion_cache_key("gpt-4o-mini", [{"content": "Hi", "role": "user"}], 0.7, 1000)
+    assert key != completion_cache_key("gpt-4o", messages, 0.7, 1000)
+    assert key != completion_cache_key("gpt-4o-mini", messages, 0.0, 1000)
+    assert key != completion_cache_key("gpt-4o-mini", messages, 0.7, 200)
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCompletionCache(max_entries=2, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+    assert cache.get("a") == "A"
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+
+def test_memory_cache_expires_entries():
+    clock = FakeClock()
+    cache = MemoryCompletionCache(max_entries=2, ttl=60, clock=clock)
+    cache.set("a", "A")
+    clock.now += 59
+    assert cache.get("a") == "A"
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_new_cache_instance(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'completion_cache.db'}"
+    cache = CompletionCache(MemoryCompletionCache(10, 60), SQLCompletionCache(database_url, ttl=60))
+    await cache.set("key", "cached response")
+    await cache.aclose()
+
+    cold_cache = CompletionCache(MemoryCompletionCache(10, 60), SQLCompletionCache(database_url, ttl=60))
+    assert await cold_cache.get("key") == "cached response"
+    assert await cold_cache.get("other") is None
+    assert cold_cache.stats == {"hits": 1, "persistent_hits": 1, "misses": 1, "size": 1}
+    await cold_cache.aclose()
+
+@pytest.mark.asyncio
+async def test_persistent_tier_ignores_expired_entries(tmp_path):
+    clock = FakeClock()
+    persistent = SQLCompletionCache(f"sqlite:///{tmp_path / 'completion_cache.db'}", ttl=60, clock=clock)
+    await persistent.set("key", "cached response")
+    clock.now += 61
+    assert await persistent.get("key") is None
+    await persistent.aclose()
+
+@pytest.mark.asyncio
+async def test_generate_code_is_served_from_cache(fake_openai):
+    ai_service = AIService(User(id=1))
+    assert await ai_service.generate_code("Scaffold a FastAPI app") == "Hello, world!"
+    fake_openai.tokens = ["Something", " else"]
+    assert await ai_service.generate_code("Scaffold a FastAPI app") == "Hello, world!"
+
+    assert len(fake_openai.requests) == 1
+    assert ai_service_module.completion_cache.stats["hits"] == 1
+    assert ai_service_module.completion_cache.stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_fresh_generation_bypasses_cache(fake_openai):
+    ai_service = AIService(User(id=1))
+    await ai_service.generate_code("Scaffold a FastAPI app")
+    fake_openai.tokens = ["Something", " else"]
+    assert await ai_service.generate_code("Scaffold a FastAPI app", fresh=True) == "Something else"
+    # The fresh answer replaces the cached one
+    assert await ai_service.generate_code("Scaffold a FastAPI app") == "Something else"
+    assert len(fake_openai.requests) == 2
+
+@pytest.mark.asyncio
+async def test_user_can_opt_out_of_cache(fake_openai):
+    user = User(id=1, profile=UserProfile(preferences=json.dumps({"completion_cache": False})))
+    ai_service = AIService(user)
+    await ai_service.generate_code("Scaffold a FastAPI app")
+    await ai_service.generate_code("Scaffold a FastAPI app")
+    assert len(fake_openai.requests) == 2
+    assert len(ai_service_module.completion_cache.memory) == 0
+
+@pytest.mark.asyncio
+async def test_stream_replays_cached_completion(fake_openai):
+    ai_service = AIService(User(id=1))
+    tokens = await ai_service.stream_code("Scaffold a FastAPI app")
+    assert [token async for token in tokens] == fake_openai.tokens
+
+    tokens = await ai_service.stream_code("Scaffold a FastAPI app")
+    assert [token async for token in tokens] == ["Hello, world!"]
+    assert len(fake_openai.requests) == 1
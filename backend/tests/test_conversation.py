@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.conversation import Conversation, ConversationMessage
+from app.services.ai_service import AIService
+from app.services.conversation_service import AsyncConversationService
+from app.services.token_counter import count_tokens, count_message_tokens
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    assert count_message_tokens([{"role": "user", "content": "abcd"}]) == 5
+
+@pytest.mark.asyncio
+async def test_turns_store_token_counts(async_db: AsyncSession, project_owner):
+    _, project = project_owner
+    conversation_service = AsyncConversationService(async_db)
+    conversation = await conversation_service.get_or_create_conversation(project.id)
+    assert (await conversation_service.get_or_create_conversation(project.id)).id == conversation.id
+
+    await conversation_service.add_turn(conversation.id, "I need a todo app", "Which platform?", [], None)
+    message, reply = await conversation_service.get_active_messages(conversation.id)
+    assert (message.role, message.token_count) == ("user", count_tokens("I need a todo app"))
+    assert (reply.role, reply.token_count) == ("assistant", count_tokens("Which platform?"))
+
+    await conversation_service.add_turn(conversation.id, "Web only", "Noted", [message.id, reply.id], "User wants a todo app")
+    assert [m.content for m in await conversation_service.get_active_messages(conversation.id)] == ["Web only", "Noted"]
+    conversation = await conversation_service.get_or_create_conversation(project.id)
+    assert conversation.summary == "User wants a todo app"
+
+@pytest.mark.asyncio
+async def test_concurrent_first_turns_share_one_conversation(async_session_factory, async_db: AsyncSession, project_owner):
+    _, project = project_owner
+
+    async def first_turn():
+        async with async_session_factory() as db:
+            return (await AsyncConversationService(db).get_or_create_conversation(project.id)).id
+
+    # Both look the conversation up before either has created it
+    ids = await asyncio.gather(*(first_turn() for _ in range(3)))
+    assert len(set(ids)) == 1
+
+@pytest.mark.asyncio
+async def test_continue_requirements_sends_server_side_history(fake_openai, async_db: AsyncSession, project_owner):
+    user, project = project_owner
+    ai_service = AIService(user)
+    conversation_service = AsyncConversationService(async_db)
+
+    assert await ai_service.continue_requirements(conversation_service, project.id, "I need a todo app") == "Hello, world!"
+    fake_openai.tokens = ["Which", " platform?"]
+    assert await ai_service.continue_requirements(conversation_service, project.id, "Web only") == "Which platform?"
+
+    assert fake_openai.requests[-1]["messages"][1:] == [
+        {"role": "user", "content": "I need a todo app"},
+        {"role": "assistant", "content": "Hello, world!"},
+        {"role": "user", "content": "Web only"},
+    ]
+
+@pytest.mark.asyncio
+async def test_failed_turns_are_not_stored(fake_openai, async_db: AsyncSession, project_owner):
+    user, project = project_owner
+    conversation_service = AsyncConversationService(async_db)
+    fake_openai.error_status = 500
+    assert await AIService(user).continue_requirements(conversation_service, project.id, "I need a todo app") == "An error occurred while refining requirements."
+
+    # Neither the message nor a reply is left behind for the next turn to pick up
+    conversation = await conversation_service.get_or_create_conversation(project.id)
+    assert await conversation_service.get_active_messages(conversation.id) == []
+    fake_openai.error_status = None
+    await AIService(user).continue_requirements(conversation_service, project.id, "Web only")
+    assert fake_openai.requests[-1]["messages"][1:] == [{"role": "user", "content": "Web only"}]
+
+@pytest.mark.asyncio
+async def test_old_turns_are_folded_into_summary(fake_openai, async_db: AsyncSession, project_owner, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_TOKEN_BUDGET", 60)
+    user, project = project_owner
+    ai_service = AIService(user)
+    conversation_service = AsyncConversationService(async_db)
+
+    for turn in range(6):
+        fake_openai.tokens = [f"Reply {turn} " + "x" * 40]
+        await ai_service.continue_requirements(conversation_service, project.id, f"Requirement {turn} " + "y" * 40)
+
+    summary_requests = [r for r in fake_openai.requests if "summarize" in r["messages"][0]["content"]]
+    assert summary_requests
+    conversation = await conversation_service.get_or_create_conversation(project.id)
+    assert conversation.summary
+    assert conversation.summary_token_count == count_tokens(conversation.summary)
+
+    # The prompt stays within the budget no matter how long the session gets
+    last_prompt = fake_openai.requests[-1]["messages"]
+    assert last_prompt[1]["content"].startswith("Summary of the conversation so far")
+    assert sum(count_tokens(m["content"]) for m in last_prompt[2:]) <= settings.CONVERSATION_TOKEN_BUDGET
+
+@pytest.mark.asyncio
+async def test_refine_requirements_endpoint(fake_openai, project_owner, async_client):
+    _, project = project_owner
+    response = await async_client.post("/api/ai/refine-requirements", json={"project_id": project.id, "message": "I need a todo app"})
+    assert response.status_code == 200
+    assert response.json() == {"response": "Hello, world!"}
+
+@pytest.mark.asyncio
+async def test_deleting_a_project_deletes_its_conversation(fake_openai, async_db: AsyncSession, project_owner, async_client):
+    # As PostgreSQL always does
+    await async_db.execute(text("PRAGMA foreign_keys = ON"))
+    await async_db.commit()
+    assert (await async_db.execute(text("PRAGMA foreign_keys"))).scalar() == 1
+    _, project = project_owner
+    await async_client.post("/api/ai/refine-requirements", json={"project_id": project.id, "message": "I need a todo app"})
+    assert await async_db.scalar(select(func.count()).select_from(ConversationMessage)) == 2
+
+    response = await async_client.delete(f"/api/projects/{project.id}")
+    assert response.status_code == 200
+    assert await async_db.scalar(select(func.count()).select_from(Conversation)) == 0
+    assert await async_db.scalar(select(func.count()).select_from(ConversationMessage)) == 0
@@ -0,0 +1,129 @@
+import pytest
+import pytest_asyncio
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi import HTTPException
+from app.services.firebase_tokens import FirebaseTokenVerifier, InvalidFirebaseToken, PublicCertificates
+from tests.fake_firebase import FakeFirebase
+
+@pytest_asyncio.fixture
+async def fake_firebase():
+    with FakeFirebase() as fake:
+        yield fake
+
+@pytest_asyncio.fixture
+async def verifier(fake_firebase):
+    verifier = FirebaseTokenVerifier(PublicCertificates(fake_firebase.certs_url), max_entries=2, project_id=fake_firebase.project_id)
+    yield verifier
+    await verifier.aclose()
+
+def test_firebase_is_not_initialized_on_import():
+    # Importing the auth dependency must not read the service account or initialize the SDK
+    import app.api.auth  # noqa: F401
+    from app.services import firebase_tokens
+    assert firebase_tokens._firebase_app is None
+
+@pytest.mark.asyncio
+async def test_verified_tokens_are_cached(fake_firebase, verifier):
+    token = fake_firebase.id_token(uid="user-1", email="firebase@example.com")
+    claims = await verifier.verify(token)
+    assert claims["uid"] == "user-1"
+    assert claims["email"] == "firebase@example.com"
+
+    assert await verifier.verify(token) == claims
+    assert verifier.stats["hits"] == 1
+    assert verifier.stats["misses"] == 1
+    assert fake_firebase.fetches == 1
+
+@pytest.mark.asyncio
+async def test_cached_claims_expire_with_the_token(fake_firebase, verifier, monkeypatch):
+    token = fake_firebase.id_token(expires_in=60)
+    claims = await verifier.verify(token)
+    monkeypatch.setattr(verifier, "_clock", lambda: claims["exp"])
+    # Past its exp the token is not served from the cache but verified again
+    await verifier.verify(token)
+    assert verifier.stats["hits"] == 0
+    assert verifier.stats["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_rejects_tokens_for_other_projects_and_keys(fake_firebase, verifier):
+    with pytest.raises(InvalidFirebaseToken):
+        await verifier.verify(fake_firebase.id_token(aud="another-project"))
+    fake_firebase.kid = "unknown-key"
+    token = fake_firebase.id_token()
+    fake_firebase.kid = "test-key"
+    with pytest.raises(InvalidFirebaseToken, match="kid"):
+        await verifier.verify(token)
+    with pytest.raises(InvalidFirebaseToken):
+        await verifier.verify("not-a-jwt")
+
+@pytest.mark.asyncio
+async def test_unknown_key_refetches_the_certificates_at_most_once_a_minute(fake_firebase):
+    clock = [0.0]
+    verifier = FirebaseTokenVerifier(PublicCertificates(fake_firebase.certs_url, clock=lambda: clock[0]), max_entries=10, project_id=fake_firebase.project_id)
+    await verifier.verify(fake_firebase.id_token(uid="before-rotation"))
+
+    # Google rotated in a new key since the certificates were fetched
+    clock[0] += 60
+    fake_firebase.kid = "rotated-key"
+    assert (await verifier.verify(fake_firebase.id_token(uid="after-rotation")))["uid"] == "after-rotation"
+    assert fake_firebase.fetches == 2
+
+    fake_firebase.kid = "unknown-key"
+    forged = fake_firebase.id_token()
+    fake_firebase.kid = "rotated-key"
+    for _ in range(3):
+        with pytest.raises(InvalidFirebaseToken, match="kid"):
+            await verifier.verify(forged)
+    assert fake_firebase.fetches == 2
+    clock[0] += 60
+    with pytest.raises(InvalidFirebaseToken, match="kid"):
+        await verifier.verify(forged)
+    assert fake_firebase.fetches == 3
+    await verifier.aclose()
+
+@pytest.mark.asyncio
+async def test_certificates_are_refreshed_in_the_background(fake_firebase):
+    import asyncio
+    fake_firebase.max_age = 0
+    certificates = PublicCertificates(fake_firebase.certs_url)
+    await certificates.get_key(fake_firebase.kid)
+    await asyncio.sleep(1.5)
+    assert certificates.fetches >= 2
+    await certificates.aclose()
+
+@pytest.mark.asyncio
+async def test_certificates_of_a_previous_event_loop_are_closed(fake_firebase):
+    import asyncio
+    import threading
+    certificates = PublicCertificates(fake_firebase.certs_url)
+
+    # First used on a loop that is still running in another thread
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(certificates.get_key(fake_firebase.kid), other_loop).result(10)
+    old_task, old_client = certificates._task, certificates._client
+    await certificates.get_key(fake_firebase.kid)
+    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), other_loop))
+    assert old_task.cancelled()
+    assert old_client.is_closed
+    other_loop.call_soon_threadsafe(other_loop.stop)
+    thread.join()
+
+    # Then on one that has been closed since
+    await asyncio.to_thread(asyncio.run, certificates.get_key(fake_firebase.kid))
+    old_client = certificates._client
+    await certificates.get_key(fake_firebase.kid)
+    await asyncio.sleep(0.1)
+    assert old_client.is_closed
+    await certificates.aclose()
+
+@pytest.mark.asyncio
+async def test_auth_dependency_returns_claims(fake_firebase, verifier, monkeypatch):
+    from app.api import auth
+    monkeypatch.setattr(auth, "firebase_tokens", verifier)
+    claims = await auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=fake_firebase.id_token(uid="user-2")))
+    assert claims["uid"] == "user-2"
+    with pytest.raises(HTTPException) as error:
+        await auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials="not-a-jwt"))
+    assert error.value.status_code == 401
@@ -0,0 +1,145 @@
+import datetime
+import gzip
+import brotli
+import pytest
+from sqlalchemy import update
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from app.api.conditional import Validators
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+from app.core.config import settings
+from app.models.project import Project
+from app.services.project_service import AsyncProjectService
+from app.services.ai_interaction_service import AsyncAIInteractionService
+from app.schemas.project import ProjectCreate
+from app.schemas.ai_interaction import AIInteractionCreate
+
+async def backdate_project(async_db, project_id):
+    # Changes of the current second get no Last-Modified
+    earlier = datetime.datetime.utcnow() - datetime.timedelta(seconds=5)
+    await async_db.execute(update(Project).where(Project.id == project_id).values(created_at=earlier, updated_at=earlier))
+    await async_db.commit()
+
+@pytest.mark.asyncio
+async def test_project_list_revalidates_without_loading_rows(async_client, async_db, signed_in, monkeypatch):
+    user = await signed_in("etag_projects@example.com")
+    projects = AsyncProjectService(async_db)
+    project = await projects.create_project(user.id, ProjectCreate(name="Polled Project"))
+    await backdate_project(async_db, project.id)
+
+    response = await async_client.get("/api/projects/")
+    assert response.status_code == 200
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    assert etag.startswith('W/"')
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    # Answered from the version query alone
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 1)
+    not_modified = await async_client.get("/api/projects/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert (await async_client.get("/api/projects/", headers={"If-Modified-Since": last_modified})).status_code == 304
+    assert (await async_client.get("/api/projects/", headers={"If-None-Match": '"other", ' + etag.removeprefix("W/")})).status_code == 304
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 10)
+    # If-None-Match wins over a matching If-Modified-Since
+    assert (await async_client.get("/api/projects/", headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified})).status_code == 200
+
+    # Every change to the listed projects changes the ETag
+    await async_client.put(f"/api/projects/{project.id}", json={"description": "Updated"})
+    updated = (await async_client.get("/api/projects/")).headers["etag"]
+    second = await projects.create_project(user.id, ProjectCreate(name="Second Project"))
+    created = (await async_client.get("/api/projects/")).headers["etag"]
+    assert len({etag, updated, created}) == 3
+    # Deleting the new project restores the earlier listing, and with it the ETag
+    await async_client.delete(f"/api/projects/{second.id}")
+    assert (await async_client.get("/api/projects/")).headers["etag"] == updated
+    # Pages have their own validators
+    assert (await async_client.get("/api/projects/?limit=1", headers={"If-None-Match": etag})).status_code == 200
+
+def test_changes_in_the_current_second_are_not_dated():
+    utc = datetime.timezone.utc
+    changed = datetime.datetime(2024, 5, 1, 12, 0, 0, 250000)
+    # Another change later in the same second would carry the same date
+    same_second = Validators.of(1, last_modified=changed, now=datetime.datetime(2024, 5, 1, 12, 0, 0, 900000, tzinfo=utc))
+    assert same_second.last_modified is None
+    assert "Last-Modified" not in same_second.headers
+    assert Validators.of(1, last_modified=changed, now=datetime.datetime(2024, 5, 1, 12, 0, 1, tzinfo=utc)).last_modified == datetime.datetime(2024, 5, 1, 12, 0, 0, tzinfo=utc)
+
+@pytest.mark.asyncio
+async def test_project_interactions_revalidate_and_stay_scoped_to_owner(async_client, async_db, signed_in, monkeypatch):
+    owner = await signed_in("etag_interactions@example.com")
+    project = await AsyncProjectService(async_db).create_project(owner.id, ProjectCreate(name="Polled Interactions"))
+    url = f"/api/projects/{project.id}/interactions"
+
+    empty = await async_client.get(url)
+    assert empty.json() == []
+    await AsyncAIInteractionService(async_db).create_ai_interaction(owner.id, project.id, AIInteractionCreate(prompt="Hi", response="Hello"))
+    response = await async_client.get(url, headers={"If-None-Match": empty.headers["etag"]})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.headers["etag"] != empty.headers["etag"]
+
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 1)
+    assert (await async_client.get(url, headers={"If-None-Match": response.headers["etag"]})).status_code == 304
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 10)
+
+    await signed_in("etag_interactions_other@example.com")
+    assert (await async_client.get(url, headers={"If-None-Match": response.headers["etag"]})).status_code == 403
+    assert (await async_client.get(f"/api/projects/{project.id + 1000}/interactions")).status_code == 404
+
+@pytest.mark.asyncio
+async def test_large_lists_are_compressed_as_negotiated(async_client, async_db, signed_in):
+    user = await signed_in("compressed@example.com")
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Compressed Project"))
+    await AsyncProjectService(async_db).create_ai_interactions(
+        user.id, project.id, [AIInteractionCreate(prompt=f"Prompt {i}", response="print('hello world')\n" * 20) for i in range(20)]
+    )
+    url = f"/api/projects/{project.id}/interactions"
+
+    identity = await async_client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    for accept, encoding in [("gzip, deflate, br", "br"), ("gzip", "gzip"), ("br;q=0.5, gzip", "gzip")]:
+        response = await async_client.get(url, headers={"Accept-Encoding": accept})
+        assert response.headers["content-encoding"] == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(identity.content) / 4
+        assert response.json() == identity.json()
+    # The validators are those of the uncompressed representation
+    assert response.headers["etag"] == identity.headers["etag"]
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.8") == "gzip"
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("br;q=0, *;q=0.1") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+@pytest.mark.asyncio
+async def test_compression_threshold_and_passthrough():
+    async def stream():
+        for chunk in ("data: a\n\n", "data: b\n\n"):
+            yield chunk * 100
+
+    app = Starlette(routes=[
+        Route("/small", lambda request: PlainTextResponse("x" * 99)),
+        Route("/large", lambda request: PlainTextResponse("x" * 100)),
+        Route("/binary", lambda request: Response(b"x" * 100, media_type="application/octet-stream")),
+        Route("/events", lambda request: StreamingResponse(stream(), media_type="text/event-stream")),
+    ])
+    async with AsyncClient(transport=ASGITransport(app=CompressionMiddleware(app, minimum_size=100)), base_url="http://test") as client:
+        headers = {"Accept-Encoding": "gzip"}
+        assert "content-encoding" not in (await client.get("/small", headers=headers)).headers
+        assert "content-encoding" not in (await client.get("/binary", headers=headers)).headers
+        async with client.stream("GET", "/large", headers=headers) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert gzip.decompress(b"".join([chunk async for chunk in response.aiter_raw()])) == b"x" * 100
+        events = await client.get("/events", headers=headers)
+        assert "content-encoding" not in events.headers
+        assert events.text == "data: a\n\n" * 100 + "data: b\n\n" * 100
+
+        async with client.stream("GET", "/large", headers={"Accept-Encoding": "br"}) as response:
+            assert brotli.decompress(b"".join([chunk async for chunk in response.aiter_raw()])) == b"x" * 100
@@ -0,0 +1,126 @@
+import sqlite3
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+from app.models.ai_interaction import AIInteraction, delete_unreferenced_blobs
+from app.models.interaction_blob import InteractionBlob, RAW, ZSTD, blob_rows, body_hash, compress_body, decompress_body, insert_blobs
+from app.services.ai_interaction_service import AIInteractionService, interaction_response_options
+from app.services.project_service import ProjectService
+from app.services.user_service import UserService
+from app.schemas.ai_interaction import AIInteractionCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+
+CODE = "def handler(event, context):\n    return {'statusCode': 200, 'body': 'ok'}\n" * 20
+
+def test_bodies_are_compressed_unless_tiny():
+    assert compress_body(CODE)[:1] == ZSTD
+    assert len(compress_body(CODE)) < len(CODE) / 10
+    assert compress_body("Hi") == RAW + b"Hi"
+    for body in (CODE, "Hi", "", "ünïcödé " * 20):
+        assert decompress_body(compress_body(body)) == body
+
+def test_bodies_are_stored_once_and_loaded_only_on_request(db: Session):
+    user = UserService(db).create_user(UserCreate(email="blobs@example.com", password="testpassword", full_name="Blob User"))
+    project = ProjectService(db).create_project(user.id, ProjectCreate(name="Blob Project"))
+    service = AIInteractionService(db)
+    blobs_before = db.scalar(select(func.count()).select_from(InteractionBlob))
+    created = service.create_ai_interactions(user.id, project.id, [AIInteractionCreate(prompt=f"Write a handler {i}", response=CODE) for i in range(10)])
+    assert [i.response for i in created] == [CODE] * 10
+    single = service.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt="Write a handler 0", response=CODE))
+    assert single.prompt == "Write a handler 0"
+
+    # Ten prompts and one response, however often they were sent
+    assert db.scalar(select(func.count()).select_from(InteractionBlob)) == blobs_before + 11
+    stored = db.execute(text("SELECT size, length(body) FROM interaction_blobs WHERE hash = :hash"), {"hash": single.response_hash}).one()
+    assert stored[0] == len(CODE)
+    assert stored[1] < len(CODE) / 10
+
+    project_id, single_id = project.id, single.id
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        db.expunge_all()
+        interactions = db.scalars(select(AIInteraction).filter(AIInteraction.project_id == project_id)).all()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+    assert len(interactions) == 11
+    assert "interaction_blobs" not in statements[0]
+    with pytest.raises(InvalidRequestError):
+        interactions[0].response
+
+    loaded = service.get_project_interactions(project_id)
+    assert {i.response for i in loaded} == {CODE}
+    assert db.execute(select(AIInteraction.id, AIInteraction.prompt).filter(AIInteraction.id == single_id)).one().prompt == "Write a handler 0"
+
+def test_changed_bodies_get_new_blobs(db: Session):
+    user = UserService(db).create_user(UserCreate(email="blobs_update@example.com", password="testpassword", full_name="Blob Update User"))
+    project = ProjectService(db).create_project(user.id, ProjectCreate(name="Blob Update Project"))
+    interaction = AIInteractionService(db).create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt="Prompt", response="Old response"))
+    interaction_id, old_hash = interaction.id, interaction.response_hash
+
+    interaction.response = "New response"
+    db.commit()
+    db.expunge_all()
+    reloaded = db.scalars(select(AIInteraction).options(*interaction_response_options).filter(AIInteraction.id == interaction_id)).one()
+    assert reloaded.response == "New response"
+    assert reloaded.response_hash != old_hash
+    # Nothing refers to the old response any more
+    assert db.get(InteractionBlob, old_hash) is None
+
+def test_blobs_go_with_their_last_interaction(db: Session):
+    user = UserService(db).create_user(UserCreate(email="blobs_delete@example.com", password="testpassword", full_name="Blob Delete User"))
+    project = ProjectService(db).create_project(user.id, ProjectCreate(name="Blob Delete Project"))
+    first, second = AIInteractionService(db).create_ai_interactions(
+        user.id, project.id, [AIInteractionCreate(prompt="Shared prompt", response="First"), AIInteractionCreate(prompt="Shared prompt", response="Second")]
+    )
+    shared, first_response, second_response = first.prompt_hash, first.response_hash, second.response_hash
+
+    db.delete(first)
+    db.commit()
+    assert db.get(InteractionBlob, first_response) is None
+    assert db.get(InteractionBlob, shared) is not None
+    db.delete(db.get(AIInteraction, second.id))
+    db.commit()
+    assert db.get(InteractionBlob, shared) is None
+    assert db.get(InteractionBlob, second_response) is None
+
+def test_reused_blobs_are_locked_against_concurrent_deletes():
+    # PostgreSQL only: SQLite runs one write transaction at a time
+    from sqlalchemy.dialects import postgresql
+    insert = str(insert_blobs("postgresql").compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (hash) DO UPDATE SET size = excluded.size" in insert
+    delete = str(delete_unreferenced_blobs([body_hash("Shared prompt")]).compile(dialect=postgresql.dialect()))
+    assert delete.endswith("FOR UPDATE SKIP LOCKED)")
+    assert [row["hash"] for row in blob_rows(["b", "a", "b", "c"])] == sorted(body_hash(text) for text in "abc")
+
+def test_migration_moves_bodies_into_blobs_and_back(tmp_path):
+    database_path = tmp_path / "blob_migration.db"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{database_path}")
+    command.upgrade(config, "0004")
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO users (id, email, hashed_password) VALUES (1, 'blob_migration@example.com', 'x')")
+        connection.executemany(
+            "INSERT INTO ai_interactions (user_id, prompt, response) VALUES (1, ?, ?)",
+            [(f"Migrated prompt {i % 3}", CODE if i % 2 else "Short answer") for i in range(10)],
+        )
+    command.upgrade(config, "head")
+
+    engine = create_engine(f"sqlite:///{database_path}")
+    with Session(engine) as db:
+        assert db.scalar(select(func.count()).select_from(InteractionBlob)) == 5
+        rows = db.execute(select(AIInteraction.id, AIInteraction.prompt, AIInteraction.response).order_by(AIInteraction.id)).all()
+        assert [(row.prompt, row.response) for row in rows] == [(f"Migrated prompt {i % 3}", CODE if i % 2 else "Short answer") for i in range(10)]
+        # The search index reads the converted bodies
+        assert db.execute(text("SELECT count(*) FROM ai_interactions_fts WHERE ai_interactions_fts MATCH 'handler'")).scalar() == 5
+    engine.dispose()
+
+    command.downgrade(config, "0004")
+    with sqlite3.connect(database_path) as connection:
+        assert connection.execute("SELECT prompt, response FROM ai_interactions WHERE id = 2").fetchone() == ("Migrated prompt 1", CODE)
+        assert connection.execute("SELECT count(*) FROM ai_interactions_fts WHERE ai_interactions_fts MATCH 'short'").fetchone() == (5,)
@@ -0,0 +1,136 @@
+import asyncio
+import csv
+import gzip
+import io
+import tracemalloc
+import brotli
+import orjson
+import pytest
+from sqlalchemy import insert
+from app.api.deps import ThreadpoolService
+from app.core.config import settings
+from app.models.ai_interaction import AIInteraction, interaction_body_rows
+from app.models.interaction_blob import insert_blobs
+from app.services.user_service import UserService
+from app.services.project_service import AsyncProjectService, ProjectService
+from app.services.ai_interaction_service import AsyncAIInteractionService, AIInteractionService
+from app.schemas.user import UserCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.ai_interaction import AIInteractionCreate
+
+RESPONSE = "def handler(event, context):\n    return {'statusCode': 200, 'body': \"ok, done\"}\n" * 10
+
+async def add_interactions(async_db, user_id, count):
+    # Written in bulk, as creating thousands of interactions through the service would take a while
+    project = await AsyncProjectService(async_db).create_project(user_id, ProjectCreate(name=f"Export Project {count}"))
+    rows = [{"user_id": user_id, "project_id": project.id, "prompt": f"Write handler {i}", "response": RESPONSE} for i in range(count)]
+    blobs, rows = interaction_body_rows(rows)
+    await async_db.execute(insert_blobs("sqlite"), blobs)
+    await async_db.execute(insert(AIInteraction), rows)
+    await async_db.commit()
+
+@pytest.mark.asyncio
+async def test_export_streams_ndjson_and_csv_of_own_interactions(async_client, async_db, signed_in, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    other = await signed_in("export_other@example.com")
+    await AsyncProjectService(async_db).create_ai_interactions(other.id, (await AsyncProjectService(async_db).create_project(other.id, ProjectCreate(name="Other"))).id, [AIInteractionCreate(prompt="Not mine", response="Hidden")])
+    user = await signed_in("export@example.com")
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Exported Project"))
+    created = await AsyncAIInteractionService(async_db).create_ai_interactions(user.id, project.id, [AIInteractionCreate(prompt=f"Prompt {i}, \"quoted\"", response=RESPONSE) for i in range(5)])
+
+    response = await async_client.get("/api/users/me/interactions/export", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="interactions.ndjson"'
+    assert "content-encoding" not in response.headers
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [line["id"] for line in lines] == [i.id for i in created]
+    assert lines[0] == {"id": created[0].id, "user_id": user.id, "project_id": project.id, "prompt": "Prompt 0, \"quoted\"", "response": RESPONSE, "created_at": created[0].created_at.isoformat()}
+
+    response = await async_client.get("/api/users/me/interactions/export?format=csv", headers={"Accept-Encoding": "identity"})
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["prompt"] for row in rows] == [f"Prompt {i}, \"quoted\"" for i in range(5)]
+    assert rows[4]["response"] == RESPONSE
+    assert rows[4]["created_at"] == created[4].created_at.isoformat()
+
+    assert (await async_client.get("/api/users/me/interactions/export?format=xml")).status_code == 422
+
+@pytest.mark.asyncio
+async def test_export_is_compressed_as_it_streams(async_client, async_db, signed_in):
+    user = await signed_in("export_compressed@example.com")
+    await add_interactions(async_db, user.id, 50)
+
+    plain = (await async_client.get("/api/users/me/interactions/export", headers={"Accept-Encoding": "identity"})).content
+    for accept, encoding, decompress in [("gzip", "gzip", gzip.decompress), ("gzip, br", "br", brotli.decompress)]:
+        async with async_client.stream("GET", "/api/users/me/interactions/export", headers={"Accept-Encoding": accept}) as response:
+            assert response.headers["content-encoding"] == encoding
+            assert "content-length" not in response.headers
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        assert len(raw) < len(plain) / 10
+        assert decompress(raw) == plain
+
+@pytest.mark.asyncio
+async def test_export_through_sync_service(db):
+    user = UserService(db).create_user(UserCreate(email="export_sync@example.com", password="testpassword", full_name="Export Sync User"))
+    project = ProjectService(db).create_project(user.id, ProjectCreate(name="Sync Export"))
+    AIInteractionService(db).create_ai_interactions(user.id, project.id, [AIInteractionCreate(prompt=f"Prompt {i}", response="Response") for i in range(5)])
+
+    batches = [rows async for rows in ThreadpoolService(AIInteractionService(db)).stream_user_interaction_rows(user.id, 2)]
+    assert [len(rows) for rows in batches] == [2, 2, 1]
+    assert [row["prompt"] for rows in batches for row in rows] == [f"Prompt {i}" for i in range(5)]
+
+async def export_peak_memory(path: str) -> tuple[int, int]:
+    """Runs the export ASGI app directly, dropping every chunk once sent, and
+    returns the bytes sent and the peak memory traced while sending them.
+
+    httpx's ASGI transport collects the whole body, which would swamp the measurement.
+    """
+    from app.main import app
+
+    sent = 0
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            # StreamingResponse listens for a disconnect until the body is sent
+            await asyncio.Event().wait()
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"test"), (b"accept-encoding", b"identity")], "client": ("test", 1), "server": ("test", 80),
+    }
+    tracemalloc.start()
+    try:
+        await app(scope, receive, send)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return sent, peak
+
+@pytest.mark.asyncio
+async def test_export_memory_stays_flat(async_client, async_db, signed_in, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 100)
+    small = await signed_in("export_small@example.com")
+    await add_interactions(async_db, small.id, 1_000)
+    # Warm up the statement caches, which would otherwise count against the first export
+    await export_peak_memory("/api/users/me/interactions/export")
+    small_size, small_peak = await export_peak_memory("/api/users/me/interactions/export")
+
+    large = await signed_in("export_large@example.com")
+    await add_interactions(async_db, large.id, 10_000)
+    large_size, large_peak = await export_peak_memory("/api/users/me/interactions/export")
+
+    assert large_size > 9 * small_size
+    # Ten times the rows, not ten times the memory
+    assert large_peak < 1.5 * small_peak
+    assert large_peak < large_size / 5
@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from app.models.base import Base
+from app.models.ai_interaction import AIInteraction
+from app.schemas.ai_interaction import AIInteractionCreate
+from app.services.interaction_writer import InteractionWriter
+
+async def count_interactions(db: AsyncSession) -> int:
+    return (await db.execute(select(func.count()).select_from(AIInteraction))).scalar_one()
+
+def interaction(i: int) -> AIInteractionCreate:
+    return AIInteractionCreate(prompt=f"Prompt {i}", response=f"Response {i}")
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_in_background(async_session_factory, async_db: AsyncSession):
+    writer = InteractionWriter(batch_size=5, flush_interval=60, max_queue=100, session_factory=async_session_factory)
+    for i in range(4):
+        writer.enqueue(1, 1, interaction(i))
+    await asyncio.sleep(0.05)
+    assert await count_interactions(async_db) == 0
+
+    writer.enqueue(1, 1, interaction(4))
+    for _ in range(50):
+        if writer.stats["flushed"] == 5:
+            break
+        await asyncio.sleep(0.01)
+    assert await count_interactions(async_db) == 5
+    assert writer.stats["flushes"] == 1
+    assert writer.stats["queue_depth"] == 0
+    await writer.aclose()
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_after_interval(async_session_factory, async_db: AsyncSession):
+    writer = InteractionWriter(batch_size=100, flush_interval=0.05, max_queue=100, session_factory=async_session_factory)
+    writer.enqueue(1, 1, interaction(0))
+    await asyncio.sleep(0.2)
+    assert await count_interactions(async_db) == 1
+    await writer.aclose()
+
+@pytest.mark.asyncio
+async def test_close_flushes_remaining_interactions(async_session_factory, async_db: AsyncSession):
+    writer = InteractionWriter(batch_size=10, flush_interval=60, max_queue=100, session_factory=async_session_factory)
+    for i in range(25):
+        writer.enqueue(1, 1, interaction(i))
+    await writer.aclose()
+    assert await count_interactions(async_db) == 25
+    # Three bulk inserts of at most batch_size rows
+    assert writer.stats["flushes"] == 3
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_for_retry(async_session_factory, async_db: AsyncSession):
+    calls = []
+    def broken_session():
+        calls.append(1)
+        raise RuntimeError("database unavailable")
+
+    writer = InteractionWriter(batch_size=10, flush_interval=60, max_queue=3, session_factory=broken_session)
+    for i in range(5):
+        writer.enqueue(1, 1, interaction(i))
+    assert writer.stats["dropped"] == 2
+
+    await writer.flush()
+    assert writer.stats["failed_flushes"] == 1
+    assert len(writer) == 3
+
+    writer.session_factory = async_session_factory
+    await writer.aclose()
+    prompts = (await async_db.execute(select(AIInteraction.prompt).select_from(AIInteraction).order_by(AIInteraction.id))).scalars().all()
+    assert prompts == ["Prompt 2", "Prompt 3", "Prompt 4"]
+
+@pytest.mark.asyncio
+async def test_rows_the_database_rejects_are_isolated_and_dropped(async_session_factory, async_db: AsyncSession, project_owner):
+    # As PostgreSQL always does, so an interaction of a deleted project can't be saved
+    await async_db.execute(text("PRAGMA foreign_keys = ON"))
+    await async_db.commit()
+    user, project = project_owner
+    writer = InteractionWriter(batch_size=10, flush_interval=60, max_queue=100, session_factory=async_session_factory)
+    saves = [asyncio.ensure_future(writer.save(user.id, project.id if i != 5 else project.id + 1000, interaction(i))) for i in range(8)]
+    results = await asyncio.gather(*saves, return_exceptions=True)
+
+    assert isinstance(results[5], IntegrityError)
+    prompts = (await async_db.execute(select(AIInteraction.id, AIInteraction.prompt).order_by(AIInteraction.id))).all()
+    assert [row.prompt for row in prompts] == [f"Prompt {i}" for i in range(8) if i != 5]
+    assert results[:5] + results[6:] == [row.id for row in prompts]
+    assert (writer.stats["rejected"], writer.stats["queue_depth"]) == (1, 0)
+    # The failed halves were split until the bad row failed on its own: 8, 4, 2 and 1 rows
+    assert writer.stats["failed_flushes"] == 4
+    await writer.aclose()
+
+@pytest.mark.asyncio
+async def test_saves_share_a_flush_and_get_their_ids(async_session_factory, async_db: AsyncSession):
+    writer = InteractionWriter(batch_size=100, flush_interval=60, max_queue=100, session_factory=async_session_factory)
+    ids = await asyncio.gather(*(writer.save(1, 1, interaction(i)) for i in range(5)))
+    rows = (await async_db.execute(select(AIInteraction.id, AIInteraction.prompt).order_by(AIInteraction.id))).all()
+    assert ids == [row.id for row in rows]
+    assert [row.prompt for row in rows] == [f"Prompt {i}" for i in range(5)]
+    # Not one flush per save
+    assert writer.stats["flushes"] == 1
+    await writer.aclose()
+
+@pytest.mark.asyncio
+async def test_save_gives_up_waiting_after_flush_interval(async_session_factory, async_db: AsyncSession):
+    def broken_session():
+        raise RuntimeError("database unavailable")
+
+    writer = InteractionWriter(batch_size=100, flush_interval=0.05, max_queue=100, session_factory=broken_session)
+    assert await writer.save(1, 1, interaction(0)) is None
+    # Still queued, and saved once the database is back
+    writer.session_factory = async_session_factory
+    await writer.aclose()
+    assert await count_interactions(async_db) == 1
+
+def test_writer_moves_to_a_new_event_loop(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'loops.db'}")
+    writer = InteractionWriter(batch_size=100, flush_interval=60, max_queue=100, session_factory=async_sessionmaker(engine))
+
+    async def save_twice(i):
+        # A second save waits on the lock of the flush the first one started
+        await asyncio.gather(writer.save(1, None, interaction(i)), writer.save(1, None, interaction(i + 1)))
+        await engine.dispose()
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+
+    asyncio.run(create_tables())
+    # Like a module level writer across Lambda invocations, each on its own loop
+    asyncio.run(save_twice(0))
+    asyncio.run(save_twice(2))
+    assert writer.stats["flushed"] == 4
+
+@pytest.mark.asyncio
+async def test_middleware_flushes_after_each_request(interaction_writer, async_db: AsyncSession):
+    from httpx import ASGITransport, AsyncClient
+    from app.services.interaction_writer import FlushInteractionsMiddleware
+
+    async def endpoint(scope, receive, send):
+        interaction_writer.enqueue(1, 1, interaction(0))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async with AsyncClient(transport=ASGITransport(app=FlushInteractionsMiddleware(endpoint)), base_url="http://test") as client:
+        assert (await client.get("/")).status_code == 200
+    assert len(interaction_writer) == 0
+    assert await count_interactions(async_db) == 1
@@ -0,0 +1,90 @@
+import base64
+import importlib.util
+import json
+import os
+import pytest
+
+HANDLER_DIR = os.path.join(os.path.dirname(__file__), "..", "terraform", "lambda")
+
+@pytest.fixture(scope="module")
+def lambda_handler():
+    spec = importlib.util.spec_from_file_location("lambda_handler", os.path.join(HANDLER_DIR, "lambda_handler.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    module.loop.close()
+
+def recorded_event(name):
+    with open(os.path.join(HANDLER_DIR, "events", name)) as f:
+        return json.load(f)
+
+def test_rest_api_event(lambda_handler):
+    result = lambda_handler.handler(recorded_event("rest_api_get_root.json"), None)
+    assert result["statusCode"] == 200
+    assert result["isBase64Encoded"] is False
+    assert result["multiValueHeaders"]["content-type"] == ["application/json"]
+    assert json.loads(result["body"]) == {"message": "Welcome to the AI Assistant API"}
+
+def test_http_api_event(lambda_handler):
+    result = lambda_handler.handler(recorded_event("http_api_get_projects_unauthenticated.json"), None)
+    assert result["statusCode"] == 401
+    assert result["headers"]["www-authenticate"] == "Bearer"
+
+def test_request_body_reaches_the_app(lambda_handler):
+    event = recorded_event("rest_api_get_root.json")
+    event.update(
+        path="/api/users/",
+        httpMethod="POST",
+        body=base64.b64encode(json.dumps({"email": "not-an-email"}).encode()).decode(),
+        isBase64Encoded=True,
+    )
+    event["multiValueHeaders"]["Content-Type"] = ["application/json"]
+    result = lambda_handler.handler(event, None)
+    assert result["statusCode"] == 422
+    assert {error["loc"][-1] for error in json.loads(result["body"])["detail"]} >= {"email", "password"}
+
+def test_warm_invocations_share_the_event_loop_and_lifespan(lambda_handler):
+    lambda_handler.handler(recorded_event("rest_api_get_root.json"), None)
+    loop, lifespan = lambda_handler.loop, lambda_handler._lifespan
+    lambda_handler.handler(recorded_event("rest_api_get_root.json"), None)
+    assert lambda_handler.loop is loop and not loop.is_closed()
+    assert lambda_handler._lifespan is lifespan is not None
+    assert lambda_handler.cold_start is False
+
+def test_keep_warm_ping_skips_the_app(lambda_handler, monkeypatch):
+    async def fail(scope, receive, send):
+        raise AssertionError("a ping must not reach the app")
+
+    monkeypatch.setattr(lambda_handler, "app", fail)
+    assert lambda_handler.handler(recorded_event("keep_warm.json"), None)["warm"] is True
+    assert lambda_handler.handler({"warmer": True, "concurrency": 3}, None)["warm"] is True
+
+def test_batched_events(lambda_handler):
+    ping, request = lambda_handler.handler(recorded_event("batch.json"), None)
+    assert ping["warm"] is True
+    assert request["statusCode"] == 200
+
+def test_failure_after_the_response_started_is_a_500(lambda_handler, monkeypatch):
+    async def fails_half_way(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"items": [', "more_body": True})
+        raise RuntimeError("lost the database")
+
+    monkeypatch.setattr(lambda_handler, "app", fails_half_way)
+    monkeypatch.setattr(lambda_handler, "_lifespan", object())
+    result = lambda_handler.handler(recorded_event("rest_api_get_root.json"), None)
+    assert result["statusCode"] == 500
+    assert result["body"] == "Internal Server Error"
+
+def test_shutdown_exits_the_lifespan_once(lambda_handler, monkeypatch):
+    exits = []
+
+    class Lifespan:
+        async def __aexit__(self, *exc_info):
+            exits.append(exc_info)
+
+    monkeypatch.setattr(lambda_handler, "_lifespan", Lifespan())
+    lambda_handler.shutdown()
+    lambda_handler.shutdown()
+    assert exits == [(None, None, None)]
+    assert lambda_handler._lifespan is None
@@ -0,0 +1,80 @@
+import pytest
+from app.core.metrics import (
+    MetricsRegistry, db_queries, http_request_db_queries, http_request_duration, openai_errors, openai_request_duration,
+    openai_tokens,
+)
+from app.core.config import settings
+from app.services.ai_service import AIService
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry(prefix="test")
+    requests = registry.counter("requests_total", "Requests.", ("path",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("path",), buckets=(0.1, 1.0))
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, "/")
+    registry.add_collector("cache", lambda: {"hits": 3, "name": "ignored"})
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{path="/a\\"b"} 3' in lines
+    assert 'test_latency_seconds_bucket{path="/",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{path="/",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{path="/",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{path="/"} 3' in lines
+    assert "test_cache_hits 3.0" in lines
+    assert not any("ignored" in line for line in lines)
+
+@pytest.mark.asyncio
+async def test_requests_are_recorded_by_route_with_their_queries(project_owner, async_client):
+    # The test engines are instrumented as "test" by conftest
+    _, project = project_owner
+    route = "/api/projects/{project_id}"
+    requests_before = http_request_duration.count("GET", route, 200)
+    queries_before = http_request_db_queries.sum(route)
+    engine_queries_before = db_queries.value("test")
+
+    response = await async_client.get(f"/api/projects/{project.id}")
+    assert response.status_code == 200
+
+    assert http_request_duration.count("GET", route, 200) == requests_before + 1
+    assert http_request_db_queries.sum(route) > queries_before
+    assert db_queries.value("test") - engine_queries_before == http_request_db_queries.sum(route) - queries_before
+
+@pytest.mark.asyncio
+async def test_unmatched_paths_share_one_series(async_client):
+    before = http_request_duration.count("GET", "unmatched", 404)
+    await async_client.get("/no/such/path/1")
+    await async_client.get("/no/such/path/2")
+    assert http_request_duration.count("GET", "unmatched", 404) == before + 2
+
+@pytest.mark.asyncio
+async def test_openai_latency_tokens_and_errors(fake_openai, project_owner):
+    user, _ = project_owner
+    model = settings.OPENAI_MODEL
+    completions_before = openai_request_duration.count(model, "completion")
+    streams_before = openai_request_duration.count(model, "stream")
+    completion_tokens_before = openai_tokens.value(model, "completion")
+
+    await AIService(user).generate_code("Write hello world", fresh=True)
+    tokens = await AIService(user).stream_code("Write a stream", fresh=True)
+    [token async for token in tokens]
+    assert openai_request_duration.count(model, "completion") == completions_before + 1
+    assert openai_request_duration.count(model, "stream") == streams_before + 1
+    assert openai_tokens.value(model, "completion") == completion_tokens_before + 2 * len(fake_openai.tokens)
+
+    fake_openai.error_status = 500
+    errors_before = openai_errors.value(model, "InternalServerError")
+    assert await AIService(user).generate_code("Fail", fresh=True) == "An error occurred while generating code."
+    assert openai_errors.value(model, "InternalServerError") > errors_before
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(async_client):
+    await async_client.get("/")
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'ai_wizard_http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert "ai_wizard_user_cache_hits" in response.text
+    assert "ai_wizard_password_hasher_pending" in response.text
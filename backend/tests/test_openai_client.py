@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from app.services.ai_service import AIService
+from app.services.openai_client import OpenAIClientRegistry, openai_clients
+from app.models.user import User
+
+def test_registry_reuses_clients_per_key():
+    registry = OpenAIClientRegistry(max_clients=2)
+    client_a = registry.get("sk-a")
+    assert registry.get("sk-a") is client_a
+    assert registry.get("sk-b") is not client_a
+    assert client_a.api_key == "sk-a"
+
+def test_registry_evicts_least_recently_used_client():
+    registry = OpenAIClientRegistry(max_clients=2)
+    client_a = registry.get("sk-a")
+    client_b = registry.get("sk-b")
+    registry.get("sk-a")
+    registry.get("sk-c")
+
+    assert len(registry) == 2
+    assert registry.get("sk-a") is client_a
+    assert registry.get("sk-b") is not client_b
+
+@pytest.mark.asyncio
+async def test_registry_shares_connection_pool_and_closes_it():
+    registry = OpenAIClientRegistry()
+    http_client = registry.get("sk-a")._client
+    assert registry.get("sk-b")._client is http_client
+
+    await registry.aclose()
+    assert http_client.is_closed
+    assert len(registry) == 0
+    assert not registry.get("sk-a")._client.is_closed
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_generations_reuse_keep_alive_connection(fake_openai):
+    ai_service = AIService(User(id=1, email="pool@example.com"))
+    for i in range(3):
+        assert await ai_service.generate_code(f"Write hello world #{i}") == "Hello, world!"
+
+    assert len(fake_openai.requests) == 3
+    assert len(fake_openai.connections) == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_users_use_their_own_key(fake_openai, monkeypatch):
+    async def get_user_api_key(self, user_id):
+        return f"sk-user-{user_id}"
+
+    monkeypatch.setattr(AIService, "_get_user_api_key", get_user_api_key)
+    await asyncio.gather(*(AIService(User(id=i)).generate_code(f"Hi {i}") for i in range(5)))
+    assert len(openai_clients) == 5
+    assert {openai_clients.get(f"sk-user-{i}").api_key for i in range(5)} == {f"sk-user-{i}" for i in range(5)}
@@ -0,0 +1,120 @@
+import datetime
+import pytest
+import pytest_asyncio
+from pydantic import TypeAdapter
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_authenticated_user
+from app.db.pagination import decode_cursor, encode_cursor
+from app.main import app
+from app.models.ai_interaction import AIInteraction, include_schema_name
+from app.models.base import Base
+from app.services.ai_interaction_service import AsyncAIInteractionService
+from app.services.project_service import AsyncProjectService
+from app.services.user_service import AsyncUserService
+from app.schemas.ai_interaction import AIInteraction as AIInteractionSchema
+from app.schemas.project import ProjectCreate, Project as ProjectSchema
+from app.schemas.user import UserCreate
+
+@pytest_asyncio.fixture
+async def project_with_interactions(async_db: AsyncSession):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="pages@example.com", password="testpassword", full_name="Pages User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Paged Project"))
+    # Pairs share a timestamp, so the id tie-breaker is exercised too
+    base = datetime.datetime(2024, 1, 1)
+    async_db.add_all(
+        AIInteraction(user_id=user.id, project_id=project.id, prompt=f"Prompt {i}", response="Response", created_at=base + datetime.timedelta(minutes=i // 2))
+        for i in range(7)
+    )
+    await async_db.commit()
+    return user, project
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 1, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+@pytest.mark.asyncio
+async def test_keyset_pages_cover_every_row_once(async_db: AsyncSession, project_with_interactions):
+    user, project = project_with_interactions
+    ai_interaction_service = AsyncAIInteractionService(async_db)
+
+    prompts, cursor = [], None
+    while True:
+        page = await ai_interaction_service.get_project_interactions(project.id, 3, cursor)
+        prompts += [i.prompt for i in page]
+        if len(page) < 3:
+            break
+        cursor = encode_cursor(page[-1].created_at, page[-1].id)
+
+    assert prompts == [f"Prompt {i}" for i in reversed(range(7))]
+    assert [i.prompt for i in await ai_interaction_service.get_user_interactions(user.id, 2)] == ["Prompt 6", "Prompt 5"]
+
+@pytest.mark.asyncio
+async def test_list_endpoint_returns_next_cursor(async_client, project_with_interactions):
+    user, project = project_with_interactions
+    app.dependency_overrides[get_authenticated_user] = lambda: user
+    try:
+        response = await async_client.get(f"/api/projects/{project.id}/interactions", params={"limit": 4})
+        assert [i["prompt"] for i in response.json()] == ["Prompt 6", "Prompt 5", "Prompt 4", "Prompt 3"]
+
+        response = await async_client.get(f"/api/projects/{project.id}/interactions", params={"limit": 4, "cursor": response.headers["X-Next-Cursor"]})
+        assert [i["prompt"] for i in response.json()] == ["Prompt 2", "Prompt 1", "Prompt 0"]
+        assert "X-Next-Cursor" not in response.headers
+
+        response = await async_client.get(f"/api/projects/{project.id}/interactions", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
+
+@pytest.mark.asyncio
+async def test_page_past_the_last_row_is_empty(async_client, async_db: AsyncSession, project_with_interactions):
+    user, project = project_with_interactions
+    other = await AsyncUserService(async_db).create_user(UserCreate(email="other_pages@example.com", password="testpassword", full_name="Other User"))
+    try:
+        app.dependency_overrides[get_authenticated_user] = lambda: user
+        # Seven rows in pages of seven: the cursor of the full page leads to an empty one
+        response = await async_client.get(f"/api/ai-interactions/project/{project.id}", params={"limit": 7})
+        assert len(response.json()) == 7
+        response = await async_client.get(f"/api/ai-interactions/project/{project.id}", params={"limit": 7, "cursor": response.headers["X-Next-Cursor"]})
+        assert (response.status_code, response.json()) == (200, [])
+        assert [i["prompt"] for i in (await async_client.get("/api/ai-interactions/user/me", params={"limit": 2})).json()] == ["Prompt 6", "Prompt 5"]
+
+        app.dependency_overrides[get_authenticated_user] = lambda: other
+        assert (await async_client.get(f"/api/ai-interactions/project/{project.id}")).status_code == 403
+        response = await async_client.post("/api/ai-interactions/", params={"project_id": project.id}, json={"prompt": "Not mine", "response": "No"})
+        assert response.status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
+
+@pytest.mark.asyncio
+async def test_row_lists_match_the_response_models(async_db: AsyncSession, async_client, project_with_interactions):
+    user, project = project_with_interactions
+    interactions = await AsyncAIInteractionService(async_db).get_project_interactions(project.id)
+    projects = await AsyncProjectService(async_db).get_user_projects(user.id)
+    app.dependency_overrides[get_authenticated_user] = lambda: user
+    try:
+        response = await async_client.get(f"/api/projects/{project.id}/interactions")
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == TypeAdapter(list[AIInteractionSchema]).dump_python(interactions, mode="json")
+        response = await async_client.get("/api/projects/")
+        assert response.json() == TypeAdapter(list[ProjectSchema]).dump_python(projects, mode="json")
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
+
+def test_migrations_match_models(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'migrations.db'}"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", database_url)
+    command.upgrade(config, "head")
+
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection, opts={"include_name": include_schema_name}), Base.metadata) == []
+        indexes = {index["name"]: index["column_names"] for index in inspect(connection).get_indexes("ai_interactions")}
+    engine.dispose()
+    assert indexes["ix_ai_interactions_project_id_created_at_id"] == ["project_id", "created_at", "id"]
+    assert indexes["ix_ai_interactions_user_id_created_at_id"] == ["user_id", "created_at", "id"]
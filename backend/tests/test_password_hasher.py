@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.user import User
+from app.services.auth_service import AsyncAuthService
+from app.services.password_hasher import PasswordHasher, password_hasher
+
+def test_process_pool_hashes_and_verifies():
+    hasher = PasswordHasher(workers=1, max_pending=4, use_processes=True)
+    try:
+        hashed = hasher.hash_sync("secret")
+        assert hashed.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+        assert hasher.verify_and_update_sync("secret", hashed) == (True, None)
+        assert hasher.verify_and_update_sync("wrong", hashed) == (False, None)
+    finally:
+        hasher.shutdown()
+    assert hasher.stats["completed"] == 3
+    assert hasher.stats["pending"] == 0
+    assert hasher.stats["avg_hash_seconds"] > 0
+
+@pytest.mark.asyncio
+async def test_overload_is_rejected_with_503():
+    hasher = PasswordHasher(workers=1, max_pending=1, use_processes=False)
+    first = asyncio.create_task(hasher.hash("secret"))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        await hasher.hash("other secret")
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+    await first
+    assert hasher.stats["rejected"] == 1
+    # Capacity is back once the queued hash is done
+    await hasher.hash("other secret")
+    hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_queue_wait_is_measured():
+    hasher = PasswordHasher(workers=1, max_pending=4, use_processes=False)
+    await asyncio.gather(*(hasher.hash(f"secret {i}") for i in range(3)))
+    # The last hash waited for the two before it
+    assert hasher.stats["max_queue_wait_seconds"] >= hasher.stats["max_hash_seconds"]
+    hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_login_upgrades_outdated_hash(async_db: AsyncSession):
+    cheap_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpassword")
+    async_db.add(User(email="rehash@example.com", hashed_password=cheap_hash, full_name="Rehash User"))
+    await async_db.commit()
+
+    auth_service = AsyncAuthService(async_db)
+    assert await auth_service.authenticate_user("rehash@example.com", "wrongpassword") is None
+    user = await auth_service.authenticate_user("rehash@example.com", "testpassword")
+    assert user.hashed_password.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+    assert await auth_service.authenticate_user("rehash@example.com", "testpassword") is not None
+    assert password_hasher.stats["rehashes"] >= 1
+
+@pytest.mark.asyncio
+async def test_async_auth_service_hashes_through_the_pool(async_db: AsyncSession):
+    auth_service = AsyncAuthService(async_db)
+    completed = password_hasher.stats["completed"]
+    hashed = await auth_service.get_password_hash("secret")
+    assert await auth_service.verify_password("secret", hashed)
+    assert not await auth_service.verify_password("wrong", hashed)
+    assert password_hasher.stats["completed"] == completed + 3
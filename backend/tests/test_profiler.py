@@ -0,0 +1,119 @@
+import time
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from pydantic import SecretStr
+from app.api.deps import ThreadpoolService
+from app.api.endpoints import profiles
+from app.core.config import settings
+from app.services import profiler as profiler_module
+from app.services.profiler import Profiler, ProfilingMiddleware
+
+TOKEN = "profile-secret"
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+class SlowSyncService:
+    def compute_report(self):
+        spin(0.05)
+        return "done"
+
+def profiled_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, token=TOKEN)
+    app.include_router(profiles.router, prefix="/api/admin/profiles")
+
+    @app.get("/cpu")
+    async def cpu_bound():
+        spin(0.05)
+        return {"ok": True}
+
+    @app.get("/sync-service")
+    async def sync_service():
+        return {"result": await ThreadpoolService(SlowSyncService()).compute_report()}
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for _ in range(3):
+                spin(0.02)
+                yield b"chunk\n"
+        return StreamingResponse(body())
+
+    return app
+
+@pytest.fixture
+def profiler(monkeypatch, tmp_path):
+    profiler = Profiler(interval=0.002, max_reports=10, directory=str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", SecretStr(TOKEN))
+    monkeypatch.setattr(profiler_module, "profiler", profiler)
+    monkeypatch.setattr(profiles, "profiler", profiler)
+    return profiler
+
+@pytest_asyncio.fixture
+async def client(profiler):
+    async with AsyncClient(transport=ASGITransport(app=profiled_app()), base_url="http://test") as c:
+        yield c
+
+async def collapsed(client, response) -> str:
+    profile_id = response.headers["x-profile-id"]
+    report = await client.get(f"/api/admin/profiles/{profile_id}/collapsed", headers={"X-Profiling-Token": TOKEN})
+    assert report.status_code == 200
+    return report.text
+
+@pytest.mark.asyncio
+async def test_requests_without_the_token_are_not_profiled(client, profiler):
+    response = await client.get("/cpu")
+    assert "x-profile-id" not in response.headers
+    response = await client.get("/cpu", headers={"X-Profile": "wrong"})
+    assert "x-profile-id" not in response.headers
+    assert not profiler.reports
+
+@pytest.mark.asyncio
+async def test_async_endpoint_profile(client, tmp_path):
+    response = await client.get("/cpu", headers={"X-Profile": TOKEN})
+    stacks = await collapsed(client, response)
+    assert (tmp_path / f"{response.headers['x-profile-id']}.collapsed").read_text() == stacks
+    assert "cpu_bound (test_profiler.py);spin (test_profiler.py)" in stacks
+    for line in stacks.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+
+    summary = (await client.get(f"/api/admin/profiles/{response.headers['x-profile-id']}", headers={"X-Profiling-Token": TOKEN})).json()
+    assert summary["route"] == "/cpu"
+    assert summary["status"] == 200
+    assert summary["samples"] > 0
+    assert summary["top_stacks"][0]["samples"] > 0
+
+@pytest.mark.asyncio
+async def test_sync_service_calls_are_sampled_on_their_thread(client):
+    response = await client.get("/sync-service", headers={"X-Profile": TOKEN})
+    assert "SlowSyncService.compute_report (test_profiler.py);spin (test_profiler.py)" in await collapsed(client, response)
+
+@pytest.mark.asyncio
+async def test_streaming_body_is_attributed_to_the_request(client):
+    response = await client.get("/stream", headers={"X-Profile": TOKEN})
+    assert response.text == "chunk\n" * 3
+    assert "body (test_profiler.py);spin (test_profiler.py)" in await collapsed(client, response)
+
+@pytest.mark.asyncio
+async def test_armed_profiler_and_admin_endpoints(client):
+    assert (await client.get("/api/admin/profiles/")).status_code == 422
+    assert (await client.get("/api/admin/profiles/", headers={"X-Profiling-Token": "wrong"})).status_code == 403
+    admin = {"X-Profiling-Token": TOKEN}
+    response = await client.post("/api/admin/profiles/arm", json={"requests": 1, "path_prefix": "/cpu"}, headers=admin)
+    assert response.json() == {"armed_requests": 1, "path_prefix": "/cpu"}
+
+    assert "x-profile-id" not in (await client.get("/stream")).headers
+    profiled = await client.get("/cpu")
+    assert "x-profile-id" in profiled.headers
+    assert "x-profile-id" not in (await client.get("/cpu")).headers
+
+    listed = (await client.get("/api/admin/profiles/", headers=admin)).json()
+    assert [profile["id"] for profile in listed] == [profiled.headers["x-profile-id"]]
+    assert (await client.get("/api/admin/profiles/missing", headers=admin)).status_code == 404
@@ -1,100 +1,177 @@
 import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
 from sqlalchemy.orm import Session
+from app.core.metrics import query_budget
 from app.services.project_service import ProjectService
 from app.services.user_service import UserService
+from app.services.ai_interaction_service import AIInteractionService
 from app.schemas.project import ProjectCreate, ProjectUpdate
 from app.schemas.user import UserCreate
 from app.schemas.ai_interaction import AIInteractionCreate
 
+
 def test_create_project(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="project_test@example.com", password="testpassword", full_name="Project Test User")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="Test Project", description="A test project")
     project = project_service.create_project(user.id, project_create)
-    
+
     assert project.name == "Test Project"
     assert project.description == "A test project"
     assert project.user_id == user.id
 
+
 def test_get_project(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="project_test2@example.com", password="testpassword", full_name="Project Test User 2")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="Test Project 2", description="Another test project")
     created_project = project_service.create_project(user.id, project_create)
-    
+
     fetched_project = project_service.get_project(created_project.id)
     assert fetched_project is not None
     assert fetched_project.id == created_project.id
 
+
 def test_update_project(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="project_test3@example.com", password="testpassword", full_name="Project Test User 3")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="Test Project 3", description="Yet another test project")
     created_project = project_service.create_project(user.id, project_create)
-    
+
     updated_project = project_service.update_project(created_project.id, ProjectUpdate(name="Updated Test Project 3"))
     assert updated_project.name == "Updated Test Project 3"
 
+
 def test_delete_project(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="project_test4@example.com", password="testpassword", full_name="Project Test User 4")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="Test Project 4", description="A project to be deleted")
     created_project = project_service.create_project(user.id, project_create)
-    
+
     assert project_service.delete_project(created_project.id) is True
     assert project_service.get_project(created_project.id) is None
 
+
 def test_create_ai_interaction(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="ai_test@example.com", password="testpassword", full_name="AI Test User")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="AI Test Project", description="A project for AI interaction")
     project = project_service.create_project(user.id, project_create)
-    
+
     interaction_create = AIInteractionCreate(prompt="Test prompt", response="Test response")
     interaction = project_service.create_ai_interaction(user.id, project.id, interaction_create)
-    
+
     assert interaction.prompt == "Test prompt"
     assert interaction.response == "Test response"
     assert interaction.user_id == user.id
     assert interaction.project_id == project.id
 
+
 def test_get_project_interactions(db: Session):
     user_service = UserService(db)
     project_service = ProjectService(db)
-    
+
     user_create = UserCreate(email="ai_test2@example.com", password="testpassword", full_name="AI Test User 2")
     user = user_service.create_user(user_create)
-    
+
     project_create = ProjectCreate(name="AI Test Project 2", description="Another project for AI interaction")
     project = project_service.create_project(user.id, project_create)
-    
+
     interaction_create1 = AIInteractionCreate(prompt="Test prompt 1", response="Test response 1")
     interaction_create2 = AIInteractionCreate(prompt="Test prompt 2", response="Test response 2")
-    
+
     project_service.create_ai_interaction(user.id, project.id, interaction_create1)
     project_service.create_ai_interaction(user.id, project.id, interaction_create2)
-    
+
     interactions = project_service.get_project_interactions(project.id)
     assert len(interactions) == 2
-    assert interactions[0].prompt == "Test prompt 1"
-    assert interactions[1].prompt == "Test prompt 2"
\ No newline at end of file
+    # Newest first
+    assert interactions[0].prompt == "Test prompt 2"
+    assert interactions[1].prompt == "Test prompt 1"
+
+
+def test_create_ai_interactions_in_one_statement(db: Session):
+    user = UserService(db).create_user(UserCreate(email="ai_batch@example.com", password="testpassword", full_name="AI Batch User"))
+    project_service = ProjectService(db)
+    project = project_service.create_project(user.id, ProjectCreate(name="AI Batch Project"))
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        interactions = project_service.create_ai_interactions(
+            user.id, project.id, [AIInteractionCreate(prompt=f"Batch prompt {i}", response=f"Batch response {i}") for i in range(20)]
+        )
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+
+    assert {i.prompt for i in interactions} == {f"Batch prompt {i}" for i in range(20)}
+    assert all(i.id and i.created_at and i.project_id == project.id for i in interactions)
+    # Each returned interaction carries the bodies stored under its id
+    stored = {i.id: (i.prompt, i.response) for i in project_service.get_project_interactions(project.id)}
+    assert {i.id: (i.prompt, i.response) for i in interactions} == stored
+    # One for the bodies' blobs, one for the interactions
+    assert len([s for s in statements if s.startswith("INSERT")]) == 2
+
+
+def test_user_project_operations_take_one_query(db: Session):
+    user_service = UserService(db)
+    owner = user_service.create_user(UserCreate(email="owner_scoped@example.com", password="testpassword", full_name="Owner"))
+    other = user_service.create_user(UserCreate(email="other_scoped@example.com", password="testpassword", full_name="Other"))
+    project_service = ProjectService(db)
+    project = project_service.create_project(owner.id, ProjectCreate(name="Owned Project"))
+    interaction = project_service.create_ai_interaction(owner.id, project.id, AIInteractionCreate(prompt="Kept", response="Kept"))
+    owner_id, other_id, project_id, interaction_id = owner.id, other.id, project.id, interaction.id
+
+    with query_budget(1):
+        assert project_service.get_user_project(owner_id, project_id).name == "Owned Project"
+    with query_budget(1):
+        project_service.check_project_owner(owner_id, project_id)
+    with query_budget(1):
+        updated = project_service.update_user_project(owner_id, project_id, ProjectUpdate(name="Renamed Project"))
+    assert updated.name == "Renamed Project"
+
+    # Refused operations look the project up once more, to tell 403 from 404
+    for call in (
+        lambda: project_service.get_user_project(other_id, project_id),
+        lambda: project_service.update_user_project(other_id, project_id, ProjectUpdate(name="Stolen")),
+        lambda: project_service.delete_user_project(other_id, project_id),
+    ):
+        with pytest.raises(HTTPException) as exc_info:
+            call()
+        assert exc_info.value.status_code == 403
+    with pytest.raises(HTTPException) as exc_info:
+        project_service.check_project_owner(owner_id, project_id + 1000)
+    assert exc_info.value.status_code == 404
+    assert project_service.get_project(project_id).name == "Renamed Project"
+
+    # Detaching the interactions and deleting the conversation go with it
+    with query_budget(4):
+        assert project_service.delete_user_project(owner_id, project_id) is True
+    assert project_service.get_project(project_id) is None
+    # The project's interactions are kept, detached from it
+    db.expire_all()
+    assert AIInteractionService(db).get_ai_interaction(interaction_id).project_id is None
@@ -0,0 +1,106 @@
+import datetime
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import QueryBudgetExceeded, http_request_db_queries, query_budget
+from app.models.user import User
+from app.schemas.ai_interaction import AIInteractionCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate, UserProfileCreate
+from app.services.auth_service import AsyncAuthService, AuthService
+from app.services.project_service import AsyncProjectService
+from app.services.user_service import AsyncUserService, UserService
+
+@pytest.fixture(autouse=True)
+def without_user_cache(monkeypatch):
+    # Measure the queries behind authentication, not the cache in front of them
+    monkeypatch.setattr(settings, "USER_CACHE_ENABLED", False)
+
+def test_budget_fails_the_first_query_past_it(db: Session):
+    with query_budget(1) as request:
+        db.execute(select(User)).all()
+        with pytest.raises(QueryBudgetExceeded, match="Query budget of 1 exceeded by: SELECT"):
+            db.execute(select(User)).all()
+    assert request.queries == 1
+    # Outside the block queries are unrestricted again
+    db.execute(select(User)).all()
+
+def test_sync_current_user_loads_the_profile_in_one_query(db: Session):
+    user = UserService(db).create_user(UserCreate(email="budget@example.com", password="testpassword", full_name="Budget User"))
+    UserService(db).create_user_profile(user.id, UserProfileCreate(bio="Hi", preferences={}))
+    token = AuthService(db).create_access_token({"sub": "budget@example.com"}, datetime.timedelta(minutes=5))
+    db.expunge_all()
+
+    with query_budget(1):
+        current_user = AuthService(db).get_current_user(token)
+        assert current_user.profile.bio == "Hi"
+
+@pytest.mark.asyncio
+async def test_async_current_user_loads_the_profile_in_one_query(async_db):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="me@example.com", password="testpassword", full_name="Me"))
+    await AsyncUserService(async_db).create_user_profile(user.id, UserProfileCreate(bio="About me", preferences={}))
+    token = AsyncAuthService(async_db).create_access_token({"sub": "me@example.com"}, datetime.timedelta(minutes=5))
+    async_db.expunge_all()
+
+    with query_budget(1):
+        current_user = await AsyncAuthService(async_db).get_current_user(token)
+        assert current_user.profile.bio == "About me"
+
+@pytest.mark.asyncio
+async def test_requests_past_the_budget_fail(async_client, async_db, monkeypatch):
+    await AsyncUserService(async_db).create_user(UserCreate(email="over@example.com", password="testpassword", full_name="Over"))
+    token = AsyncAuthService(async_db).create_access_token({"sub": "over@example.com"}, datetime.timedelta(minutes=5))
+
+    # One query to authenticate, one for the listing's validators, one for its rows
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 2)
+    with pytest.raises(QueryBudgetExceeded):
+        await async_client.get("/api/projects/", headers={"Authorization": f"Bearer {token}"})
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 3)
+    assert (await async_client.get("/api/projects/", headers={"Authorization": f"Bearer {token}"})).status_code == 200
+
+@pytest.mark.asyncio
+async def test_listed_projects_refuse_lazy_loads(async_db):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="lazy@example.com", password="testpassword", full_name="Lazy"))
+    await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Lazy Project"))
+    async_db.expunge_all()
+
+    projects = await AsyncProjectService(async_db).get_user_projects(user.id)
+    with pytest.raises(InvalidRequestError, match="lazy='raise'"):
+        projects[0].ai_interactions
+
+# The queries of every endpoint, authentication included, pinned so that an added query is a deliberate change
+ENDPOINT_QUERIES = [
+    ("GET", "/api/projects/", None, 3),
+    ("POST", "/api/projects/", {"name": "Another Project"}, 3),
+    ("GET", "/api/projects/{project_id}", None, 2),
+    ("PUT", "/api/projects/{project_id}", {"name": "Renamed Project"}, 2),
+    ("DELETE", "/api/projects/{project_id}", None, 5),
+    ("POST", "/api/projects/{project_id}/interactions:batch", {"interactions": [{"prompt": "Batched", "response": "Yes"}] * 3}, 4),
+    ("GET", "/api/projects/{project_id}/interactions", None, 3),
+    ("GET", "/api/projects/{project_id}/interactions/search?q=handler", None, 3),
+    ("POST", "/api/ai-interactions/?project_id={project_id}", {"prompt": "Single", "response": "Yes"}, 5),
+    ("GET", "/api/ai-interactions/project/{project_id}", None, 3),
+    ("GET", "/api/ai-interactions/user/me", None, 2),
+    ("GET", "/api/users/me/interactions/search?q=handler", None, 2),
+    ("GET", "/api/users/me/interactions/export", None, 2),
+    ("POST", "/api/ai/refine-requirements", {"project_id": "{project_id}", "message": "A todo app"}, 8),
+]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method, path, body, queries", ENDPOINT_QUERIES, ids=[f"{method} {path}" for method, path, _, _ in ENDPOINT_QUERIES])
+async def test_endpoint_query_counts(async_client, async_db, fake_openai, monkeypatch, method, path, body, queries):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="pinned@example.com", password="testpassword", full_name="Pinned"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Pinned Project"))
+    await AsyncProjectService(async_db).create_ai_interactions(user.id, project.id, [AIInteractionCreate(prompt=f"Write handler {i}", response="Done") for i in range(3)])
+    token = AsyncAuthService(async_db).create_access_token({"sub": "pinned@example.com"}, datetime.timedelta(minutes=5))
+    if body is not None:
+        body = {key: project.id if value == "{project_id}" else value for key, value in body.items()}
+    route = path.split("?")[0]
+    before = http_request_db_queries.sum(route)
+
+    monkeypatch.setattr(settings, "QUERY_BUDGET", queries)
+    response = await async_client.request(method, path.format(project_id=project.id), json=body, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert http_request_db_queries.sum(route) - before == queries
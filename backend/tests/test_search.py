@@ -0,0 +1,113 @@
+import sqlite3
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.api.deps import get_authenticated_user
+from app.db.pagination import decode_score_cursor, encode_score_cursor
+from app.main import app
+from app.models.ai_interaction import AIInteraction
+from app.services.ai_interaction_service import AIInteractionService, AsyncAIInteractionService
+from app.services.project_service import AsyncProjectService, ProjectService
+from app.services.user_service import AsyncUserService, UserService
+from app.schemas.ai_interaction import AIInteractionCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+
+def test_score_cursor_round_trip():
+    assert decode_score_cursor(encode_score_cursor(-1.2345678901234567e-06, 42)) == (-1.2345678901234567e-06, 42)
+
+def test_search_ranks_snippets_and_scopes(db: Session):
+    user_service = UserService(db)
+    user = user_service.create_user(UserCreate(email="search@example.com", password="testpassword", full_name="Search User"))
+    other = user_service.create_user(UserCreate(email="search_other@example.com", password="testpassword", full_name="Other User"))
+    project_service = ProjectService(db)
+    project = project_service.create_project(user.id, ProjectCreate(name="Search Project"))
+    other_project = project_service.create_project(user.id, ProjectCreate(name="Other Search Project"))
+    service = AIInteractionService(db)
+    service.create_ai_interactions(user.id, project.id, [
+        AIInteractionCreate(prompt="How do I parse a zebracorn config file?", response="Read it line by line."),
+        AIInteractionCreate(prompt="Zebracorn zebracorn everywhere", response="Parsing zebracorns is easy."),
+        AIInteractionCreate(prompt="Something unrelated", response="Nothing to see"),
+    ])
+    service.create_ai_interactions(user.id, other_project.id, [AIInteractionCreate(prompt="A zebracorn in another project", response="ok")])
+    service.create_ai_interactions(other.id, other_project.id, [AIInteractionCreate(prompt="Somebody else's zebracorn", response="ok")])
+
+    results = service.search_interactions(user.id, "zebracorn")
+    assert len(results) == 3
+    assert all(result.user_id == user.id for result in results)
+    assert [result.score for result in results] == sorted((result.score for result in results), reverse=True)
+    # The stemmer matches "zebracorns", so the interaction mentioning it most ranks first
+    assert results[0].prompt_snippet == "<mark>Zebracorn</mark> <mark>zebracorn</mark> everywhere"
+    assert results[0].response_snippet == "Parsing <mark>zebracorns</mark> is easy."
+
+    assert len(service.search_interactions(user.id, "zebracorn", project.id)) == 2
+    assert [r.project_id for r in service.search_interactions(user.id, "zebracorn config")] == [project.id]
+    # Query syntax in the input is searched for as words instead of failing
+    assert len(service.search_interactions(user.id, 'zebracorn* "(config')) == 1
+    assert service.search_interactions(user.id, "***") == []
+
+def test_search_index_follows_updates_and_deletes(db: Session):
+    user = UserService(db).create_user(UserCreate(email="search_sync@example.com", password="testpassword", full_name="Search Sync User"))
+    project = ProjectService(db).create_project(user.id, ProjectCreate(name="Search Sync Project"))
+    service = AIInteractionService(db)
+    interaction = service.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt="quokkaform question", response="answer"))
+
+    interaction.prompt = "wombatform question"
+    db.commit()
+    assert service.search_interactions(user.id, "quokkaform") == []
+    assert [r.id for r in service.search_interactions(user.id, "wombatform")] == [interaction.id]
+
+    db.delete(db.get(AIInteraction, interaction.id))
+    db.commit()
+    assert service.search_interactions(user.id, "wombatform") == []
+
+@pytest.mark.asyncio
+async def test_search_endpoints_page_by_score(async_db: AsyncSession, async_client):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="search_pages@example.com", password="testpassword", full_name="Search Pages User"))
+    other = await AsyncUserService(async_db).create_user(UserCreate(email="search_pages_other@example.com", password="testpassword", full_name="Other User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Search Pages Project"))
+    await AsyncAIInteractionService(async_db).create_ai_interactions(
+        user.id, project.id, [AIInteractionCreate(prompt=" ".join(["lemur"] * (i + 1)) + " facts", response="Response") for i in range(7)]
+    )
+
+    app.dependency_overrides[get_authenticated_user] = lambda: user
+    try:
+        ids, cursor = [], None
+        while True:
+            params = {"q": "lemur", "limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = await async_client.get("/api/users/me/interactions/search", params=params)
+            assert response.status_code == 200
+            ids.extend(result["id"] for result in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        assert len(ids) == len(set(ids)) == 7
+        # More mentions rank higher, so the newest interaction comes first
+        assert ids == sorted(ids, reverse=True)
+
+        response = await async_client.get(f"/api/projects/{project.id}/interactions/search", params={"q": "lemur facts"})
+        assert len(response.json()) == 7
+        assert "<mark>lemur</mark>" in response.json()[0]["prompt_snippet"]
+        assert (await async_client.get("/api/users/me/interactions/search", params={"q": ""})).status_code == 422
+        assert (await async_client.get("/api/users/me/interactions/search", params={"q": "lemur", "cursor": "nope"})).status_code == 400
+
+        app.dependency_overrides[get_authenticated_user] = lambda: other
+        assert (await async_client.get("/api/users/me/interactions/search", params={"q": "lemur"})).json() == []
+        assert (await async_client.get(f"/api/projects/{project.id}/interactions/search", params={"q": "lemur"})).status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_authenticated_user, None)
+
+def test_search_migration_indexes_existing_rows(tmp_path):
+    database_path = tmp_path / "search_migration.db"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{database_path}")
+    command.upgrade(config, "0003")
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("INSERT INTO users (id, email, hashed_password) VALUES (1, 'migrated@example.com', 'x')")
+        connection.execute("INSERT INTO ai_interactions (user_id, prompt, response) VALUES (1, 'Migrated capybaras', 'Response')")
+    command.upgrade(config, "head")
+    with sqlite3.connect(database_path) as connection:
+        assert connection.execute("SELECT rowid FROM ai_interactions_fts WHERE ai_interactions_fts MATCH 'capybara'").fetchall() == [(1,)]
+    command.downgrade(config, "0003")
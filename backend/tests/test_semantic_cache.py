@@ -0,0 +1,143 @@
+import threading
+import numpy as np
+import pytest
+from sqlalchemy import delete
+from app.core.config import settings
+from app.models.ai_interaction import AIInteraction
+from app.services import semantic_cache as semantic_cache_module
+from app.services.ai_service import AIService
+from app.services.ai_interaction_service import AsyncAIInteractionService
+from app.services.project_service import AsyncProjectService
+from app.services.semantic_cache import HashingEmbedder, SemanticCache, SemanticIndex
+from app.services.user_service import AsyncUserService
+from app.schemas.ai_interaction import AIInteractionCreate
+from app.schemas.project import ProjectCreate
+from app.schemas.user import UserCreate
+
+PROMPT = "Write a Python function that parses a CSV file and returns a list of dicts"
+NEAR_DUPLICATE = "write a python function that parses a CSV file, and returns a list of dicts."
+UNRELATED = "Explain the difference between TCP and UDP"
+
+async def embed(texts):
+    return await HashingEmbedder().embed(texts)
+
+@pytest.mark.asyncio
+async def test_hashing_embedder_is_deterministic_and_normalized():
+    vectors = await embed([PROMPT, NEAR_DUPLICATE, UNRELATED, ""])
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert not vectors[3].any()
+    assert np.array_equal(vectors, await embed([PROMPT, NEAR_DUPLICATE, UNRELATED, ""]))
+    assert vectors[0] @ vectors[1] > 0.95
+    assert vectors[0] @ vectors[2] < 0.5
+
+@pytest.mark.asyncio
+async def test_index_grows_incrementally_and_searches_in_batches():
+    index = SemanticIndex(256)
+    vectors = await embed([f"prompt number {i} about topic {i * 7}" for i in range(100)])
+    index.add(list(range(1, 51)), vectors[:50])
+    index.add(list(range(51, 101)), vectors[50:])
+    assert len(index) == 100
+    assert index.last_id == 100
+
+    ids, scores = index.search(vectors[[3, 97]])
+    assert ids.tolist() == [4, 98]
+    assert np.allclose(scores, 1.0)
+
+@pytest.mark.asyncio
+async def test_index_file_is_memory_mapped_and_survives_torn_writes(tmp_path):
+    path = str(tmp_path / "project-1")
+    vectors = await embed([PROMPT, UNRELATED])
+    SemanticIndex(256, path).add([7, 9], vectors)
+    # A crash in the middle of an append leaves a partial row behind
+    with open(f"{path}.index", "ab") as f:
+        f.write(b"\x00" * 100)
+
+    reopened = SemanticIndex(256, path)
+    assert isinstance(reopened._vectors, np.memmap)
+    assert len(reopened) == 2
+    assert reopened.last_id == 9
+    reopened.add([11], await embed(["Sort a list of numbers in place"]))
+    ids, scores = SemanticIndex(256, path).search(await embed([UNRELATED, "Sort a list of numbers in place"]))
+    assert ids.tolist() == [9, 11]
+    assert np.allclose(scores, 1.0)
+
+@pytest.mark.asyncio
+async def test_index_file_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "project-1")
+    vectors = await embed([f"prompt number {i}" for i in range(6)])
+    first, second = SemanticIndex(256, path), SemanticIndex(256, path)
+    first.add([1, 2, 3], vectors[:3])
+    # The second process caught up from an older view: the rows the first one appended aren't repeated
+    second.add([2, 3, 4, 5], vectors[1:5])
+    first.add([6], vectors[5:])
+
+    reopened = SemanticIndex(256, path)
+    assert reopened._ids.tolist() == [1, 2, 3, 4, 5, 6]
+    ids, _ = reopened.search(vectors)
+    assert ids.tolist() == [1, 2, 3, 4, 5, 6]
+
+@pytest.mark.asyncio
+async def test_semantic_cache_matches_near_duplicates_per_project(async_db, async_session_factory):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="semantic@example.com", password="testpassword", full_name="Semantic User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Semantic Project"))
+    other_project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Other Semantic Project"))
+    interactions = AsyncAIInteractionService(async_db)
+    await interactions.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt=PROMPT, response="def parse(path): ..."))
+    cache = SemanticCache(HashingEmbedder(), threshold=0.9, session_factory=async_session_factory)
+
+    assert await cache.lookup_many(project.id, [NEAR_DUPLICATE, UNRELATED]) == ["def parse(path): ...", None]
+    assert await cache.lookup(other_project.id, NEAR_DUPLICATE) is None
+
+    # Interactions stored after the index was built are picked up by the next lookup
+    await interactions.create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt=UNRELATED, response="TCP is reliable"))
+    assert await cache.lookup(project.id, UNRELATED + "?") == "TCP is reliable"
+    assert cache.stats == {"hits": 2, "misses": 2, "embedded": 2, "indexes": 2, "vectors": 2}
+
+    # Deleted interactions are never served
+    await async_db.execute(delete(AIInteraction).where(AIInteraction.project_id == project.id))
+    await async_db.commit()
+    assert await cache.lookup(project.id, NEAR_DUPLICATE) is None
+
+@pytest.mark.asyncio
+async def test_catch_up_indexes_interactions_committed_out_of_order(async_db, async_session_factory, monkeypatch):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="semantic_late@example.com", password="testpassword", full_name="Semantic Late User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Semantic Late Project"))
+    async_db.add(AIInteraction(id=50, user_id=user.id, project_id=project.id, prompt=UNRELATED, response="TCP is reliable"))
+    await async_db.commit()
+    cache = SemanticCache(HashingEmbedder(), threshold=0.9, session_factory=async_session_factory)
+    embedding_threads = []
+    embed = HashingEmbedder._embed
+    def record_thread(self, texts):
+        embedding_threads.append(threading.get_ident())
+        return embed(self, texts)
+    monkeypatch.setattr(HashingEmbedder, "_embed", record_thread)
+    assert await cache.lookup(project.id, PROMPT) is None
+
+    # Its id was taken before the indexed one, but its transaction committed after the lookup
+    async_db.add(AIInteraction(id=40, user_id=user.id, project_id=project.id, prompt=PROMPT, response="def parse(path): ..."))
+    await async_db.commit()
+    assert await cache.lookup(project.id, NEAR_DUPLICATE) == "def parse(path): ..."
+    assert await cache.lookup(project.id, NEAR_DUPLICATE) == "def parse(path): ..."
+    assert cache.stats["embedded"] == 2
+    assert cache.stats["vectors"] == 2
+    # The hashing runs on worker threads, not on the event loop
+    assert threading.get_ident() not in embedding_threads
+
+@pytest.mark.asyncio
+async def test_generate_code_stream_answers_from_semantic_cache(fake_openai, async_db, async_session_factory, monkeypatch):
+    user = await AsyncUserService(async_db).create_user(UserCreate(email="semantic_stream@example.com", password="testpassword", full_name="Semantic Stream User"))
+    project = await AsyncProjectService(async_db).create_project(user.id, ProjectCreate(name="Semantic Stream Project"))
+    await async_db.refresh(user, ["profile"])
+    await AsyncAIInteractionService(async_db).create_ai_interaction(user.id, project.id, AIInteractionCreate(prompt=PROMPT, response="def parse(path): ..."))
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(semantic_cache_module, "semantic_cache", SemanticCache(HashingEmbedder(), threshold=0.9, session_factory=async_session_factory))
+
+    tokens = await AIService(user).stream_code(NEAR_DUPLICATE, project_id=project.id)
+    assert [token async for token in tokens] == ["def parse(path): ..."]
+    assert fake_openai.requests == []
+
+    # Prompts unlike any earlier one, and requests for a fresh answer, go to the model
+    assert [token async for token in await AIService(user).stream_code(UNRELATED, project_id=project.id)] == fake_openai.tokens
+    assert [token async for token in await AIService(user).stream_code(NEAR_DUPLICATE, fresh=True, project_id=project.id)] == fake_openai.tokens
+    assert len(fake_openai.requests) == 2
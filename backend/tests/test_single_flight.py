@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService
+from app.services.single_flight import SingleFlight
+from app.models.user import User
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flights.do("key", fetch) for _ in range(10)))
+    assert results == ["result"] * 10
+    assert calls == 1
+    assert flights.coalesced == 9
+    assert len(flights) == 0
+
+    # Once the call has finished, the next one goes upstream again
+    assert await flights.do("key", fetch) == "result"
+    assert calls == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_failure():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+    assert [str(result) for result in results] == ["upstream failed"] * 3
+    assert flights.calls == 1
+
+@pytest.mark.asyncio
+async def test_late_stream_subscriber_gets_replay():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def tokens():
+        yield "a"
+        yield "b"
+        await release.wait()
+        yield "c"
+
+    first = flights.stream("key", tokens)
+    assert [await anext(first), await anext(first)] == ["a", "b"]
+
+    late = flights.stream("key", tokens)
+    assert [await anext(late), await anext(late)] == ["a", "b"]
+
+    release.set()
+    assert [token async for token in first] == ["c"]
+    assert [token async for token in late] == ["c"]
+    assert flights.calls == 1
+
+@pytest.mark.asyncio
+async def test_duplicate_generations_hit_upstream_once(fake_openai):
+    fake_openai.delay = 0.2
+    results = await asyncio.gather(*(AIService(User(id=1)).generate_code("Scaffold a FastAPI app") for _ in range(5)))
+    assert results == ["Hello, world!"] * 5
+    assert len(fake_openai.requests) == 1
+
+@pytest.mark.asyncio
+async def test_duplicate_generations_share_upstream_failure(fake_openai):
+    fake_openai.delay = 0.2
+    fake_openai.error_status = 400
+    results = await asyncio.gather(*(AIService(User(id=1)).generate_code("Scaffold a FastAPI app") for _ in range(5)))
+    assert results == ["An error occurred while generating code."] * 5
+    assert len(fake_openai.requests) == 1
+
+@pytest.mark.asyncio
+async def test_different_api_keys_are_not_coalesced(fake_openai, monkeypatch):
+    async def get_user_api_key(self, user_id):
+        return f"sk-user-{user_id}"
+
+    monkeypatch.setattr(AIService, "_get_user_api_key", get_user_api_key)
+    fake_openai.delay = 0.2
+    await asyncio.gather(*(AIService(User(id=i)).generate_code("Scaffold a FastAPI app") for i in range(3)))
+    assert len(fake_openai.requests) == 3
+
+@pytest.mark.asyncio
+async def test_duplicate_streams_hit_upstream_once(fake_openai):
+    fake_openai.token_delay = 0.05
+    first = await AIService(User(id=1)).stream_code("Scaffold a FastAPI app")
+    assert await anext(first) == "Hello"
+
+    late = await AIService(User(id=1)).stream_code("Scaffold a FastAPI app")
+    first_tokens, late_tokens = await asyncio.gather(
+        *(collect(tokens) for tokens in (first, late))
+    )
+    assert first_tokens == fake_openai.tokens[1:]
+    assert late_tokens == fake_openai.tokens
+    assert len(fake_openai.requests) == 1
+    assert ai_service_module.ai_flights.coalesced == 1
+
+async def collect(tokens):
+    return [token async for token in tokens]
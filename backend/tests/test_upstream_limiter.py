@@ -0,0 +1,171 @@
+import asyncio
+import time
+import pytest
+from app.core.metrics import openai_queue_wait
+from app.models.user import User
+from app.services import ai_service
+from app.services.ai_service import AIService
+from app.services.upstream_limiter import UpstreamBusy, UpstreamLimiter, retry_after_seconds
+
+async def admit_and_leave(limiter, user_id=1, api_key="sk-test", tokens=10):
+    async with limiter.admit(user_id, api_key, tokens):
+        pass
+
+@pytest.mark.asyncio
+async def test_requests_per_minute_refuse_what_would_wait_too_long():
+    limiter = UpstreamLimiter(user_requests_per_minute=2, max_queue_seconds=1)
+    await admit_and_leave(limiter)
+    await admit_and_leave(limiter)
+    with pytest.raises(UpstreamBusy) as refused:
+        await admit_and_leave(limiter)
+    assert refused.value.status_code == 429
+    # The next request is half a minute away
+    assert refused.value.headers["Retry-After"] == "30"
+    # Other users have their own buckets
+    await admit_and_leave(limiter, user_id=2)
+    assert (limiter.admitted, limiter.rejected) == (3, 1)
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute_queue_calls_and_reconcile_with_usage():
+    limiter = UpstreamLimiter(key_tokens_per_minute=6000, max_queue_seconds=5)
+    waits_before = openai_queue_wait.count()
+    async with limiter.admit(1, "sk-shared", 6000) as admission:
+        # Far less was used than estimated, the rest goes back to the bucket
+        admission.reconcile(100)
+    started = time.monotonic()
+    await admit_and_leave(limiter, user_id=2, api_key="sk-shared", tokens=5900)
+    assert time.monotonic() - started < 0.05
+
+    # The key's bucket is now empty: 100 tokens a second come back
+    started = time.monotonic()
+    await admit_and_leave(limiter, user_id=3, api_key="sk-shared", tokens=20)
+    assert time.monotonic() - started >= 0.15
+    assert limiter.max_queue_wait_seconds >= 0.15
+    assert openai_queue_wait.count() == waits_before + 3
+    # Another key isn't held up
+    started = time.monotonic()
+    await admit_and_leave(limiter, api_key="sk-other", tokens=5000)
+    assert time.monotonic() - started < 0.05
+
+@pytest.mark.asyncio
+async def test_concurrency_slots_queue_and_time_out():
+    limiter = UpstreamLimiter(max_concurrency=1, max_queue_seconds=0.2)
+    async with limiter.admit(1, "sk-test", 10):
+        assert limiter.in_flight == 1
+        with pytest.raises(UpstreamBusy) as refused:
+            await admit_and_leave(limiter, user_id=2)
+        assert refused.value.status_code == 503
+        waiting = asyncio.create_task(admit_and_leave(limiter, user_id=3))
+        await asyncio.sleep(0.05)
+        assert limiter.waiting == 1
+    await waiting
+    assert (limiter.in_flight, limiter.waiting, limiter.admitted) == (0, 0, 2)
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_give_back_their_reservation():
+    limiter = UpstreamLimiter(user_requests_per_minute=60, max_queue_seconds=5)
+    for _ in range(60):
+        await admit_and_leave(limiter)
+    waiting = asyncio.create_task(admit_and_leave(limiter))
+    await asyncio.sleep(0.05)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert limiter.waiting == 0
+    # Without the cancelled reservation the next request is about a second away, not two
+    request_bucket, _ = limiter._buckets[("user", 1)]
+    assert request_bucket.delay(1, time.monotonic()) < 1.1
+
+class Unavailable(Exception):
+    status_code = 503
+
+    class response:
+        headers = {"retry-after-ms": "200"}
+
+@pytest.mark.asyncio
+async def test_retries_are_admitted_again_and_back_off_without_a_slot():
+    limiter = UpstreamLimiter(max_concurrency=1, user_requests_per_minute=60, max_queue_seconds=5, retry_max_seconds=1)
+    attempts = []
+
+    async def call():
+        attempts.append(limiter.in_flight)
+        if len(attempts) == 1:
+            raise Unavailable()
+        return "done"
+
+    async def call_and_leave():
+        async with limiter.call(1, "sk-test", 10, call) as (_, result):
+            return result
+
+    retrying = asyncio.create_task(call_and_leave())
+    await asyncio.sleep(0.1)
+    # The backoff holds no slot: another call goes through meanwhile
+    assert limiter.in_flight == 0
+    started = time.monotonic()
+    await admit_and_leave(limiter, user_id=2)
+    assert time.monotonic() - started < 0.05
+    assert await retrying == "done"
+    assert attempts == [1, 1]
+    assert (limiter.admitted, limiter.retries) == (3, 1)
+    # Both attempts were charged to the user's requests per minute
+    request_bucket, _ = limiter._buckets[("user", 1)]
+    assert request_bucket.tokens < 58.5
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({"retry-after-ms": "250"}) == 0.25
+    assert retry_after_seconds({"retry-after": "3"}) == 3.0
+    assert 59 < retry_after_seconds({"retry-after": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))}) <= 60
+    assert retry_after_seconds({"retry-after": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+@pytest.mark.asyncio
+async def test_rate_limited_calls_are_retried_after_retry_after(fake_openai):
+    limiter = ai_service.upstream_limiter
+    fake_openai.error_status = 429
+    fake_openai.error_count = 2
+    fake_openai.error_headers = {"retry-after-ms": "100"}
+    started = time.monotonic()
+    assert await AIService(User(id=1)).generate_code("Retry me", fresh=True) == "Hello, world!"
+    assert time.monotonic() - started >= 0.2
+    assert len(fake_openai.requests) == 3
+    assert limiter.retries == 2
+
+    # Retries are bounded, streams included
+    fake_openai.error_status = 503
+    fake_openai.error_count = None
+    fake_openai.error_headers = {}
+    assert await AIService(User(id=1)).generate_code("Keep failing", fresh=True) == "An error occurred while generating code."
+    assert len(fake_openai.requests) == 6
+    with pytest.raises(Exception):
+        [token async for token in await AIService(User(id=1)).stream_code("Keep failing", fresh=True)]
+    assert len(fake_openai.requests) == 9
+
+@pytest.mark.asyncio
+async def test_calls_that_cannot_succeed_soon_are_not_retried(fake_openai):
+    fake_openai.error_status = 400
+    await AIService(User(id=1)).generate_code("Bad request", fresh=True)
+    assert len(fake_openai.requests) == 1
+
+    # Waiting longer than the retries may is left to the client
+    fake_openai.error_status = 429
+    fake_openai.error_headers = {"retry-after": "600"}
+    await AIService(User(id=1)).generate_code("Come back later", fresh=True)
+    assert len(fake_openai.requests) == 2
+    assert ai_service.upstream_limiter.retries == 0
+
+@pytest.mark.asyncio
+async def test_refused_calls_answer_429_with_retry_after(async_client, fake_openai, project_owner, monkeypatch):
+    _, project = project_owner
+    monkeypatch.setattr(ai_service, "upstream_limiter", UpstreamLimiter(user_requests_per_minute=1, max_queue_seconds=1))
+    first = await async_client.post("/api/ai/refine-requirements", json={"project_id": project.id, "message": "A todo app"})
+    assert first.json() == {"response": "Hello, world!"}
+
+    refused = await async_client.post("/api/ai/refine-requirements", json={"project_id": project.id, "message": "With tags"})
+    assert refused.status_code == 429
+    assert refused.headers["retry-after"] == "60"
+    # Streams have already started, the refusal is their error event
+    async with async_client.stream("POST", "/api/ai/generate-code/stream", json={"project_id": project.id, "prompt": "Tags", "fresh": True}) as response:
+        body = "".join([text async for text in response.aiter_text()])
+    assert body.startswith("event: error\n")
+    assert '"retry_after": 60' in body
+    assert len(fake_openai.requests) == 1
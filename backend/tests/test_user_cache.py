@@ -0,0 +1,174 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User
+from app.models.user_profile import UserProfile
+from app.schemas.user import UserCreate, UserUpdate, UserProfileCreate
+from app.services.auth_service import AsyncAuthService
+from app.services.user_cache import SQLInvalidationBackend, UserCache, user_cache
+from app.services.user_service import AsyncUserService
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_user(user_id: int = 1) -> User:
+    return User(id=user_id, email=f"user{user_id}@example.com", full_name="Cached User", profile=UserProfile(id=user_id, user_id=user_id, preferences="{}"))
+
+def test_hit_returns_a_fresh_copy():
+    cache = UserCache(max_entries=10, ttl=60)
+    cache.set("token", make_user(), token_expires_at=10 ** 10)
+    first, second = cache.get("token"), cache.get("token")
+    assert first is not second
+    assert first.email == "user1@example.com"
+    assert first.profile.preferences == "{}"
+    assert cache.get("other-token") is None
+    assert cache.stats == {"hits": 2, "misses": 1, "size": 1}
+
+def test_entries_expire_with_the_token():
+    clock = FakeClock()
+    cache = UserCache(max_entries=10, ttl=300, clock=clock)
+    cache.set("token", make_user(), token_expires_at=clock.now + 30)
+    clock.now += 29
+    assert cache.get("token") is not None
+    clock.now += 1
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+def test_invalidate_user_drops_all_of_their_tokens():
+    cache = UserCache(max_entries=10, ttl=60)
+    cache.set("token-a", make_user(1), token_expires_at=10 ** 10)
+    cache.set("token-b", make_user(1), token_expires_at=10 ** 10)
+    cache.set("token-c", make_user(2), token_expires_at=10 ** 10)
+    cache.invalidate_user(1)
+    assert cache.get("token-a") is None
+    assert cache.get("token-b") is None
+    assert cache.get("token-c") is not None
+
+def test_users_invalidated_while_loading_are_not_cached():
+    cache = UserCache(max_entries=10, ttl=60)
+    generation = cache.generation()
+    # An update lands between the request's query and its set()
+    cache.invalidate_user(1)
+    cache.set("token-a", make_user(1), token_expires_at=10 ** 10, generation=generation)
+    cache.set("token-b", make_user(2), token_expires_at=10 ** 10, generation=generation)
+    assert cache.get("token-a") is None
+    assert cache.get("token-b") is not None
+    cache.set("token-a", make_user(1), token_expires_at=10 ** 10, generation=cache.generation())
+    assert cache.get("token-a") is not None
+
+def test_forgotten_invalidations_refuse_older_loads():
+    cache = UserCache(max_entries=2, ttl=60)
+    generation = cache.generation()
+    for user_id in (1, 2, 3):
+        cache.invalidate_user(user_id)
+    # User 1's invalidation was forgotten, so the cache can't tell it apart from user 4
+    cache.set("token-a", make_user(1), token_expires_at=10 ** 10, generation=generation)
+    cache.set("token-b", make_user(4), token_expires_at=10 ** 10, generation=generation)
+    assert len(cache) == 0
+
+def test_invalidations_are_shared_between_workers(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'invalidations.db'}"
+    worker_a = UserCache(10, 60, SQLInvalidationBackend(database_url, retention=3600), poll_interval=0)
+    worker_b = UserCache(10, 60, SQLInvalidationBackend(database_url, retention=3600), poll_interval=0)
+    worker_b.poll()
+    worker_b.set("token", make_user(1), token_expires_at=10 ** 10)
+
+    worker_a.invalidate_user(1)
+    assert worker_b.get("token") is not None
+    worker_b.poll()
+    assert worker_b.get("token") is None
+    worker_a.close()
+    worker_b.close()
+
+async def create_token(async_db: AsyncSession, email: str) -> str:
+    await AsyncUserService(async_db).create_user(UserCreate(email=email, password="testpassword", full_name="Token User"))
+    return AsyncAuthService(async_db).create_access_token({"sub": email}, datetime.timedelta(minutes=5))
+
+@pytest.mark.asyncio
+async def test_cached_authentication_skips_the_database(async_db: AsyncSession):
+    token = await create_token(async_db, "cached_auth@example.com")
+    auth_service = AsyncAuthService(async_db)
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = async_db.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert (await auth_service.get_current_user(token)).email == "cached_auth@example.com"
+        statements_on_miss = len(statements)
+        assert (await auth_service.get_current_user(token)).email == "cached_auth@example.com"
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements_on_miss > 0
+    assert len(statements) == statements_on_miss
+
+@pytest.mark.asyncio
+async def test_update_during_authentication_is_not_cached_over(async_db: AsyncSession):
+    token = await create_token(async_db, "racing@example.com")
+    user_id = (await async_db.execute(select(User.id).filter(User.email == "racing@example.com"))).scalar_one()
+    def update_user(conn, cursor, statement, parameters, context, executemany):
+        # Another request changes the user while this one is still loading it
+        user_cache.invalidate_user(user_id)
+    engine = async_db.get_bind()
+    event.listen(engine, "before_cursor_execute", update_user)
+    try:
+        assert (await AsyncAuthService(async_db).get_current_user(token)).email == "racing@example.com"
+    finally:
+        event.remove(engine, "before_cursor_execute", update_user)
+    assert user_cache.get(token) is None
+
+@pytest.mark.asyncio
+async def test_cached_user_joins_the_request_session(async_db: AsyncSession, async_session_factory):
+    token = await create_token(async_db, "merged@example.com")
+    await AsyncAuthService(async_db).get_current_user(token)
+    async with async_session_factory() as db:
+        user = await AsyncAuthService(db).get_current_user(token)
+        # Persistent in this session, not a transient copy a flush would insert again
+        assert inspect(user).persistent and user in db
+        user.full_name = "Changed In Request"
+        await db.commit()
+    assert (await async_db.execute(select(User.full_name).filter(User.id == user.id))).scalar_one() == "Changed In Request"
+
+def test_cache_is_safe_across_threads():
+    cache = UserCache(max_entries=50, ttl=60)
+
+    def churn(worker: int):
+        for i in range(2000):
+            cache.set(f"token-{worker}-{i}", make_user(i % 20), token_expires_at=10 ** 10)
+            cache.get(f"token-{worker}-{i - 1}")
+            if i % 7 == 0:
+                cache.invalidate_user(i % 20)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(churn, range(8)))
+    assert len(cache) <= 50
+    assert sum(len(keys) for keys in cache._keys_by_user.values()) == len(cache)
+
+@pytest.mark.asyncio
+async def test_user_changes_invalidate_cached_user(async_db: AsyncSession, async_session_factory):
+    async def authenticate(token: str) -> User:
+        # Like a request, with a session of its own
+        async with async_session_factory() as db:
+            return await AsyncAuthService(db).get_current_user(token)
+
+    token = await create_token(async_db, "changing@example.com")
+    user_service = AsyncUserService(async_db)
+    user = await authenticate(token)
+
+    await user_service.update_user(user.id, UserUpdate(full_name="Renamed User"))
+    assert (await authenticate(token)).full_name == "Renamed User"
+
+    await user_service.create_user_profile(user.id, UserProfileCreate(preferences={"completion_cache": False}))
+    assert (await authenticate(token)).profile.preferences == '{"completion_cache": false}'
+
+    await user_service.delete_user(user.id)
+    assert len(user_cache) == 0
+    with pytest.raises(HTTPException):
+        await authenticate(token)